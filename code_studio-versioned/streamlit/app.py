@@ -12,6 +12,7 @@ sys.path.append(str(PROJECT_PATH))
 from utils.constants import APP_TITLE, APP_ICON
 from utils.session_state import init_session_state, ensure_conversation_sync
 from utils.rendering import local_css
+from utils.navigation import CHAT, UPLOAD_DOCS, current_page, open_page_from_url, render_current_page
 
 # Import services
 from services.health_service import start_health_check_thread, stop_health_check_thread
@@ -20,13 +21,11 @@ from services.history_service import ensure_history_file_exists
 # Import components
 from components.sidebar import render_sidebar
 
-# Import pages
-from ui.home_page import render_home_page
-from ui.chat_page import render_chat_page
-from ui.history_page import render_history_page
-from ui.info_page import render_info_page
-from ui.settings_page import render_settings_page
-from ui.update_knowledge_bank import render_ukb_page
+# Stylesheets injected with style.css while a page is shown
+PAGE_STYLESHEETS = {
+    CHAT: ("assets/css/chat_page.css",),
+    UPLOAD_DOCS: ("assets/css/update_knowledge_bank.css",),
+}
 
 def main():
     """
@@ -50,9 +49,12 @@ def main():
     if st.session_state.chat_history:
         ensure_conversation_sync()
     
+    # A ?page= link (e.g. the admin health page) is applied once
+    open_page_from_url()
+
     # Load custom CSS
     try:
-        local_css("style.css")
+        local_css("style.css", *PAGE_STYLESHEETS.get(current_page(), ()))
     except:
         pass  # Continue if CSS file doesn't exist
     
@@ -67,22 +69,7 @@ def main():
         render_sidebar()
         
         # === Only render the current page ===
-        current_page = st.session_state.get("current_page", "home")
-        
-        if current_page == "home":
-            render_home_page()
-        elif current_page == "chat":
-            render_chat_page()
-        elif current_page == "ukb":
-            render_ukb_page()
-        elif current_page == "conversation_history":
-            render_history_page()
-        elif current_page == "information":
-            render_info_page()
-        else:
-            # If unknown page, default to home
-            st.session_state.current_page = "home"
-            st.rerun()
+        render_current_page()
         
         # Footer for all pages
         st.markdown(
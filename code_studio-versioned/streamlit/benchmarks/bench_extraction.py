@@ -0,0 +1,173 @@
+#bench_extraction.py
+"""
+Benchmark: text extraction per file type, unstructured for every file vs
+the "auto" engine (sniffed fast parsers, unstructured only as a fallback).
+
+Run from the streamlit app directory:
+
+    python benchmarks/bench_extraction.py [FILE ...] [--pages 20] [--repeat 5]
+
+Without files, a generated text file, PDF and (with python-docx) DOCX are
+used. "cold" runs one extraction in a fresh interpreter, so it includes the
+parser imports (and any model loading); "warm" is the median of --repeat
+extractions in this process.
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.document_parsers import ENGINE_AUTO, ENGINE_UNSTRUCTURED, extract_text, get_file_extension
+
+WORDS = ("patient touchpoint program enrollment adherence therapy dosage "
+         "physician pharmacy coverage prior authorization benefit verification "
+         "copay assistance specialty infusion onboarding nurse educator").split()
+
+COLD_SCRIPT = """
+import sys, time
+sys.path.insert(0, {app_dir!r})
+started = time.perf_counter()
+from utils.document_parsers import extract_text
+with open({path!r}, "rb") as f:
+    extract_text({name!r}, f.read(), {engine!r})
+print(time.perf_counter() - started)
+"""
+
+
+def make_lines(pages, lines_per_page=40, seed=0):
+    rng = random.Random(seed)
+    return [[" ".join(rng.choice(WORDS) for _ in range(10)) for _ in range(lines_per_page)]
+            for _ in range(pages)]
+
+
+def make_txt(pages):
+    return "\n\n".join("\n".join(lines) for lines in make_lines(pages)).encode("utf-8")
+
+
+def make_pdf(pages):
+    """A minimal PDF with a text layer (one Helvetica text block per page)"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in make_lines(pages):
+        body = "BT /F1 10 Tf 50 780 Td 12 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        stream = body.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % len(kids)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + obj + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def make_docx(pages):
+    from docx import Document
+
+    doc = Document()
+    for number, lines in enumerate(make_lines(pages), start=1):
+        doc.add_heading(f"Section {number}", level=1)
+        for line in lines:
+            doc.add_paragraph(line)
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def sample_files(pages, directory):
+    makers = (("sample.txt", make_txt), ("sample.pdf", make_pdf), ("sample.docx", make_docx))
+    paths = []
+    for name, make in makers:
+        try:
+            data = make(pages)
+        except ImportError as e:
+            print(f"skipping {name}: {str(e)}")
+            continue
+        path = os.path.join(directory, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+    return paths
+
+
+def cold(path, engine):
+    script = COLD_SCRIPT.format(app_dir=sys.path[0], path=path, name=os.path.basename(path), engine=engine)
+    done = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+    if done.returncode != 0:
+        raise RuntimeError(done.stderr.strip().splitlines()[-1] if done.stderr.strip() else "failed")
+    return float(done.stdout.strip().splitlines()[-1])
+
+
+def warm(path, engine, repeat):
+    with open(path, "rb") as f:
+        data = f.read()
+    name = os.path.basename(path)
+    extract_text(name, data, engine)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        extract_text(name, data, engine)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def measure(path, engine, repeat):
+    try:
+        return cold(path, engine), warm(path, engine, repeat)
+    except Exception as e:
+        print(f"{os.path.basename(path)} with {engine}: {str(e)}")
+        return None, None
+
+
+def ms(seconds):
+    return f"{seconds * 1000:10.1f}" if seconds is not None else f"{'n/a':>10}"
+
+
+def speedup(slow, fast):
+    return f"{slow / fast:7.1f}x" if slow and fast else f"{'n/a':>8}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="*", help="Files to extract (default: generated samples)")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = args.files or sample_files(args.pages, directory)
+        rows = []
+        for path in paths:
+            slow_cold, slow_warm = measure(path, ENGINE_UNSTRUCTURED, args.repeat)
+            fast_cold, fast_warm = measure(path, ENGINE_AUTO, args.repeat)
+            rows.append((get_file_extension(path), os.path.getsize(path),
+                         slow_cold, fast_cold, slow_warm, fast_warm))
+
+    print(f"\nmilliseconds, repeat={args.repeat}")
+    print(f"{'type':>6} {'bytes':>10} {'unstr cold':>10} {'auto cold':>10} {'speedup':>8}"
+          f" {'unstr warm':>10} {'auto warm':>10} {'speedup':>8}")
+    for file_type, size, slow_cold, fast_cold, slow_warm, fast_warm in rows:
+        print(f"{file_type:>6} {size:>10,} {ms(slow_cold)} {ms(fast_cold)} {speedup(slow_cold, fast_cold)}"
+              f" {ms(slow_warm)} {ms(fast_warm)} {speedup(slow_warm, fast_warm)}")
+
+
+if __name__ == "__main__":
+    main()
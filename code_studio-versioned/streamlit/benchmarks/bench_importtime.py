@@ -0,0 +1,88 @@
+#bench_importtime.py
+"""
+Benchmark: import time of the app's startup path, from -X importtime.
+
+Run from the streamlit app directory:
+
+    python benchmarks/bench_importtime.py [--top 15] [--repeat 3]
+
+Each scenario imports a set of modules in a fresh interpreter with
+"python -X importtime" and reports the total import time (median of
+--repeat runs), the slowest imports, and which of the heavy dependencies
+were loaded. "first paint" is what the first script run of a session
+imports (app.py and the home page); the heavy parsers and the extraction
+worker pool should only appear in the scenarios that use them.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = (
+    ("first paint", ["app", "ui.home_page"]),
+    ("chat page", ["app", "ui.home_page", "ui.chat_page"]),
+    ("upload docs page", ["app", "ui.home_page", "ui.update_knowledge_bank"]),
+    ("document extraction", ["app", "ui.chat_page", "services.extraction_service"]),
+)
+
+# Dependencies that should load on first use of a feature, not at startup
+HEAVY_MODULES = ("tiktoken", "unstructured", "PyPDF2", "pdfplumber", "docx",
+                 "multiprocessing", "concurrent.futures.process")
+
+
+def import_profile(modules):
+    """
+    Import modules in a fresh interpreter with -X importtime
+
+    Returns:
+        {module: (self microseconds, cumulative microseconds)}
+    """
+    done = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+        cwd=APP_DIR, capture_output=True, text=True,
+    )
+    if done.returncode != 0:
+        raise RuntimeError(done.stderr.strip().splitlines()[-1] if done.stderr.strip() else "failed")
+
+    profile = {}
+    for line in done.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        profile[name.strip()] = (int(self_us), int(cumulative_us))
+    return profile
+
+
+def report(title, modules, top, repeat):
+    totals, profile = [], {}
+    for _ in range(repeat):
+        profile = import_profile(modules)
+        totals.append(sum(self_us for self_us, _ in profile.values()))
+
+    print(f"\n{title}: import {', '.join(modules)}")
+    print(f"  total {statistics.median(totals) / 1000:.1f} ms (median of {repeat}), {len(profile)} modules")
+    loaded = [name for name in HEAVY_MODULES if name in profile]
+    print(f"  heavy modules loaded: {', '.join(loaded) or 'none'}")
+    slowest = sorted(profile.items(), key=lambda item: -item[1][1])[:top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"  {cumulative_us / 1000:9.1f} ms cumulative {self_us / 1000:8.1f} ms self  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for title, modules in SCENARIOS:
+        try:
+            report(title, modules, args.top, args.repeat)
+        except RuntimeError as e:
+            print(f"\n{title}: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
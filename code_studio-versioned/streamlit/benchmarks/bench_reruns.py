@@ -0,0 +1,89 @@
+#bench_reruns.py
+"""
+Benchmark: script executions per user action on the chat page.
+
+Run from the streamlit app directory:
+
+    python benchmarks/bench_reruns.py [--messages 100]
+
+Drives app.py headless with streamlit.testing.v1.AppTest and counts, for
+each action, how many times the whole script ran (calls to render_sidebar)
+and how many times the transcript was rendered (calls to
+get_formatted_messages from the chat page). The backend and the health
+check thread are replaced by stubs, and the conversation is pre-filled
+with --messages messages.
+"""
+import argparse
+import importlib
+import os
+import sys
+from collections import Counter
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from streamlit.testing.v1 import AppTest
+
+counts = Counter()
+
+
+def count_calls(module_name, attr, counter):
+    module = importlib.import_module(module_name)
+    original = getattr(module, attr)
+
+    def wrapper(*args, **kwargs):
+        counts[counter] += 1
+        return original(*args, **kwargs)
+
+    setattr(module, attr, wrapper)
+
+
+def stub(module_name, attr, replacement):
+    setattr(importlib.import_module(module_name), attr, replacement)
+
+
+def install_probes():
+    stub("services.health_service", "start_health_check_thread", lambda: None)
+    stub("ui.chat_page", "handle_message", lambda text: f"Echo: {text}")
+    stub("ui.chat_page", "stream_response", lambda text, placeholder: placeholder.markdown(text))
+    count_calls("components.sidebar", "render_sidebar", "script runs")
+    count_calls("ui.chat_page", "get_formatted_messages", "transcript renders")
+
+
+def toggle(at, label):
+    return next(widget for widget in at.toggle if widget.label.startswith(label))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100)
+    args = parser.parse_args()
+
+    os.chdir(APP_DIR)
+    install_probes()
+    at = AppTest.from_file("app.py", default_timeout=60)
+
+    actions = (
+        ("open the app", lambda: at.run()),
+        ("go to chat", lambda: at.sidebar.button(key="nav_chat").click().run()),
+        ("send a message", lambda: at.text_input(key="user_input_text").input("hello").run()),
+        ("toggle document mode", lambda: toggle(at, "📄 Document Query Mode").set_value(True).run()),
+        ("click the 📎 pin", lambda: at.button(key="pin_button").click().run()),
+        ("go to home", lambda: at.sidebar.button(key="nav_home").click().run()),
+    )
+
+    print(f"{'action':<24} {'script runs':>12} {'transcript renders':>19}")
+    for title, action in actions:
+        before = counts.copy()
+        action()
+        if title == "open the app":
+            at.session_state.chat_history = [
+                {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"}
+                for i in range(args.messages)
+            ]
+        delta = counts - before
+        print(f"{title:<24} {delta['script runs']:>12} {delta['transcript renders']:>19}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#bench_tokens.py
+"""
+Microbenchmark: token accounting of process_document, before and after
+utils.tokens.
+
+Run from the streamlit app directory:
+
+    python benchmarks/bench_tokens.py [--pages 100] [--repeat 5]
+
+"legacy" reproduces the old code path (get_encoding twice, five encodes);
+"fit_to_token_budget" is the single-encode replacement.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tiktoken
+from utils.tokens import fit_to_token_budget, get_encoder
+
+WORDS = ("patient touchpoint program enrollment adherence therapy dosage "
+         "physician pharmacy coverage prior authorization benefit verification "
+         "copay assistance specialty infusion onboarding nurse educator").split()
+
+
+def make_document(pages, words_per_page=500, seed=0):
+    rng = random.Random(seed)
+    return "\n\n".join(
+        " ".join(rng.choice(WORDS) for _ in range(words_per_page)) for _ in range(pages)
+    )
+
+
+def legacy(text, max_tokens=5000, encoding_name="cl100k_base"):
+    tokenizer = tiktoken.get_encoding(encoding_name)
+    tokens = tokenizer.encode(text)
+    truncated_text = text if len(tokens) <= max_tokens else tokenizer.decode(tokens[:max_tokens])
+    tokenizer = tiktoken.get_encoding(encoding_name)
+    original = len(tokenizer.encode(text))
+    truncated = len(tokenizer.encode(truncated_text))
+    # process_document encoded both texts a second time for its return value
+    original = len(tokenizer.encode(text))
+    truncated = len(tokenizer.encode(truncated_text))
+    return truncated_text, original, truncated
+
+
+def single_encode(text, max_tokens=5000):
+    budget = fit_to_token_budget(text, max_tokens)
+    return budget.text, budget.original_token_count, budget.truncated_token_count
+
+
+def bench(fn, text, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(text)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = make_document(args.pages)
+    get_encoder()  # load the BPE ranks outside the timed region
+    print(f"{args.pages} pages, {len(text):,} characters, repeat={args.repeat}")
+
+    results = {}
+    for name, fn in (("legacy", legacy), ("fit_to_token_budget", single_encode)):
+        median, best = bench(fn, text, args.repeat)
+        results[name] = median
+        print(f"{name:>20}: median {median * 1000:8.1f} ms   best {best * 1000:8.1f} ms")
+
+    print(f"{'speedup':>20}: {results['legacy'] / results['fit_to_token_budget']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 #chat_message.py
 import streamlit as st
-from utils.rendering import render_svg
+from utils.rendering import message_content_html, render_svg
 import os
 import logging
 from datetime import datetime
@@ -49,7 +49,7 @@ def render_chat_messages(messages, logo_path="assets/avatarlogo.svg"):
                         st.markdown(
                             f'''
                             <div class="message user-message">
-                                <div class="message-content">{message["content"]}</div>
+                                <div class="message-content">{message_content_html(message["content"])}</div>
                                 <div class="avatar user-avatar">JD</div>
                             </div>
                             ''',
@@ -74,14 +74,14 @@ def render_chat_messages(messages, logo_path="assets/avatarlogo.svg"):
                     f'''
                     <div class="message bot-message">
                         <div class="avatar bot-avatar">{img_content}</div>
-                        <div class="message-content">{message["content"]}</div>
+                        <div class="message-content">{message_content_html(message["content"])}</div>
                     </div>
                     ''',
                     unsafe_allow_html=True
                 )
                 if message.get("context"):
-                    with st.expander("View retrieved context"):
-                        st.markdown(message["context"])
+                    if st.toggle("View retrieved context", key=f"ctx_msg_{idx}"):
+                        st.markdown(str(message["context"]))
     
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -1,50 +1,113 @@
 import streamlit as st
 import os
-from utils.rendering import render_svg
+from utils.navigation import CHAT, HISTORY, HOME, INFORMATION, UPLOAD_DOCS, go_to
+from utils.rendering import fragment, read_asset
 import logging
-from services.health_service import get_health_status
+from utils.settings import get_settings
+from services.health_service import get_health_state
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Ingestion jobs listed in the sidebar
+MAX_SIDEBAR_JOBS = 3
+
+def _sync_ingested_documents(jobs):
+    """
+    Attach documents extracted by background jobs to the session, and ask
+    the question queued on the Upload Docs page once its job is extracted
+
+    Returns:
+        True if the page needs to be rendered again
+    """
+    from utils.text_extractor import add_active_document
+    from services.ingestion_service import JOB_FAILED, get_ingestion_manager, take_job_documents
+
+    changed = False
+    for job in jobs:
+        for index in take_job_documents(job.job_id):
+            add_active_document(index)
+            changed = True
+
+    pending = st.session_state.get("pending_doc_question")
+    if pending:
+        manager = get_ingestion_manager()
+        job = manager.get(pending["job_id"])
+        if job is None or manager.all_extracted(job.job_id):
+            del st.session_state.pending_doc_question
+            if job is not None:
+                st.session_state.pending_user_input = pending["text"]
+                go_to(CHAT)
+            changed = True
+        elif job.state == JOB_FAILED:
+            # Nothing to ask about; the error is shown with the job
+            del st.session_state.pending_doc_question
+    return changed
+
+def _render_ingestion_jobs(polling=False):
+    """Progress of this session's knowledge bank uploads, with retry for failed ones"""
+    from services.ingestion_service import JOB_FAILED, JOB_INDEXED, get_session_jobs, retry_ingestion
+
+    jobs = get_session_jobs(st.session_state.session_id)
+    if not jobs:
+        return
+    if _sync_ingested_documents(jobs) and polling:
+        st.rerun()
+
+    st.markdown("**📥 Document uploads**")
+    for job in jobs[:MAX_SIDEBAR_JOBS]:
+        names = ", ".join(job.file_names[:2]) + (f" +{len(job.files) - 2} more" if len(job.files) > 2 else "")
+        if job.state == JOB_FAILED:
+            st.caption(f"❌ {names}: {job.error}")
+            if st.button("🔁 Retry", key=f"retry_job_{job.job_id}"):
+                retry_ingestion(job.job_id)
+                st.rerun()
+        elif job.state == JOB_INDEXED:
+            st.caption(f"✅ {names}: indexed")
+        else:
+            st.progress(min(job.progress, 1.0), text=f"{names}: {job.message or job.state}")
+
+    # Stop polling once every job has finished
+    if polling and not any(job.active for job in jobs):
+        st.rerun()
+
 def render_sidebar():
     """
     Render the application sidebar with navigation and status
     """
     with st.sidebar:
         # Logo
-        st.sidebar.image("assets/abbvielogo.png")
+        st.sidebar.image(read_asset("assets/abbvielogo.png", binary=True))
         
         # Title and subtitle
         st.markdown('<div class="sidebar-title">PATOKA Chatbot</div>', unsafe_allow_html=True)
         st.markdown('<div class="sidebar-subtitle">Patient Touchpoint Knowledge Agent</div>', unsafe_allow_html=True)
         
-        # Navigation buttons
-        if st.button("🏠 Home", key="nav_home"):
-            st.session_state.current_page = "home"
-            st.rerun()
-        
-        if st.button("💬 Chat", key="nav_chat"):
-            st.session_state.current_page = "chat"
-            st.rerun()
-
-        if st.button("📡 Upload Docs", key="ukb"):
-            st.session_state.current_page = "ukb"
-            st.rerun()
-        
-        if st.button("📊 Conversation History", key="nav_history"):
-            st.session_state.current_page = "conversation_history"
-            st.rerun()
+        # Navigation buttons: the transition runs as a callback, before the
+        # run the click triggers, so that run renders the new page directly
+        st.button("🏠 Home", key="nav_home", on_click=go_to, args=(HOME,))
+        st.button("💬 Chat", key="nav_chat", on_click=go_to, args=(CHAT,))
+        st.button("📡 Upload Docs", key="ukb", on_click=go_to, args=(UPLOAD_DOCS,))
+        st.button("📊 Conversation History", key="nav_history", on_click=go_to, args=(HISTORY,))
+        st.button("ℹ️ Information", key="nav_info", on_click=go_to, args=(INFORMATION,))
         
-        if st.button("ℹ️ Information", key="nav_info"):
-            st.session_state.current_page = "information"
-            st.rerun()
+        # Background knowledge bank uploads, refreshed while any is running.
+        # The ingestion service (job records, worker threads) is only loaded
+        # once this session has submitted a job
+        if st.session_state.get("ingestion_submitted"):
+            from services.ingestion_service import get_session_jobs
+            polling = any(job.active for job in get_session_jobs(st.session_state.session_id))
+            run_every = get_settings().ingestion_poll_interval if polling else None
+            fragment(run_every)(_render_ingestion_jobs)(polling)
         
         # Health status indicator
-        health_status = get_health_status()
-        status_class = "healthy" if health_status else "unhealthy"
-        status_text = "System Online" if health_status else "System Offline"
+        health_state = get_health_state()
+        status_class, status_text = {
+            "healthy": ("healthy", "System Online"),
+            "degraded": ("degraded", "System Slow"),
+            "down": ("unhealthy", "System Offline"),
+        }.get(health_state, ("unknown", "Checking System..."))
         
         st.markdown(
             f'<div class="health-indicator"><div class="health-status {status_class}"></div>{status_text}</div>',
@@ -1,14 +1,26 @@
 #api_service.py
 import requests
 import json
-import streamlit as st
-from typing import Dict, Any, Optional, List
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Optional, List, Iterator, Tuple
 import logging
+from utils.settings import get_settings
+from services.replica_pool import get_replica_pool
+from services.response_model import BackendResponse, parse_backend_response
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Per-thread cache of Dataiku backend clients (and their pooled sessions)
+_thread_local = threading.local()
+
+# Extra attempts per batch item after a connection error or a 5xx/429
+# response, within the item's deadline (see iter_chat_responses)
+BATCH_ITEM_RETRIES = 2
+
 def make_api_request(endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
     """
     Make a generic API request to the specified endpoint with the given payload
@@ -50,136 +62,312 @@ def make_api_request(endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
         return {"error": "An unexpected error occurred", "success": False}
 
 
-def generate_chat_response(user_query: str) -> Dict[str, Any]:
+class _HttpBackend:
+    """Minimal stand-in for the Dataiku backend client that calls a backend URL directly"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.session.headers['Content-Type'] = 'application/json'
+
+
+def _get_backend_client(replica_id: str):
+    """
+    Get a backend client for a webapp replica, cached per thread.
+
+    The client wraps a requests.Session, so caching it keeps the underlying
+    connection pool alive across calls instead of reconnecting every time.
+
+    Args:
+        replica_id: Dataiku webapp ID, or a full backend URL
+
+    Returns:
+        Backend client exposing 'session' and 'base_url'
+    """
+    settings = get_settings()
+    clients = getattr(_thread_local, "backend_clients", None)
+    if clients is None:
+        clients = _thread_local.backend_clients = {}
+
+    # Key on the connection settings too, so a settings reload picks up
+    # new credentials, project or transport without restarting the app
+    use_http = settings.backend_transport == "http" or replica_id.startswith(("http://", "https://"))
+    cache_key = (use_http, settings.backend_host, settings.dss_location, settings.dss_api_key,
+                 settings.project_key, replica_id)
+    if cache_key not in clients:
+        if use_http:
+            clients[cache_key] = _HttpBackend(settings.webapp_backend_url(replica_id))
+        else:
+            import dataiku
+
+            # Without an API key, rely on the ambient DSS credentials of the Code Studio
+            if settings.dss_api_key:
+                dataiku.set_remote_dss(settings.dss_location, settings.dss_api_key, no_check_certificate=True)
+
+            client = dataiku.api_client()
+            project = client.get_project(settings.project_key)
+            webapp = project.get_webapp(replica_id)
+            backend = webapp.get_backend_client()
+            backend.session.headers['Content-Type'] = 'application/json'
+            clients[cache_key] = backend
+
+    return clients[cache_key]
+
+
+def post_to_backend(kind: str, path: str, payload: Dict[str, Any], timeout: Optional[float]):
+    """
+    POST to a backend replica chosen by the replica pool and record the
+    outcome with the pool and the health monitor
+
+    Args:
+        kind: Replica pool to use ("query" or "docs")
+        path: Path on the backend, e.g. '/query'
+        payload: JSON payload to send
+        timeout: Timeout in seconds
+
+    Returns:
+        requests.Response from the selected replica
+    """
+    response, _ = request_backend(kind, "POST", path, timeout, json=payload)
+    return response
+
+
+def request_backend(kind: str, method: str, path: str, timeout: Optional[float],
+                    replica_id: Optional[str] = None, **kwargs):
+    """
+    Send any request to a backend replica and record the outcome
+
+    Args:
+        kind: Replica pool to use ("query" or "docs")
+        method: HTTP method
+        path: Path on the backend
+        timeout: Timeout in seconds
+        replica_id: Optional replica to pin the request to
+        **kwargs: Passed to requests (json, data, headers, ...)
+
+    Returns:
+        Tuple of (requests.Response, ID of the replica that served it)
+    """
+    pool = get_replica_pool(kind)
+    replica = pool.acquire(replica_id)
+    started = time.perf_counter()
+    success, reason = False, None
+    try:
+        backend = _get_backend_client(replica.replica_id)
+        response = backend.session.request(method, backend.base_url + path, timeout=timeout, **kwargs)
+        # Client errors say nothing about the replica's health
+        success = response.status_code < 500
+        if not success:
+            reason = f"HTTP {response.status_code}"
+        return response, replica.replica_id
+    except Exception as e:
+        reason = str(e)
+        raise
+    finally:
+        latency = time.perf_counter() - started
+        pool.release(replica, success, latency, reason)
+
+        # Real chat traffic doubles as a passive health signal for the
+        # query backend, which is what the health monitor tracks
+        if kind == "query":
+            from services.health_service import record_call_outcome
+            record_call_outcome(replica.replica_id, success, latency, reason)
+
+
+def generate_chat_response(user_query: str, timeout: Optional[float] = None) -> BackendResponse:
     """
     Generate a response by calling the Dataiku Webapp backend API.   
     Args:
         user_query: The user's input query.
+        timeout: Optional timeout in seconds (defaults to the request_timeout setting).
     Returns:
-        Dict with 'success', 'message', and optional 'context'.
+        BackendResponse with 'success', 'message' and lazily decoded 'context'.
     """
-    import dataiku
+    if timeout is None:
+        timeout = get_settings().request_timeout
 
-    DSS_LOCATION = "https://cdl-dku-desi-p.commercial-datalake-prod.awscloud.abbvienet.com"
-    API_KEY = "dkuaps-9ALuuZLhFJg9dTcrSgPMcsdtfP8bpPXC"
-    PROJECT_KEY = "GENAIPOC"
-    WEBAPP_ID = "LmdRX0E"
-    
-    dataiku.set_remote_dss(DSS_LOCATION, API_KEY, no_check_certificate=True)
-    
     try:
-        client = dataiku.api_client()
-        project = client.get_project(PROJECT_KEY)
-        webapp = project.get_webapp(WEBAPP_ID)
-        backend = webapp.get_backend_client()
-        backend.session.headers['Content-Type'] = 'application/json'
-
-        response = backend.session.post(
-            backend.base_url + '/query',
-            json={'message': user_query}
-        )
+        response = post_to_backend("query", '/query', {'message': user_query}, timeout)
+        return parse_backend_response(response.content, response.status_code)
 
-        if response.status_code == 200:
-            try:
-                response_data = response.json()
-                answer = response_data.get("message", "")
-                context = response_data.get("context", "")
-                return {
-                    "success": response_data.get("success", True),
-                    "message": answer,
-                    "context": context
-                }
-            except json.JSONDecodeError:
-                return {
-                    "success": True,
-                    "message": response.text
-                }
-        else:
-            return {
-                "success": False,
-                "message": f"Error: {response.status_code} - {response.text}"
-            }
+    except requests.exceptions.Timeout:
+        logger.error(f"Dataiku webapp did not answer within {timeout}s")
+        return BackendResponse.error(f"Error: request timed out after {timeout}s")
 
     except Exception as e:
         logger.error(f"Failed to get response from Dataiku webapp: {str(e)}")
-        return {
-            "success": False,
-            "message": f"Internal error: {str(e)}"
+        return BackendResponse.error(f"Internal error: {str(e)}")
+
+
+def iter_chat_responses(queries: List[str], concurrency: int = 4,
+                        timeout: Optional[float] = None) -> Iterator[Tuple[int, BackendResponse]]:
+    """
+    Send many queries to the backend concurrently and yield results as they arrive.
+
+    Each worker thread reuses its own pooled backend session, so requests are
+    pipelined over kept-alive connections rather than reconnecting per query.
+
+    Each item has a deadline of timeout seconds from when it is sent, shared
+    by all its attempts: transient failures are retried up to
+    BATCH_ITEM_RETRIES times while time is left, and an item that has no
+    answer by its deadline fails with a timeout.
+
+    Args:
+        queries: List of user queries
+        concurrency: Maximum number of requests in flight
+        timeout: Optional per-item deadline in seconds (defaults to the request_timeout setting)
+
+    Yields:
+        Tuples of (index into queries, BackendResponse), in completion order
+    """
+    if not queries:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(queries)))) as executor:
+        futures = {
+            executor.submit(_timed_chat_response, query, timeout): index
+            for index, query in enumerate(queries)
         }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
 
+def _is_transient(result: BackendResponse) -> bool:
+    """Whether a failed call is worth another attempt (no response, 5xx or 429)"""
+    return result.status_code is None or result.status_code >= 500 or result.status_code == 429
 
 
-def process_document_query(file_list: list) -> Dict[str, Any]:
+def _timed_chat_response(user_query: str, timeout: Optional[float]) -> BackendResponse:
     """
-    Sends uploaded files to the /query_on_docs endpoint on Dataiku webapp.
+    Call generate_chat_response within a deadline of timeout seconds for all
+    attempts, and attach the elapsed time in seconds
+    """
+    if timeout is None:
+        timeout = get_settings().request_timeout
+    started = time.perf_counter()
+    deadline = started + timeout
+
+    for attempt in range(BATCH_ITEM_RETRIES + 1):
+        # Every attempt only gets the time left, so retries cannot extend the deadline
+        result = generate_chat_response(user_query, timeout=deadline - time.perf_counter())
+        if result.success or not _is_transient(result):
+            break
+        backoff = 0.5 * (attempt + 1)
+        if attempt == BATCH_ITEM_RETRIES or time.perf_counter() + backoff >= deadline:
+            break
+        logger.warning(f"Batch query failed (attempt {attempt + 1}), retrying: {result.message}")
+        time.sleep(backoff)
+
+    result.latency = time.perf_counter() - started
+    if result.latency > timeout:
+        # requests' timeout bounds each connect and read, not the whole call
+        result = BackendResponse.error(f"Error: no answer within {timeout:g}s")
+        result.latency = time.perf_counter() - started
+    return result
+
+
+def generate_chat_responses(queries: List[str], concurrency: int = 4,
+                            timeout: Optional[float] = None) -> List[BackendResponse]:
+    """
+    Generate responses for a batch of queries, preserving input order.
 
     Args:
-        file_list (list): List of files, where each file is a dict with 'filename' and 'content' (base64 encoded).
+        queries: List of user queries
+        concurrency: Maximum number of requests in flight
+        timeout: Optional per-item deadline in seconds, across retries
 
     Returns:
-        Dict with 'success', 'message', and optional 'result'.
+        List of BackendResponse objects, one per query and in the same order
     """
-    import dataiku
-    import json
-    import logging
+    results: List[Optional[BackendResponse]] = [None] * len(queries)
+    for index, result in iter_chat_responses(queries, concurrency, timeout):
+        results[index] = result
+    return results
 
-    logger = logging.getLogger(__name__)
 
-    DSS_LOCATION = "https://cdl-dku-desi-p.commercial-datalake-prod.awscloud.abbvienet.com"
-    API_KEY = "dkuaps-9ALuuZLhFJg9dTcrSgPMcsdtfP8bpPXC"
-    PROJECT_KEY = "GENAIPOC"
-    WEBAPP_ID = "gq110S2"
+def apply_chat_responses_to_dataframe(df, query_column: str = "user_input",
+                                      response_column: str = "response",
+                                      concurrency: int = 4,
+                                      timeout: Optional[float] = None):
+    """
+    Fill a DataFrame with chatbot responses for each row's query.
 
-    try:
-        # Setup DSS connection
-        dataiku.set_remote_dss(DSS_LOCATION, API_KEY, no_check_certificate=True)
+    Rows are written as soon as their response arrives, so a partially
+    completed batch is still usable. Follows the same column conventions as
+    RAGResponseGenerator.apply_responses_to_dataframe in the evaluation
+    pipeline; the "evaluate retrieval pipeline" notebook uses it through
+    ChatbotResponseGenerator to score the chatbot end to end.
+
+    Args:
+        df: pandas DataFrame holding the queries
+        query_column: Column containing the queries
+        response_column: Column to write the answers into
+        concurrency: Maximum number of requests in flight
+        timeout: Optional per-item deadline in seconds, across retries
+
+    Returns:
+        The same DataFrame with response, retrieved_contexts, success and
+        latency columns filled in
+    """
+    if query_column not in df.columns:
+        logger.warning(f"'{query_column}' column not found. Using 'chunk_text' as fallback for responses.")
+        df[query_column] = df.get("chunk_text", "")
 
-        # Connect to webapp
-        client = dataiku.api_client()
-        project = client.get_project(PROJECT_KEY)
-        webapp = project.get_webapp(WEBAPP_ID)
-        backend = webapp.get_backend_client()
-        backend.session.headers['Content-Type'] = 'application/json'
+    df[response_column] = None
+    df["retrieved_contexts"] = None
+    df["success"] = False
+    df["latency"] = None
 
+    queries = [str(q) for q in df[query_column].tolist()]
+    for position, result in iter_chat_responses(queries, concurrency, timeout):
+        label = df.index[position]
+        df.at[label, response_column] = result.message
+        df.at[label, "retrieved_contexts"] = [str(result.context)] if result.context else []
+        df.at[label, "success"] = result.success
+        df.at[label, "latency"] = result.latency
+
+    return df
+
+
+def process_document_query(file_list: list) -> BackendResponse:
+    """
+    Sends uploaded files to the /query_on_docs endpoint on Dataiku webapp.
+
+    Args:
+        file_list (list): List of files, where each file is a dict with 'filename' and 'content' (base64 encoded).
+
+    Returns:
+        BackendResponse with 'success', 'combined_text', 'result' and 'file_count'.
+    """
+    try:
         # Prepare and send payload to /query_on_docs
         payload = {"files": file_list}
-        response = backend.session.post(backend.base_url + '/query_on_docs', json=payload)
-
-        if response.status_code == 200:
-            response_data = response.json()
-            return {
-                "success": True,
-                "combined_text": response_data.get("combined_text", ""),
-                "result": response_data.get("result", {}),
-                "file_count": response_data.get("file_count", 0)
-            }
-        else:
-            return {
-                "success": False,
-                "message": f"Error: {response.status_code} - {response.text}"
-            }
+        response = post_to_backend("docs", '/query_on_docs', payload, get_settings().request_timeout)
+        return parse_backend_response(response.content, response.status_code)
 
     except Exception as e:
         logger.error(f"Failed to call /query_on_docs: {str(e)}")
-        return {
-            "success": False,
-            "message": f"Internal error: {str(e)}"
-        }
+        return BackendResponse.error(f"Internal error: {str(e)}")
 
 
-def check_health() -> bool:
+def probe_replica(replica_id: str) -> Tuple[bool, float, Optional[str]]:
     """
-    Check the health status of the API
-    
+    Probe the /health endpoint of a single backend replica
+
+    Args:
+        replica_id: Dataiku webapp ID, or a full backend URL
+
     Returns:
-        Boolean indicating if the API is healthy/available
+        Tuple of (healthy, latency in seconds, failure reason or None)
     """
-    from utils.constants import HEALTH_ENDPOINT
-    
+    settings = get_settings()
+    url = f"{settings.webapp_backend_url(replica_id)}/health"
+    started = time.perf_counter()
     try:
-        response = requests.get(HEALTH_ENDPOINT, timeout=3)
-        return response.status_code == 200
-    
+        response = requests.get(url, timeout=settings.health_check_timeout)
+        latency = time.perf_counter() - started
+        if response.status_code == 200:
+            return True, latency, None
+        return False, latency, f"HTTP {response.status_code}"
     except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        return False
\ No newline at end of file
+        return False, time.perf_counter() - started, str(e)
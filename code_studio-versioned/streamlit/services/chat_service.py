@@ -6,6 +6,8 @@ from datetime import datetime
 from typing import List, Dict, Any, Optional
 from utils.text_extractor import handle_query
 from services.history_service import save_message, save_conversation_metadata
+from services.rate_limiter import get_rate_limiter, RateLimitExceeded
+from utils.settings import get_settings
 
 def init_chat_session():
     """Initialize the chat session if not already initialized"""
@@ -21,6 +23,48 @@ def init_chat_session():
     if "conversations" not in st.session_state:
         st.session_state.conversations = {}
 
+def _current_session_id() -> str:
+    """ID of the current Streamlit session"""
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = str(uuid.uuid4())
+    return st.session_state.session_id
+
+# Email Streamlit reports for every visitor when the app has no sign-in
+_PLACEHOLDER_EMAIL = "test@example.com"
+
+def _authenticated_user_id() -> Optional[str]:
+    """
+    ID of the signed-in user: the user_id_header request header when set,
+    else the email of Streamlit's signed-in user
+
+    Returns:
+        User ID, or None if the app does not know who the user is
+    """
+    header = get_settings().user_id_header
+    if header:
+        headers = getattr(getattr(st, "context", None), "headers", None) or {}
+        value = headers.get(header)
+        if value:
+            return f"header:{value}"
+
+    user = getattr(st, "user", None) or getattr(st, "experimental_user", None)
+    try:
+        email = user.get("email") if user is not None else None
+    except Exception:
+        email = None
+    if email and email != _PLACEHOLDER_EMAIL:
+        return f"email:{email}"
+    return None
+
+def _current_user_id() -> str:
+    """
+    ID keying the per-user quota. Falls back to the session when the user
+    is unknown; never the user_info placeholder, which every session shares.
+    """
+    if "quota_user_id" not in st.session_state:
+        st.session_state.quota_user_id = _authenticated_user_id() or _current_session_id()
+    return st.session_state.quota_user_id
+
 def generate_conversation_title(user_message: str) -> str:
     """
     Generate a conversation title based on the first user message
@@ -44,7 +88,8 @@ def generate_conversation_title(user_message: str) -> str:
 def stream_response(response_text: str, placeholder):
     """
     Stream response with proper formatting preserved during streaming
-    Uses smart token-aware streaming for better markdown handling
+    Uses smart token-aware streaming for better markdown handling.
+    Rendered as markdown only: raw HTML in the text is not interpreted.
     
     Args:
         response_text: Complete response text
@@ -67,7 +112,7 @@ def stream_response(response_text: str, placeholder):
         displayed_text += token
         
         # Apply markdown formatting during streaming
-        placeholder.markdown(displayed_text, unsafe_allow_html=True)
+        placeholder.markdown(displayed_text)
         
         # Vary the delay based on token type for better UX
         if token.startswith('#'):  # Headers
@@ -84,7 +129,7 @@ def stream_response(response_text: str, placeholder):
             time.sleep(0.03)
     
     # Final update to ensure complete formatting
-    placeholder.markdown(displayed_text, unsafe_allow_html=True)
+    placeholder.markdown(displayed_text)
     return displayed_text.strip()
 
 def handle_message(user_message: str, custom_response: Optional[str] = None, is_edit: bool = False, edit_index: Optional[int] = None):
@@ -96,9 +141,30 @@ def handle_message(user_message: str, custom_response: Optional[str] = None, is_
         custom_response: Optional pre-generated response (for document queries)
         is_edit: Whether this is an edit operation
         edit_index: Index of the message being edited (for edit operations)
+
+    Returns:
+        The assistant's reply, or None if the request was throttled (the
+        conversation is then unchanged and throttle_notice is set)
     """
     init_chat_session()
-    
+
+    # The answer is already known: no backend call needed
+    if custom_response:
+        return _record_exchange(user_message, custom_response, is_edit, edit_index)
+
+    # Enforce per-user and per-session quotas, and wait for a fair-queued
+    # backend slot, before touching the conversation
+    try:
+        get_rate_limiter().check(_current_user_id(), _current_session_id())
+        with get_rate_limiter().backend_slot(_current_session_id()):
+            return _record_exchange(user_message, None, is_edit, edit_index)
+    except RateLimitExceeded as e:
+        st.session_state.throttle_notice = e.user_message
+        return None
+
+def _record_exchange(user_message: str, custom_response: Optional[str], is_edit: bool,
+                     edit_index: Optional[int]) -> str:
+    """Add the user's message to the conversation, get the reply and add it too"""
     # If this is an edit operation
     if is_edit and edit_index is not None:
         # Update the user message at the specified index
@@ -149,9 +215,9 @@ def handle_message(user_message: str, custom_response: Optional[str] = None, is_
     response = handle_query(user_message, use_document_mode)
     
     # Add response to chat history
-    if response.get("success", False):
-        assistant_message = response.get("message", "")
-        context = response.get("context", None)
+    if response.success:
+        assistant_message = response.message
+        context = response.context
         
         message_data = {
             "role": "assistant",
@@ -160,6 +226,7 @@ def handle_message(user_message: str, custom_response: Optional[str] = None, is_
         }
         
         if context:
+            # Stored undecoded; rendered only when the user opens it
             message_data["context"] = context
             
         st.session_state.chat_history.append(message_data)
@@ -167,7 +234,7 @@ def handle_message(user_message: str, custom_response: Optional[str] = None, is_
         
         return assistant_message
     else:
-        error_message = response.get("message", "Sorry, I encountered an error processing your request.")
+        error_message = response.message or "Sorry, I encountered an error processing your request."
         assistant_msg = {
             "role": "assistant",
             "content": error_message,
@@ -1,11 +1,11 @@
 #document_service.py
 import streamlit as st
 import os
-import tempfile
 import logging
 import uuid
 import json
 import base64
+import weakref
 from typing import List, Dict, Any, Optional
 import mimetypes
 
@@ -13,6 +13,71 @@ import mimetypes
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+class _SessionUploads:
+    """
+    Per-session owner of the uploaded documents.
+
+    Stored in st.session_state, so it is garbage collected when Streamlit
+    drops the session; a weakref.finalize hook then releases whatever the
+    session left behind.
+    """
+
+    def __init__(self, documents):
+        # Shared with the finalizer, which must not reference self
+        self.state = {"documents": documents}
+        weakref.finalize(self, _release_uploads, self.state)
+
+
+def _release_document(doc):
+    """Release the upload buffer of a document and any file left on disk"""
+    data = doc.get("data")
+    if isinstance(data, memoryview):
+        try:
+            data.release()
+        except (BufferError, ValueError):
+            pass
+    temp_path = doc.get("temp_path")
+    if temp_path and os.path.exists(temp_path):
+        os.unlink(temp_path)
+
+def _release_uploads(state):
+    """Session-end hook: clean up every remaining upload of a session"""
+    documents = state.get("documents") or []
+    for doc in documents:
+        try:
+            _release_document(doc)
+        except Exception as e:
+            logger.error(f"Error releasing uploaded document: {str(e)}")
+    if documents:
+        logger.info(f"Released {len(documents)} uploaded document(s) of an ended session")
+    documents.clear()
+
+def _session_documents():
+    """The session's uploaded_documents list, registered for session-end cleanup"""
+    if "uploaded_documents" not in st.session_state:
+        st.session_state.uploaded_documents = []
+    documents = st.session_state.uploaded_documents
+
+    guard = st.session_state.get("_uploads_guard")
+    if guard is None:
+        guard = st.session_state._uploads_guard = _SessionUploads(documents)
+    else:
+        guard.state["documents"] = documents
+    return documents
+
+def encode_document_content(doc):
+    """
+    Base64-encode a document's bytes, only when a backend call needs them
+
+    Args:
+        doc: Document info dictionary
+
+    Returns:
+        Base64 string of the file contents
+    """
+    return base64.b64encode(doc["data"]).decode("utf-8")
+
 def process_uploaded_file(uploaded_file):
     """
     Process an uploaded file and add it to the session state
@@ -32,30 +97,18 @@ def process_uploaded_file(uploaded_file):
         file_type = uploaded_file.type
         file_size = uploaded_file.size
         
-        # Create temporary file to store the content
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file_name)[1]) as tmp_file:
-            tmp_file.write(uploaded_file.getbuffer())
-            temp_path = tmp_file.name
-        
-        # Read file content for API
-        with open(temp_path, "rb") as f:
-            encoded_content = base64.b64encode(f.read()).decode("utf-8")
-        
-        # Create document info
+        # Zero-copy view of the upload's in-memory buffer: no temp file, and
+        # base64 is only produced when a backend call needs it
+        # (see encode_document_content)
         document_info = {
             "id": doc_id,
             "name": file_name,
             "type": file_type,
             "size": file_size,
-            "temp_path": temp_path,
-            "content": encoded_content  # Base64 encoded content for API
+            "data": uploaded_file.getbuffer()
         }
         
-        # Add to session state if not already there
-        if "uploaded_documents" not in st.session_state:
-            st.session_state.uploaded_documents = []
-        
-        st.session_state.uploaded_documents.append(document_info)
+        _session_documents().append(document_info)
         
         return document_info
     
@@ -76,9 +129,8 @@ def remove_document(doc_id):
     try:
         for i, doc in enumerate(st.session_state.uploaded_documents):
             if doc["id"] == doc_id:
-                # Delete the temporary file
-                if os.path.exists(doc["temp_path"]):
-                    os.unlink(doc["temp_path"])
+                # Release the upload buffer
+                _release_document(doc)
                 
                 # Remove from session state
                 st.session_state.uploaded_documents.pop(i)
@@ -113,10 +165,7 @@ def get_uploaded_documents():
     Returns:
         List of document info dictionaries
     """
-    if "uploaded_documents" not in st.session_state:
-        st.session_state.uploaded_documents = []
-    
-    return st.session_state.uploaded_documents
+    return _session_documents()
 
 def clear_all_documents():
     """
@@ -128,14 +177,13 @@ def clear_all_documents():
     count = 0
     
     if "uploaded_documents" in st.session_state:
-        # Delete all temporary files
+        # Release all upload buffers
         for doc in st.session_state.uploaded_documents:
-            if os.path.exists(doc["temp_path"]):
-                os.unlink(doc["temp_path"])
+            _release_document(doc)
             count += 1
         
-        # Clear the session state
-        st.session_state.uploaded_documents = []
+        # Clear in place so the session-end hook keeps tracking the same list
+        st.session_state.uploaded_documents.clear()
     
     return count
 
@@ -152,7 +200,7 @@ def get_api_document_format():
         api_docs.append({
             "file_name": doc["name"],
             "file_type": doc["type"],
-            "content": doc["content"]  # Base64 encoded content
+            "content": encode_document_content(doc)  # Base64, encoded on demand
         })
     
     return api_docs
@@ -173,8 +221,9 @@ def remove_document(filename):
     # Find the document with the matching filename
     for i, doc in enumerate(st.session_state.uploaded_documents):
         if doc.get("name") == filename:
-            # Remove the document
+            # Remove the document and release its buffer
             st.session_state.uploaded_documents.pop(i)
+            _release_document(doc)
             return True
             
     return False
\ No newline at end of file
@@ -0,0 +1,109 @@
+#document_stream.py
+import threading
+import logging
+from typing import Callable, Iterator, List, Optional, Tuple
+from utils.document_index import DocumentIndex, chunk_by_content, get_embedder
+from utils.tokens import DEFAULT_ENCODING
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class StreamingDocument:
+    """
+    A document whose pages are indexed as they are extracted.
+
+    The first pages are consumed on the caller's thread until enough text
+    for a useful answer exists; the rest is consumed by a background thread
+    that keeps extending the same DocumentIndex. The background thread only
+    touches this object (never st.session_state), and readers go through
+    the index's own lock.
+    """
+
+    def __init__(self, name: str, chunk_tokens: int = 400,
+                 encoding_name: str = DEFAULT_ENCODING, separator: str = "\n"):
+        self.name = name
+        self.separator = separator
+        self.chunk_tokens = chunk_tokens
+        self.encoding_name = encoding_name
+        self.index = DocumentIndex([], get_embedder(), source=name)
+        self.pages_done = 0
+        self.pages_total = 0
+        self.token_count = 0
+        self.done = False
+        self.error: Optional[str] = None
+        self._parts: List[str] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def text(self) -> str:
+        with self._lock:
+            return self.separator.join(self._parts)
+
+    def _add_page(self, done: int, total: int, text: str):
+        chunks = chunk_by_content(text, self.chunk_tokens, self.encoding_name)
+        self.index.extend(chunks)
+        with self._lock:
+            self._parts.append(text)
+            self.pages_done, self.pages_total = done, total
+            self.token_count += sum(chunk.token_count for chunk in chunks)
+
+    def _consume(self, pages: Iterator[Tuple[int, int, str]],
+                 on_complete: Optional[Callable[["StreamingDocument"], None]]):
+        try:
+            for done, total, text in pages:
+                self._add_page(done, total, text)
+        except Exception as e:
+            logger.error(f"Error extracting {self.name}: {str(e)}")
+            self.error = str(e)
+        finally:
+            self.done = True
+
+        if on_complete is not None and self.error is None:
+            try:
+                on_complete(self)
+            except Exception as e:
+                logger.error(f"Error finishing {self.name}: {str(e)}")
+
+    def start(self, pages: Iterator[Tuple[int, int, str]], early_tokens: int,
+              on_progress: Optional[Callable[[int, int], None]] = None,
+              on_complete: Optional[Callable[["StreamingDocument"], None]] = None):
+        """
+        Read pages until early_tokens of text exist, then index the rest in the background
+
+        Args:
+            pages: Iterator of (pages_done, pages_total, text), e.g. from stream_document
+            early_tokens: Tokens needed before the document is usable
+            on_progress: Optional callback (pages_done, pages_total), called on this thread only
+            on_complete: Optional callback run once all pages are indexed (on either thread)
+
+        Raises:
+            Exception: If extraction fails before the document becomes usable
+        """
+        pages = iter(pages)
+        for done, total, text in pages:
+            self._add_page(done, total, text)
+            if on_progress is not None:
+                on_progress(done, total)
+            if self.token_count >= early_tokens:
+                break
+        else:
+            # The whole document fitted in the early read
+            self._consume(iter(()), on_complete)
+            return
+
+        self._thread = threading.Thread(target=self._consume, args=(pages, on_complete),
+                                        name=f"index-{self.name}", daemon=True)
+        self._thread.start()
+
+    def status(self) -> str:
+        """Short human-readable indexing status"""
+        if self.error:
+            return f"indexing stopped: {self.error}"
+        if self.done:
+            return "fully indexed"
+        if self.pages_total:
+            return f"indexing page {self.pages_done} of {self.pages_total}"
+        return "indexing"
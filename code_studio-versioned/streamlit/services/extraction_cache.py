@@ -0,0 +1,191 @@
+#extraction_cache.py
+import hashlib
+import json
+import os
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CACHE_SUFFIX = ".json"
+
+
+def file_digest(data) -> str:
+    """SHA-256 hex digest of file contents (bytes or any buffer)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ExtractionCache:
+    """
+    Disk-backed cache of extraction results, shared by every session.
+
+    Entries are small JSON documents keyed by a string that callers build
+    from the SHA-256 of the file bytes and the extractor version, so a
+    re-upload of the same file returns instantly while a parser upgrade
+    never serves stale text. The total size on disk is bounded by evicting
+    the least recently used entries.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> size in bytes, least recently used first
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + CACHE_SUFFIX)
+
+    def _load_index(self):
+        """Rebuild the LRU index from the files on disk (lock must be held)"""
+        if self._loaded:
+            return
+        self._loaded = True
+        os.makedirs(self.directory, exist_ok=True)
+
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(CACHE_SUFFIX):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, name[:-len(CACHE_SUFFIX)], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cache entry
+
+        Args:
+            key: Cache key
+
+        Returns:
+            The stored dictionary, or None on a miss
+        """
+        path = self._path(key)
+        with self._lock:
+            self._load_index()
+
+        # Go to disk even for keys missing from the index: another server
+        # process sharing the directory may have written them
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            # mtime doubles as the last-access time when the index is rebuilt
+            os.utime(path, None)
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._total_bytes -= self._index.pop(key, 0)
+                self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable extraction cache entry {key}: {str(e)}")
+            self._discard(key)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self._total_bytes += size - self._index.pop(key, 0)
+            self._index[key] = size
+            self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        """
+        Store a cache entry and evict old entries beyond the size limit
+
+        Args:
+            key: Cache key
+            entry: JSON-serializable dictionary
+        """
+        path = self._path(key)
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers in other sessions never see a partial file
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Error writing extraction cache entry {key}: {str(e)}")
+            return
+
+        with self._lock:
+            self._load_index()
+            self._total_bytes += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            evicted = self._evict()
+
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def _evict(self):
+        """Drop least recently used keys until under max_bytes (lock must be held)"""
+        evicted = []
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            old_key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            evicted.append(old_key)
+        return evicted
+
+    def _discard(self, key: str):
+        with self._lock:
+            self._total_bytes -= self._index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._load_index()
+            return {
+                "entries": len(self._index),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_cache: Optional[ExtractionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_extraction_cache() -> ExtractionCache:
+    """Get the process-wide extraction cache, in sync with settings"""
+    from utils.constants import DATA_DIR
+    from utils.settings import get_settings
+
+    settings = get_settings()
+    directory = settings.extraction_cache_dir or os.path.join(DATA_DIR, "extraction_cache")
+
+    global _cache
+    with _cache_lock:
+        if _cache is None or _cache.directory != directory:
+            _cache = ExtractionCache(directory, settings.extraction_cache_max_bytes)
+        _cache.max_bytes = settings.extraction_cache_max_bytes
+        return _cache
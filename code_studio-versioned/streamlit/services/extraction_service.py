@@ -0,0 +1,556 @@
+#extraction_service.py
+import atexit
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from queue import Empty
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+from utils.document_parsers import (
+    ENGINE_BASIC, EXTRACTOR_VERSION, PAGE_SEPARATORS, extract_text, is_supported, iter_pages
+)
+from services.extraction_cache import file_digest, get_extraction_cache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Called on the caller's thread with (filename, pages_done, pages_total)
+FileProgressCallback = Callable[[str, int, int], None]
+
+# Error of files no parser handles; callers usually skip these silently
+UNSUPPORTED_FILE_TYPE = "Unsupported file type"
+
+# How often the caller's thread checks for progress and finished jobs
+POLL_INTERVAL = 0.2
+
+# Set in each worker process by _init_worker
+_worker_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _worker_progress_queue
+    _worker_progress_queue = progress_queue
+
+
+class _FilePayload(NamedTuple):
+    """A large upload handed to a worker as a temp file instead of pickled bytes"""
+    path: str
+
+
+def _to_worker_payload(data) -> Tuple[object, Optional[str]]:
+    """
+    Prepare file contents for a worker process
+
+    Small files are sent as bytes (the one unavoidable copy, made when they
+    are pickled). Large ones are written once to a temp file that the worker
+    reads itself, so this process never holds a second copy of them.
+
+    Returns:
+        (payload, temp file path to delete afterwards or None)
+    """
+    from utils.settings import get_settings
+    if len(data) <= get_settings().extraction_inline_max_bytes:
+        return (bytes(data) if isinstance(data, memoryview) else data), None
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".upload") as f:
+        f.write(data)
+    return _FilePayload(f.name), f.name
+
+
+def _remove_payload_file(path: Optional[str]):
+    if path and os.path.exists(path):
+        try:
+            os.unlink(path)
+        except OSError as e:
+            logger.warning(f"Could not remove extraction temp file {path}: {str(e)}")
+
+
+def _load_payload(payload) -> bytes:
+    if isinstance(payload, _FilePayload):
+        with open(payload.path, "rb") as f:
+            return f.read()
+    return payload
+
+
+def _report_start(job_id: str):
+    """Tell the caller a worker picked up the job; its timeout counts from here"""
+    if _worker_progress_queue is not None:
+        _worker_progress_queue.put((job_id, None, None, None))
+
+
+def _extract_in_worker(job_id: str, filename: str, data: bytes, engine: str) -> Tuple[Optional[str], int]:
+    """Runs in a worker process: parse one file and stream page progress back"""
+    _report_start(job_id)
+    pages = [0]
+
+    def progress(done, total):
+        pages[0] = total
+        if _worker_progress_queue is not None:
+            _worker_progress_queue.put((job_id, done, total, None))
+
+    text = extract_text(filename, _load_payload(data), engine, progress)
+    return text, pages[0]
+
+
+def _stream_in_worker(job_id: str, filename: str, data: bytes, engine: str) -> Optional[int]:
+    """Runs in a worker process: send each parsed page back as soon as it is ready"""
+    _report_start(job_id)
+    if not is_supported(filename, engine):
+        return None
+    parts = 0
+    for done, total, text in iter_pages(filename, _load_payload(data), engine):
+        _worker_progress_queue.put((job_id, done, total, text))
+        parts += 1
+    return parts
+
+
+def extraction_cache_key(digest: str, engine: str) -> str:
+    """Cache key of the extracted text of a file (see services.extraction_cache)"""
+    return f"{digest}-{engine}-v{EXTRACTOR_VERSION}"
+
+
+@dataclass
+class ExtractionResult:
+    """Outcome of extracting one file"""
+    filename: str
+    text: Optional[str] = None
+    error: Optional[str] = None
+    pages: int = 0
+    seconds: float = 0.0
+    cached: bool = False
+
+    @property
+    def success(self) -> bool:
+        return self.error is None and self.text is not None
+
+    @property
+    def unsupported(self) -> bool:
+        return self.error == UNSUPPORTED_FILE_TYPE
+
+
+class ExtractionService:
+    """
+    Process-wide document extraction service.
+
+    CPU-bound parsing runs in a ProcessPoolExecutor so it neither blocks the
+    Streamlit script thread nor competes for the GIL. The number of jobs in
+    flight is capped per server process (extraction_max_jobs), every file has
+    its own timeout, counted from when a worker picks it up (jobs past
+    extraction_workers wait in the pool's queue), and page progress is
+    streamed back from the workers.
+    Results are cached on disk by content hash, so a file that any session
+    already extracted is never parsed again.
+
+    A worker stuck past its timeout cannot be cancelled, and terminating
+    it breaks the whole pool, failing the other jobs running there. So the
+    pool is retired instead: new jobs go to a new pool, and the old one's
+    processes are terminated once its other jobs have finished.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._workers = 0
+        # Progress queue and unfinished futures of the current and retired pools
+        self._queues: Dict[ProcessPoolExecutor, object] = {}
+        self._futures: Dict[ProcessPoolExecutor, Set[Future]] = {}
+        self._progress: Dict[str, Tuple[int, int]] = {}
+        self._pages: Dict[str, List[Tuple[int, int, str]]] = {}
+        # When a worker picked up each job (see _report_start)
+        self._started: Dict[str, float] = {}
+        # Reserved jobs; progress of any other job (e.g. a late message of
+        # an abandoned or timed-out one) is dropped
+        self._active_jobs: Set[str] = set()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        from utils.settings import get_settings
+        workers = max(1, get_settings().extraction_workers)
+
+        with self._lock:
+            if self._executor is None or self._workers != workers:
+                previous = self._executor
+                if previous is not None:
+                    # Jobs already running there finish; see _forget
+                    previous.shutdown(wait=False)
+                # spawn: forking a multi-threaded Streamlit server is unsafe
+                ctx = multiprocessing.get_context("spawn")
+                progress_queue = ctx.Queue()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=ctx,
+                    initializer=_init_worker,
+                    initargs=(progress_queue,),
+                )
+                self._queues[self._executor] = progress_queue
+                self._futures[self._executor] = set()
+                self._workers = workers
+            else:
+                previous = None
+            executor = self._executor
+        if previous is not None:
+            self._drop_if_idle(previous)
+        return executor
+
+    def _submit(self, fn, *args) -> Tuple[ProcessPoolExecutor, Future]:
+        """Submit a job to the current pool, tracking it until it finishes"""
+        executor = self._get_executor()
+        future = executor.submit(fn, *args)
+        with self._lock:
+            self._futures.setdefault(executor, set()).add(future)
+        future.add_done_callback(lambda f: self._forget(executor, f))
+        return executor, future
+
+    def _forget(self, executor: ProcessPoolExecutor, future: Future):
+        """Stop tracking a finished job"""
+        with self._lock:
+            self._futures.get(executor, set()).discard(future)
+        self._drop_if_idle(executor)
+
+    def _drop_if_idle(self, executor: ProcessPoolExecutor):
+        """Forget a pool that was replaced once it has no unfinished jobs"""
+        with self._lock:
+            if executor is self._executor or self._futures.get(executor):
+                return
+        # Its workers may have reported progress just before finishing
+        self._drain_progress()
+        with self._lock:
+            if executor is not self._executor and not self._futures.get(executor):
+                self._futures.pop(executor, None)
+                self._queues.pop(executor, None)
+
+    def _recycle(self, executor: ProcessPoolExecutor):
+        """Replace a broken pool; its jobs have already failed"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        logger.warning("Recycling broken extraction worker pool")
+        self._terminate(executor, self._processes_of(executor))
+        self._drop_if_idle(executor)
+
+    def _retire(self, executor: ProcessPoolExecutor, stuck: Future):
+        """
+        Send no more jobs to a pool whose worker is stuck on a timed-out job.
+        Its other jobs (each bounded by its own timeout) are left to finish
+        before its processes are terminated.
+        """
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+            others = [f for f in self._futures.get(executor, ()) if f is not stuck]
+        logger.warning(f"Retiring extraction worker pool ({len(others)} other jobs left to finish)")
+        # shutdown() lets go of the worker processes, so take them first
+        processes = self._processes_of(executor)
+        executor.shutdown(wait=False)
+        threading.Thread(target=self._reap, args=(executor, processes, others),
+                         name="extraction-pool-reaper", daemon=True).start()
+
+    def _reap(self, executor: ProcessPoolExecutor, processes: List, others: List[Future]):
+        from utils.settings import get_settings
+        wait(others, timeout=get_settings().extraction_timeout)
+        self._terminate(executor, processes)
+        self._drop_if_idle(executor)
+
+    @staticmethod
+    def _processes_of(executor: ProcessPoolExecutor) -> List:
+        return list((getattr(executor, "_processes", None) or {}).values())
+
+    @staticmethod
+    def _terminate(executor: ProcessPoolExecutor, processes: List):
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    def _try_reserve_job(self, job_id: str) -> bool:
+        from utils.settings import get_settings
+        with self._lock:
+            if len(self._active_jobs) >= max(1, get_settings().extraction_max_jobs):
+                return False
+            self._active_jobs.add(job_id)
+            return True
+
+    def _release_job(self, job_id: str):
+        with self._lock:
+            self._active_jobs.discard(job_id)
+            self._progress.pop(job_id, None)
+            self._pages.pop(job_id, None)
+            self._started.pop(job_id, None)
+
+    def _drain_progress(self):
+        """Move progress messages from the workers into the shared table"""
+        with self._lock:
+            queues = list(self._queues.values())
+        for queue in queues:
+            while True:
+                try:
+                    job_id, done, total, text = queue.get_nowait()
+                except (Empty, OSError, ValueError):
+                    break
+                with self._lock:
+                    if job_id not in self._active_jobs:
+                        continue
+                    self._started.setdefault(job_id, time.monotonic())
+                    if done is None:
+                        continue
+                    self._progress[job_id] = (done, total)
+                    if text is not None:
+                        self._pages.setdefault(job_id, []).append((done, total, text))
+
+    def _take_pages(self, job_id: str) -> List[Tuple[int, int, str]]:
+        with self._lock:
+            return self._pages.pop(job_id, [])
+
+    def _started_at(self, job_id: str) -> Optional[float]:
+        """When a worker picked up the job, or None while it is still queued"""
+        with self._lock:
+            return self._started.get(job_id)
+
+    def extract(self, files: Sequence[Tuple[str, bytes]], engine: str = ENGINE_BASIC,
+                on_progress: Optional[FileProgressCallback] = None,
+                timeout: Optional[float] = None) -> List[ExtractionResult]:
+        """
+        Extract text from several files in parallel
+
+        Args:
+            files: (filename, contents) pairs; contents may be bytes or a memoryview
+            engine: Parser engine (see utils.document_parsers)
+            on_progress: Optional callback receiving (filename, pages_done, pages_total);
+                called on the caller's thread, so it may update Streamlit elements
+            timeout: Per-file timeout in seconds, counted from when a worker starts
+                on the file (defaults to the extraction_timeout setting)
+
+        Returns:
+            One ExtractionResult per file, in input order
+        """
+        from utils.settings import get_settings
+        if timeout is None:
+            timeout = get_settings().extraction_timeout
+
+        results = [ExtractionResult(filename=name) for name, _ in files]
+        cache = get_extraction_cache()
+        cache_keys = [extraction_cache_key(file_digest(data), engine) for _, data in files]
+
+        waiting = []
+        for index, key in enumerate(cache_keys):
+            entry = cache.get(key)
+            if entry is None:
+                waiting.append(index)
+                continue
+            result = results[index]
+            result.text, result.pages, result.cached = entry["text"], entry.get("pages", 0), True
+            if on_progress is not None:
+                on_progress(result.filename, max(result.pages, 1), max(result.pages, 1))
+
+        running = {}  # future -> (index, job_id, submitted, executor)
+        temp_paths: Dict[str, Optional[str]] = {}
+        reported: Dict[str, Tuple[int, int]] = {}
+        queued_since = time.monotonic()
+
+        while waiting or running:
+            # Submit as many files as the process-wide job cap allows
+            while waiting:
+                job_id = uuid.uuid4().hex
+                if not self._try_reserve_job(job_id):
+                    break
+                index = waiting.pop(0)
+                name, data = files[index]
+                temp_path = None
+                try:
+                    payload, temp_path = _to_worker_payload(data)
+                    executor, future = self._submit(_extract_in_worker, job_id, name, payload, engine)
+                except Exception as e:
+                    self._release_job(job_id)
+                    _remove_payload_file(temp_path)
+                    results[index].error = f"Could not start extraction: {str(e)}"
+                    continue
+                temp_paths[job_id] = temp_path
+                running[future] = (index, job_id, time.monotonic(), executor)
+                queued_since = time.monotonic()
+
+            if waiting and not running and time.monotonic() - queued_since > timeout:
+                for index in waiting:
+                    results[index].error = "Extraction service is busy, please try again."
+                break
+
+            if running:
+                done, _ = wait(list(running), timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            else:
+                done = set()
+                time.sleep(POLL_INTERVAL)
+
+            self._drain_progress()
+            if on_progress is not None:
+                with self._lock:
+                    snapshot = {job_id: self._progress.get(job_id) for _, job_id, _, _ in running.values()}
+                for index, job_id, _, _ in running.values():
+                    current = snapshot.get(job_id)
+                    if current and reported.get(job_id) != current:
+                        reported[job_id] = current
+                        on_progress(files[index][0], *current)
+
+            now = time.monotonic()
+            for future in list(running):
+                index, job_id, submitted, executor = running[future]
+                started = self._started_at(job_id)
+                result = results[index]
+                if future in done:
+                    try:
+                        result.text, result.pages = future.result()
+                        if result.text is None:
+                            result.error = UNSUPPORTED_FILE_TYPE
+                        else:
+                            cache.put(cache_keys[index], {"text": result.text, "pages": result.pages})
+                    except BrokenProcessPool as e:
+                        logger.error(f"Extraction worker died on {result.filename}: {str(e)}")
+                        result.error = "Extraction worker crashed"
+                        self._recycle(executor)
+                    except Exception as e:
+                        logger.error(f"Extraction failed for {result.filename}: {str(e)}")
+                        result.error = str(e) or e.__class__.__name__
+                elif started is not None and now - started > timeout:
+                    logger.error(f"Extraction of {result.filename} timed out after {timeout:.0f}s")
+                    result.error = f"Timed out after {timeout:.0f} seconds"
+                    if not future.cancel():
+                        self._retire(executor, future)
+                else:
+                    continue
+
+                result.seconds = now - (started or submitted)
+                del running[future]
+                self._release_job(job_id)
+                _remove_payload_file(temp_paths.pop(job_id, None))
+                final = (max(result.pages, 1), max(result.pages, 1))
+                if on_progress is not None and result.success and reported.get(job_id) != final:
+                    on_progress(result.filename, *final)
+
+        return results
+
+    def stream(self, filename: str, data: bytes, engine: str = ENGINE_BASIC,
+               timeout: Optional[float] = None) -> Iterator[Tuple[int, int, str]]:
+        """
+        Extract one file in a worker process, yielding pages as they are parsed
+
+        The full text is cached once the last page has arrived. Closing the
+        generator early cancels the job if it has not started.
+
+        Args:
+            filename: Original file name
+            data: File contents (bytes or memoryview)
+            engine: Parser engine (see utils.document_parsers)
+            timeout: Timeout in seconds for the whole file, counted from when a
+                worker starts on it; waiting for a free job slot is bounded by it too
+
+        Yields:
+            (pages_done, pages_total, text) per page or batch of pages
+
+        Raises:
+            Exception: If the file type is unsupported, extraction fails or times out
+        """
+        from utils.settings import get_settings
+        if timeout is None:
+            timeout = get_settings().extraction_timeout
+
+        cache = get_extraction_cache()
+        cache_key = extraction_cache_key(file_digest(data), engine)
+        entry = cache.get(cache_key)
+        if entry is not None:
+            pages = max(entry.get("pages", 0), 1)
+            yield pages, pages, entry["text"]
+            return
+
+        waiting_since = time.monotonic()
+        job_id = uuid.uuid4().hex
+        while not self._try_reserve_job(job_id):
+            if time.monotonic() - waiting_since > timeout:
+                raise Exception("Extraction service is busy, please try again.")
+            time.sleep(POLL_INTERVAL)
+
+        future, temp_path = None, None
+        try:
+            payload, temp_path = _to_worker_payload(data)
+            executor, future = self._submit(_stream_in_worker, job_id, filename, payload, engine)
+
+            parts, expected, last = [], None, (0, 0)
+            while expected is None or len(parts) < expected:
+                if expected is None and future.done():
+                    try:
+                        expected = future.result()
+                    except BrokenProcessPool:
+                        self._recycle(executor)
+                        raise Exception("Extraction worker crashed")
+                    if expected is None:
+                        raise Exception(UNSUPPORTED_FILE_TYPE)
+
+                self._drain_progress()
+                for done, total, text in self._take_pages(job_id):
+                    parts.append(text)
+                    last = (done, total)
+                    yield done, total, text
+
+                started = self._started_at(job_id)
+                if started is not None and time.monotonic() - started > timeout:
+                    logger.error(f"Extraction of {filename} timed out after {timeout:.0f}s")
+                    if not future.cancel():
+                        self._retire(executor, future)
+                    raise Exception(f"Timed out after {timeout:.0f} seconds")
+                if expected is None or len(parts) < expected:
+                    # Pages may still be in flight on the queue after the job finished
+                    wait([future], timeout=POLL_INTERVAL)
+                    if future.done():
+                        time.sleep(0.01)
+
+            cache.put(cache_key, {"text": PAGE_SEPARATORS[engine].join(parts), "pages": last[1]})
+        finally:
+            if future is not None and not future.done():
+                future.cancel()
+            self._release_job(job_id)
+            _remove_payload_file(temp_path)
+
+    def shutdown(self):
+        with self._lock:
+            executors, self._executor = list(self._queues), None
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_service = ExtractionService()
+atexit.register(_service.shutdown)
+
+
+def get_extraction_service() -> ExtractionService:
+    """Get the process-wide extraction service shared by all sessions"""
+    return _service
+
+
+def stream_document(filename: str, data: bytes, engine: str = ENGINE_BASIC,
+                    timeout: Optional[float] = None) -> Iterator[Tuple[int, int, str]]:
+    """
+    Extract one file in a worker process, yielding (pages_done, pages_total, text)
+    as each page or batch of pages is parsed
+    """
+    return _service.stream(filename, data, engine, timeout)
+
+
+def extract_documents(files: Sequence[Tuple[str, bytes]], engine: str = ENGINE_BASIC,
+                      on_progress: Optional[FileProgressCallback] = None,
+                      timeout: Optional[float] = None) -> List[ExtractionResult]:
+    """
+    Extract text from uploaded files in worker processes
+
+    Args:
+        files: (filename, contents) pairs
+        engine: Parser engine (see utils.document_parsers)
+        on_progress: Optional callback receiving (filename, pages_done, pages_total)
+        timeout: Per-file timeout in seconds
+
+    Returns:
+        One ExtractionResult per file, in input order
+    """
+    return _service.extract(files, engine, on_progress, timeout)
@@ -1,79 +1,368 @@
-import streamlit as st
+import atexit
 import threading
 import time
 import logging
-from services.api_service import check_health
+from collections import deque
+from typing import Any, Dict, Optional
+from services.api_service import probe_replica
+from services.replica_pool import get_replica_pool
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Variable to track if the health check thread is running
-health_check_thread_running = False
+
+# Health states, from best to worst
+HEALTHY = "healthy"
+DEGRADED = "degraded"
+DOWN = "down"
+UNKNOWN = "unknown"
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _percentile(sorted_values, fraction: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class TargetStats:
+    """Rolling window of call/probe outcomes and latencies for one backend replica"""
+
+    def __init__(self, target: str):
+        self.target = target
+        self.samples = deque()  # (timestamp, latency, success)
+        self.consecutive_failures = 0
+        self.last_failure_reason: Optional[str] = None
+        self.last_failure_at: Optional[float] = None
+        self.last_success_at: Optional[float] = None
+        self.last_passive_at: Optional[float] = None
+        self.passive_samples = 0
+        self.probe_samples = 0
+
+    def record(self, success: bool, latency: Optional[float], reason: Optional[str],
+               now: float, passive: bool):
+        self.samples.append((now, latency, success))
+        if passive:
+            self.last_passive_at = now
+            self.passive_samples += 1
+        else:
+            self.probe_samples += 1
+        if success:
+            self.consecutive_failures = 0
+            self.last_success_at = now
+        else:
+            self.consecutive_failures += 1
+            self.last_failure_reason = reason
+            self.last_failure_at = now
+
+    def trim(self, now: float, window: float):
+        while self.samples and now - self.samples[0][0] > window:
+            self.samples.popleft()
+
+    def summary(self, settings) -> Dict[str, Any]:
+        """Histogram, percentiles, error rate and derived state of the window"""
+        count = len(self.samples)
+        failures = sum(1 for _, _, ok in self.samples if not ok)
+        latencies = sorted(lat for _, lat, ok in self.samples if ok and lat is not None)
+
+        histogram = {f"le_{bound}": 0 for bound in LATENCY_BUCKETS}
+        histogram["le_inf"] = 0
+        for latency in latencies:
+            for bound in LATENCY_BUCKETS:
+                if latency <= bound:
+                    histogram[f"le_{bound}"] += 1
+                    break
+            else:
+                histogram["le_inf"] += 1
+
+        error_rate = failures / count if count else 0.0
+        p50 = _percentile(latencies, 0.50)
+        p95 = _percentile(latencies, 0.95)
+
+        if not count:
+            state = UNKNOWN
+        elif (self.consecutive_failures >= settings.health_down_after_failures
+              or error_rate >= settings.health_down_error_rate):
+            state = DOWN
+        elif (error_rate >= settings.health_degraded_error_rate
+              or (p95 is not None and p95 >= settings.health_degraded_latency)):
+            state = DEGRADED
+        else:
+            state = HEALTHY
+
+        return {
+            "target": self.target,
+            "state": state,
+            "samples": count,
+            "error_rate": round(error_rate, 4),
+            "latency_p50": p50,
+            "latency_p95": p95,
+            "latency_histogram": histogram,
+            "consecutive_failures": self.consecutive_failures,
+            "last_failure_reason": self.last_failure_reason,
+            "last_failure_at": self.last_failure_at,
+            "last_success_at": self.last_success_at,
+            "last_traffic_at": self.last_passive_at,
+            "passive_samples": self.passive_samples,
+            "probe_samples": self.probe_samples,
+        }
+
+
+class HealthStore:
+    """
+    Thread-safe, process-wide store of health samples per backend replica.
+
+    Written by the health monitor thread and read by every session, so no
+    background thread ever touches a session's st.session_state.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._targets: Dict[str, TargetStats] = {}
+
+    def record(self, target: str, success: bool, latency: Optional[float] = None,
+               reason: Optional[str] = None, passive: bool = False):
+        """
+        Record one outcome for a replica
+
+        Args:
+            target: Replica ID
+            success: Whether the probe or call succeeded
+            latency: Duration in seconds
+            reason: Failure reason, if any
+            passive: True for real API traffic, False for synthetic probes
+        """
+        from utils.settings import get_settings
+        window = get_settings().health_window_seconds
+
+        with self._lock:
+            now = time.time()
+            stats = self._targets.get(target)
+            if stats is None:
+                stats = self._targets[target] = TargetStats(target)
+            stats.record(success, latency, reason, now, passive)
+            stats.trim(now, window)
+
+    def seconds_since_traffic(self, target: str) -> Optional[float]:
+        """Seconds since real traffic last reported on a replica (None if never)"""
+        with self._lock:
+            stats = self._targets.get(target)
+            if stats is None or stats.last_passive_at is None:
+                return None
+            return time.time() - stats.last_passive_at
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Summaries for every replica plus the overall state
+
+        Returns:
+            Dictionary with 'state' and per-replica 'targets'
+        """
+        from utils.settings import get_settings
+        settings = get_settings()
+
+        with self._lock:
+            now = time.time()
+            targets = []
+            for stats in self._targets.values():
+                stats.trim(now, settings.health_window_seconds)
+                targets.append(stats.summary(settings))
+
+        # The service is as healthy as its best replica
+        states = {t["state"] for t in targets}
+        for state in (HEALTHY, DEGRADED, DOWN):
+            if state in states:
+                overall = state
+                break
+        else:
+            overall = UNKNOWN
+
+        return {"state": overall, "generated_at": now, "targets": targets}
+
+    def state(self) -> str:
+        return self.report()["state"]
+
+
+class HealthMonitor:
+    """
+    Single background thread per server process that probes the backend.
+
+    The poll interval adapts to the backend state: it grows geometrically
+    (up to health_check_max_interval) while the backend is healthy and drops
+    back to health_check_interval as soon as a probe fails. The number of
+    probes is therefore independent of the number of sessions.
+
+    Real API calls report their outcome passively (record_call_outcome).
+    A replica that saw traffic within health_passive_window is not probed,
+    so synthetic probes are only sent while traffic is idle. Failures are
+    then detected by the traffic itself, and an idle replica is probed
+    within health_passive_window + health_check_max_interval at worst.
+    Ejected replicas receive no traffic and are always probed.
+    """
+
+    def __init__(self, store: HealthStore):
+        self.store = store
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.current_interval: Optional[float] = None
+        self.probes_sent = 0
+        self.probes_skipped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the monitor thread if it is not already running"""
+        with self._lock:
+            if self.running:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the monitor thread and wait for it to exit"""
+        with self._lock:
+            thread = self._thread
+            self._stop_event.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def probe(self, force: bool = False) -> str:
+        """
+        Probe the query backend replicas that have no recent traffic.
+
+        Results go to the health store and to the replica pool, so the same
+        latency data drives both the health report and replica selection.
+
+        Args:
+            force: Probe every replica, even those with recent traffic
+
+        Returns:
+            Overall health state after the probe
+        """
+        from utils.settings import get_settings
+        passive_window = get_settings().health_passive_window
+
+        pool = get_replica_pool("query")
+        for replica_id in pool.replica_ids:
+            idle_for = self.store.seconds_since_traffic(replica_id)
+            if (not force and not pool.is_ejected(replica_id)
+                    and idle_for is not None and idle_for < passive_window):
+                self.probes_skipped += 1
+                continue
+
+            self.probes_sent += 1
+            healthy, latency, reason = probe_replica(replica_id)
+            self.store.record(replica_id, healthy, latency, reason)
+            pool.mark_health(replica_id, healthy, latency, reason)
+            if not healthy:
+                logger.error(f"Health check failed for {replica_id}: {reason}")
+
+        return self.store.state()
+
+    def _next_interval(self, healthy: bool) -> float:
+        from utils.settings import get_settings
+        settings = get_settings()
+
+        if not healthy or self.current_interval is None:
+            return settings.health_check_interval
+        return min(self.current_interval * settings.health_check_backoff,
+                   settings.health_check_max_interval)
+
+    def _run(self):
+        logger.info("Starting health monitor")
+
+        while not self._stop_event.is_set():
+            try:
+                healthy = self.probe() == HEALTHY
+            except Exception as e:
+                logger.error(f"Health monitor error: {str(e)}")
+                healthy = False
+
+            self.current_interval = self._next_interval(healthy)
+            self._stop_event.wait(self.current_interval)
+
+        logger.info("Health monitor stopped")
+
+
+_store = HealthStore()
+_monitor = HealthMonitor(_store)
+atexit.register(_monitor.stop)
+
+
+def get_health_monitor() -> HealthMonitor:
+    """Get the process-wide health monitor"""
+    return _monitor
 
 def start_health_check_thread():
     """
-    Start a background thread that periodically checks API health status
-    """
-    global health_check_thread_running
-    
-    if health_check_thread_running:
-        return
-    
-    health_check_thread_running = True
-    
-    def health_check_worker():
-        """Background worker function to check API health"""
-        from utils.constants import HEALTH_CHECK_INTERVAL
-        
-        global health_check_thread_running
-        
-        logger.info("Starting health check thread")
-        
-        try:
-            while health_check_thread_running:
-                # Check API health
-                is_healthy = check_health()
-                
-                # Update session state
-                st.session_state.health_status = is_healthy
-                
-                # Sleep for the defined interval
-                time.sleep(HEALTH_CHECK_INTERVAL)
-        
-        except Exception as e:
-            logger.error(f"Health check thread error: {str(e)}")
-            st.session_state.health_status = False
-        
-        logger.info("Health check thread stopped")
-    
-    # Start the thread
-    thread = threading.Thread(target=health_check_worker, daemon=True)
-    thread.start()
+    Start the shared health monitor (no-op if it is already running)
+    """
+    _monitor.start()
 
 def stop_health_check_thread():
     """
-    Stop the health check background thread
+    Stop the shared health monitor
     """
-    global health_check_thread_running
-    health_check_thread_running = False
+    _monitor.stop()
 
 def get_health_status():
     """
     Get the current health status
-    
+
+    Returns:
+        False if the backend is down, True otherwise
+    """
+    return _store.state() != DOWN
+
+def get_health_state():
+    """
+    Get the current health state
+
+    Returns:
+        One of "healthy", "degraded", "down" or "unknown"
+    """
+    return _store.state()
+
+def get_health_report():
+    """
+    Get the full health report (JSON-serializable)
+
     Returns:
-        Current health status from session state
+        Dictionary with the overall state, per-replica latency histograms,
+        error rates and last failure reasons, and the replica pool state
     """
-    return st.session_state.health_status
+    report = _store.report()
+    report["replica_pools"] = {kind: get_replica_pool(kind).snapshot() for kind in ("query", "docs")}
+    report["monitor_interval"] = _monitor.current_interval
+    report["probes_sent"] = _monitor.probes_sent
+    report["probes_skipped"] = _monitor.probes_skipped
+    return report
+
+def record_call_outcome(replica_id, success, latency=None, reason=None):
+    """
+    Record the outcome of a real API call as a passive health signal
+
+    Args:
+        replica_id: Replica the call was sent to
+        success: Whether the call succeeded
+        latency: Call duration in seconds
+        reason: Failure reason, if any
+    """
+    _store.record(replica_id, success, latency, reason, passive=True)
 
 def check_health_now():
     """
-    Perform an immediate health check and update session state
-    
+    Perform an immediate health check and publish the result
+
     Returns:
-        Current health status
+        Current health status (False if the backend is down)
     """
-    is_healthy = check_health()
-    st.session_state.health_status = is_healthy
-    return is_healthy
\ No newline at end of file
+    return _monitor.probe(force=True) != DOWN
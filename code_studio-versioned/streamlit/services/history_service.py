@@ -42,6 +42,12 @@ def load_history():
         logger.error(f"Error loading history: {str(e)}")
         return {"conversations": {}}
 
+def _json_default(value):
+    """Serialize values json doesn't know about (e.g. lazily decoded context)"""
+    if hasattr(value, "to_json_value"):
+        return value.to_json_value()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
 def save_history(history):
     """
     Save chat history to the JSON file
@@ -53,7 +59,7 @@ def save_history(history):
     
     try:
         with open(HISTORY_FILE, "w") as f:
-            json.dump(history, f, indent=2)
+            json.dump(history, f, indent=2, default=_json_default)
     except Exception as e:
         logger.error(f"Error saving history: {str(e)}")
 
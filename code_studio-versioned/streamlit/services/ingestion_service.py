@@ -0,0 +1,618 @@
+#ingestion_service.py
+"""
+Background knowledge bank ingestion jobs.
+
+Uploads are staged to disk and handed to a small thread pool, so the
+page that submits them returns at once. Each job goes through
+queued -> extracting -> uploading -> embedding -> indexed (or failed);
+its record is persisted as JSON next to the staged files and survives
+app restarts. A failed job is retried from where it stopped: files that
+were uploaded, and a batch the backend already accepted, are not sent
+again, and only the chunks the backend failed to embed are re-embedded.
+
+Documents are hashed when submitted and chunked by content. Files this
+app already uploaded unchanged are skipped before extraction (see
+kb_manifest). Backends configured with docs_backend_protocol = "chunks"
+keep the manifest themselves, and for changed files only the chunks they
+lack are sent and embedded (see upload_service.ChunkDeduplicator).
+
+Runs outside the Streamlit script thread: nothing here touches
+st.session_state. Documents extracted by a job are picked up by the UI
+with take_job_documents().
+"""
+import contextlib
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+from utils.settings import get_settings
+from utils.document_index import DocumentIndex, chunk_by_content, get_embedder
+from services.api_service import request_backend
+from services.extraction_cache import file_digest
+from services.kb_manifest import chunk_hash, get_kb_manifest
+from services.upload_service import (
+    PROTOCOL_CHUNKS,
+    PROTOCOL_LEGACY,
+    PROTOCOL_UPLOADS,
+    ChunkDeduplicator,
+    ChunkedUploader,
+    ChunkedUploadUnsupported,
+    UploadError,
+    configured_protocol,
+    legacy_update,
+    spool_text,
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_EXTRACTING = "extracting"
+JOB_UPLOADING = "uploading"
+JOB_EMBEDDING = "embedding"
+JOB_INDEXED = "indexed"
+JOB_FAILED = "failed"
+ACTIVE_JOB_STATES = (JOB_QUEUED, JOB_EXTRACTING, JOB_UPLOADING, JOB_EMBEDDING)
+
+# File states within a job
+FILE_PENDING = "pending"
+FILE_UPLOADED = "uploaded"
+FILE_UNCHANGED = "unchanged"
+FILE_SKIPPED = "skipped"
+FILE_FAILED = "failed"
+# Files with nothing left to send
+FILE_DONE_STATES = (FILE_UPLOADED, FILE_UNCHANGED)
+
+# Share of the progress bar for extraction and upload; embedding gets the rest
+TRANSFER_PROGRESS_SHARE = 0.6
+
+RECORD_FILE = "job.json"
+
+
+class IngestionError(Exception):
+    """Raised inside a job when a step fails; the job is marked failed and can be retried"""
+
+
+@dataclass
+class FileRecord:
+    filename: str
+    size: int
+    staged_path: str
+    doc_hash: str = ""
+    state: str = FILE_PENDING
+    upload_id: Optional[str] = None
+    chunks_sent: Optional[int] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class IngestionJob:
+    job_id: str
+    session_id: str
+    files: List[FileRecord]
+    state: str = JOB_QUEUED
+    progress: float = 0.0
+    message: str = ""
+    error: Optional[str] = None
+    # Replica holding the partial uploads and the backend ingestion task
+    replica_id: Optional[str] = None
+    protocol: str = ""
+    # Backend ingestion task, for backends that embed asynchronously
+    task_id: Optional[str] = None
+    failed_chunks: List[Any] = field(default_factory=list)
+    attempts: int = 0
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def active(self) -> bool:
+        return self.state in ACTIVE_JOB_STATES
+
+    @property
+    def file_names(self) -> List[str]:
+        return [f.filename for f in self.files]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "IngestionJob":
+        data = dict(data)
+        data["files"] = [FileRecord(**f) for f in data.get("files", [])]
+        return cls(**data)
+
+
+@contextlib.contextmanager
+def _mapped(path: str):
+    """Staged file contents as a read-only buffer, paged in by the OS rather than copied"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
+
+
+class IngestionManager:
+    """
+    Queues ingestion jobs, runs them on background threads and persists their records.
+    """
+
+    def __init__(self, directory: str, workers: int = 1):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, IngestionJob] = {}
+        # job_id -> documents extracted but not yet taken by the UI (not persisted)
+        self._documents: Dict[str, List[DocumentIndex]] = {}
+        self._extracted: Dict[str, set] = {}
+        # job_id -> filename -> ordered chunk hashes, for the manifest
+        self._chunk_hashes: Dict[str, Dict[str, List[str]]] = {}
+        self._saved_at: Dict[str, float] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingest")
+        self._load()
+
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.directory, job_id)
+
+    def _load(self):
+        """Read persisted job records; jobs cut short by a restart are marked failed"""
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name, RECORD_FILE)
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    job = IngestionJob.from_dict(json.load(f))
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning(f"Skipping unreadable ingestion job record {path}: {str(e)}")
+                continue
+            if job.active:
+                job.state = JOB_FAILED
+                job.error = "Interrupted by an app restart"
+                self._save(job)
+            self._jobs[job.job_id] = job
+
+    def _save(self, job: IngestionJob, force: bool = True):
+        """Write a job record atomically (progress-only updates at most once a second)"""
+        now = time.time()
+        if not force and now - self._saved_at.get(job.job_id, 0.0) < 1.0:
+            return
+        self._saved_at[job.job_id] = now
+
+        path = os.path.join(self._job_dir(job.job_id), RECORD_FILE)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(job.to_dict(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not save ingestion job {job.job_id}: {str(e)}")
+
+    def _update(self, job: IngestionJob, **changes):
+        state_changed = "state" in changes and changes["state"] != job.state
+        for name, value in changes.items():
+            setattr(job, name, value)
+        job.updated_at = time.time()
+        self._save(job, force=state_changed or "error" in changes)
+
+    def submit(self, files, session_id: str) -> IngestionJob:
+        """
+        Stage uploaded files to disk and queue them for ingestion
+
+        Args:
+            files: Uploaded files (already checked with validate_uploads)
+            session_id: Session that owns the job
+
+        Returns:
+            The queued job
+        """
+        job_id = uuid.uuid4().hex
+        staging = os.path.join(self._job_dir(job_id), "files")
+        os.makedirs(staging, exist_ok=True)
+
+        records = []
+        for i, file in enumerate(files):
+            path = os.path.join(staging, str(i))
+            data = file.getbuffer()
+            with open(path, "wb") as f:
+                f.write(data)
+            records.append(FileRecord(file.name, file.size, path, doc_hash=file_digest(data)))
+
+        job = IngestionJob(job_id, session_id, records)
+        with self._lock:
+            self._jobs[job_id] = job
+        self._save(job)
+        self._prune()
+        self._executor.submit(self._run, job_id)
+        return job
+
+    def retry(self, job_id: str) -> bool:
+        """
+        Run a failed job again from where it stopped
+
+        Returns:
+            True if the job was queued again
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state != JOB_FAILED:
+                return False
+            for record in job.files:
+                if record.state == FILE_FAILED:
+                    record.state, record.error = FILE_PENDING, None
+            self._update(job, state=JOB_QUEUED, error=None, message="Retrying")
+        self._executor.submit(self._run, job_id)
+        return True
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    def jobs_for(self, session_id: str) -> List[IngestionJob]:
+        """Jobs of a session, newest first"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.session_id == session_id]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def take_documents(self, job_id: str) -> List[DocumentIndex]:
+        """Documents the job extracted since the last call, for the session's document library"""
+        with self._lock:
+            return self._documents.pop(job_id, [])
+
+    def all_extracted(self, job_id: str) -> bool:
+        """Whether every file of the job has been extracted in this process"""
+        job = self._jobs.get(job_id)
+        extracted = self._extracted.get(job_id, set())
+        return job is not None and all(f.filename in extracted or f.state == FILE_SKIPPED for f in job.files)
+
+    def _prune(self):
+        """Drop the oldest finished job records beyond ingestion_max_records"""
+        limit = get_settings().ingestion_max_records
+        with self._lock:
+            finished = sorted((job for job in self._jobs.values() if not job.active),
+                              key=lambda job: job.created_at)
+            excess = len(self._jobs) - limit
+            removed = finished[:max(0, excess)]
+            for job in removed:
+                del self._jobs[job.job_id]
+                self._documents.pop(job.job_id, None)
+                self._extracted.pop(job.job_id, None)
+                self._chunk_hashes.pop(job.job_id, None)
+                self._saved_at.pop(job.job_id, None)
+        for job in removed:
+            shutil.rmtree(self._job_dir(job.job_id), ignore_errors=True)
+
+    def _run(self, job_id: str):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        job.attempts += 1
+        try:
+            legacy_spools = self._extract_and_upload(job)
+            try:
+                self._commit(job, legacy_spools)
+            finally:
+                for s in legacy_spools:
+                    s["spool"].close()
+            self._wait_for_embedding(job)
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {str(e)}")
+            self._update(job, state=JOB_FAILED, error=str(e), message="")
+            return
+
+        self._record_manifest(job)
+        sent = [f.chunks_sent for f in job.files if f.chunks_sent is not None]
+        message = f"{sum(sent)} new chunks" if sent else ""
+        self._update(job, state=JOB_INDEXED, progress=1.0, message=message, failed_chunks=[])
+        # The staged uploads are not needed once the backend has indexed them
+        shutil.rmtree(os.path.join(self._job_dir(job_id), "files"), ignore_errors=True)
+
+    def _find_unchanged(self, job: IngestionJob, records: List[FileRecord]):
+        """Mark files the knowledge bank already holds, and settle which protocol the backend speaks"""
+        pending = [f for f in records if f.state == FILE_PENDING]
+        if job.protocol == "":
+            job.protocol = configured_protocol()
+        unchanged = None
+        if pending and job.protocol == PROTOCOL_CHUNKS:
+            deduplicator = ChunkDeduplicator(job.replica_id)
+            unchanged = deduplicator.lookup([(f.filename, f.doc_hash) for f in pending])
+            job.replica_id = deduplicator.replica_id
+            if unchanged is None:
+                logger.info("Docs backend has no /kb endpoints; uploading whole texts")
+                job.protocol = PROTOCOL_UPLOADS
+        if unchanged is None:
+            # The backend keeps no manifest: go by what this app uploaded before
+            manifest = get_kb_manifest()
+            unchanged = {f.filename for f in pending if manifest.is_current(f.filename, f.doc_hash)}
+        for record in pending:
+            if record.filename in unchanged:
+                record.state = FILE_UNCHANGED
+
+    def _extract_and_upload(self, job: IngestionJob) -> List[Dict[str, Any]]:
+        """
+        Extract and upload the files not done yet, a group of extraction_workers at a time
+
+        Returns:
+            Spooled texts to send in one request, if the backend has no chunked uploads
+        """
+        # Imported here so that the sidebar, which lists jobs, does not load
+        # the extraction worker pool machinery at startup
+        from services.extraction_service import extract_documents
+
+        settings = get_settings()
+        extracted = self._extracted.setdefault(job.job_id, set())
+        chunk_hashes = self._chunk_hashes.setdefault(job.job_id, {})
+        legacy_spools: List[Dict[str, Any]] = []
+
+        todo = [f for f in job.files
+                if f.state != FILE_SKIPPED and (f.state not in FILE_DONE_STATES or f.filename not in extracted)]
+        self._find_unchanged(job, todo)
+        uploader = ChunkedUploader(job.replica_id)
+        deduplicator = ChunkDeduplicator(job.replica_id)
+        total = len(job.files)
+        done = total - len(todo)
+
+        def report(fraction: float, message: str, state: str):
+            progress = TRANSFER_PROGRESS_SHARE * (done + fraction) / total
+            self._update(job, state=state, progress=progress, message=message)
+
+        group_size = max(1, settings.extraction_workers)
+        for start in range(0, len(todo), group_size):
+            group = todo[start:start + group_size]
+            # Unchanged files are still extracted (an extraction cache hit) so
+            # that they can be queried in this session; nothing is sent for them
+            report(0.0, f"Extracting {', '.join(f.filename for f in group)}", JOB_EXTRACTING)
+            with contextlib.ExitStack() as stack:
+                data = [(f.filename, stack.enter_context(_mapped(f.staged_path))) for f in group]
+                results = extract_documents(
+                    data,
+                    on_progress=lambda name, pages_done, pages_total: report(
+                        0.5 * pages_done / (pages_total or 1) / len(group),
+                        f"Extracting {name}: page {pages_done} of {pages_total}", JOB_EXTRACTING),
+                )
+
+            for record, result in zip(group, results):
+                if result.unsupported:
+                    record.state = FILE_SKIPPED
+                    done += 1
+                    continue
+                if not result.success:
+                    record.state, record.error = FILE_FAILED, result.error
+                    done += 1
+                    continue
+
+                # Content-defined chunks: unchanged parts of an updated
+                # document chunk, and hash, exactly as in the version before
+                chunks = chunk_by_content(result.text, settings.doc_chunk_tokens)
+                hashes = [chunk_hash(chunk.text) for chunk in chunks]
+                chunk_hashes[record.filename] = hashes
+                document = DocumentIndex(chunks, get_embedder(), source=record.filename)
+                with self._lock:
+                    self._documents.setdefault(job.job_id, []).append(document)
+                extracted.add(record.filename)
+                if record.state in FILE_DONE_STATES:
+                    done += 1
+                    continue
+
+                try:
+                    if job.protocol == PROTOCOL_CHUNKS:
+                        record.chunks_sent = deduplicator.sync(
+                            record.filename, record.doc_hash, list(zip(hashes, (c.text for c in chunks))),
+                            lambda sent, missing, name=record.filename: report(
+                                0.5 + 0.5 * sent / (missing or 1), f"Uploading {name}: {sent} new chunks",
+                                JOB_UPLOADING),
+                        )
+                        record.state = FILE_UPLOADED
+                    else:
+                        legacy_spool = self._upload_text(job, record, uploader, result.text, report)
+                        if legacy_spool is not None:
+                            legacy_spools.append(legacy_spool)
+                except UploadError as e:
+                    record.state, record.error = FILE_FAILED, str(e)
+                finally:
+                    job.replica_id = deduplicator.replica_id if job.protocol == PROTOCOL_CHUNKS else uploader.replica_id
+                result.text = None
+                done += 1
+                self._save(job)
+
+        failed = [f"{f.filename} ({f.error})" for f in job.files if f.state == FILE_FAILED]
+        if failed:
+            for s in legacy_spools:
+                s["spool"].close()
+            raise IngestionError(f"Could not ingest {', '.join(failed)}")
+        if not any(f.state in FILE_DONE_STATES for f in job.files) and not legacy_spools:
+            raise IngestionError("None of the files contained extractable text.")
+        return legacy_spools
+
+    def _upload_text(self, job: IngestionJob, record: FileRecord, uploader: ChunkedUploader,
+                     text: str, report) -> Optional[Dict[str, Any]]:
+        """
+        Upload a whole extracted text, for backends without the chunk manifest
+
+        Returns:
+            The spooled text if it has to go in the single legacy request, else None
+        """
+        spool, size, digest = spool_text(text)
+        if job.protocol == PROTOCOL_UPLOADS:
+            try:
+                record.upload_id = uploader.upload(
+                    record.filename, spool, size, digest,
+                    lambda sent, size, name=record.filename: report(
+                        0.5 + 0.5 * sent / (size or 1), f"Uploading {name}", JOB_UPLOADING),
+                )
+                record.state = FILE_UPLOADED
+                spool.close()
+                return None
+            except ChunkedUploadUnsupported:
+                logger.info("Docs backend has no chunked uploads; falling back to a single update_kb POST")
+                job.protocol = PROTOCOL_LEGACY
+            except Exception:
+                spool.close()
+                raise
+        return {"filename": record.filename, "spool": spool, "size": size}
+
+    def _commit(self, job: IngestionJob, legacy_spools: List[Dict[str, Any]]):
+        """Add the uploaded files to the knowledge bank (once per job)"""
+        if job.task_id is not None:
+            return
+        uploaded = [f for f in job.files if f.state == FILE_UPLOADED]
+        if not uploaded and not legacy_spools:
+            # Every file was already in the knowledge bank
+            self._update(job, task_id="")
+            return
+
+        self._update(job, state=JOB_EMBEDDING, progress=TRANSFER_PROGRESS_SHARE, message="Embedding")
+        if legacy_spools:
+            result = legacy_update(legacy_spools)
+            # Accepted by the backend: nothing left to send for these files
+            legacy_names = {s["filename"] for s in legacy_spools}
+            for record in job.files:
+                if record.filename in legacy_names and record.state == FILE_PENDING:
+                    record.state = FILE_UPLOADED
+        elif job.protocol == PROTOCOL_CHUNKS:
+            deduplicator = ChunkDeduplicator(job.replica_id)
+            result = deduplicator.commit([(f.filename, f.doc_hash) for f in uploaded])
+            job.replica_id = deduplicator.replica_id
+        else:
+            uploader = ChunkedUploader(job.replica_id)
+            result = uploader.commit([(f.filename, f.upload_id) for f in uploaded])
+            job.replica_id = uploader.replica_id
+        # Synchronous backends are done when update_kb returns
+        task_id = result.get("task_id") if isinstance(result, dict) else None
+        self._update(job, task_id=task_id or "")
+
+    def _record_manifest(self, job: IngestionJob):
+        """Remember the versions of the documents now in the knowledge bank"""
+        manifest = get_kb_manifest()
+        hashes = self._chunk_hashes.get(job.job_id, {})
+        for record in job.files:
+            if record.state in FILE_DONE_STATES:
+                manifest.record(record.filename, record.doc_hash, hashes.get(record.filename))
+
+    def _wait_for_embedding(self, job: IngestionJob):
+        """
+        Follow the backend ingestion task until it is indexed
+
+        Status API: GET /ingestion/<task_id> returns {state, progress, failed_chunks, error};
+        POST /ingestion/<task_id>/retry {chunks} re-embeds only the given chunks.
+        Legacy backends have no status API: they are done when update_kb returns.
+        """
+        if not job.task_id or job.protocol == PROTOCOL_LEGACY:
+            return
+        settings = get_settings()
+        self._update(job, state=JOB_EMBEDDING, message="Embedding")
+
+        if job.failed_chunks:
+            response, job.replica_id = request_backend(
+                "docs", "POST", f"/ingestion/{job.task_id}/retry", settings.request_timeout,
+                replica_id=job.replica_id, json={"chunks": job.failed_chunks})
+            if response.status_code != 200:
+                raise IngestionError(f"Could not retry failed chunks: HTTP {response.status_code}")
+            self._update(job, failed_chunks=[])
+
+        deadline = time.monotonic() + settings.ingestion_timeout
+        while True:
+            response, job.replica_id = request_backend(
+                "docs", "GET", f"/ingestion/{job.task_id}", settings.request_timeout, replica_id=job.replica_id)
+            if response.status_code == 404:
+                # No status API: the backend gave no way to wait, so trust update_kb
+                return
+            if response.status_code != 200:
+                raise IngestionError(f"Could not get ingestion status: HTTP {response.status_code}")
+
+            status = response.json() or {}
+            failed_chunks = status.get("failed_chunks") or []
+            fraction = float(status.get("progress") or 0.0)
+            self._update(job, progress=TRANSFER_PROGRESS_SHARE + (1 - TRANSFER_PROGRESS_SHARE) * min(fraction, 1.0))
+
+            if status.get("state") in (JOB_INDEXED, JOB_FAILED):
+                if failed_chunks or status.get("state") == JOB_FAILED:
+                    self._update(job, failed_chunks=failed_chunks)
+                    reason = status.get("error") or f"{len(failed_chunks)} chunks could not be embedded"
+                    raise IngestionError(reason)
+                return
+            if time.monotonic() > deadline:
+                raise IngestionError("Timed out waiting for the knowledge bank to index the documents")
+            time.sleep(settings.ingestion_poll_interval)
+
+
+_manager: Optional[IngestionManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_ingestion_manager() -> IngestionManager:
+    """Get the process-wide ingestion manager"""
+    from utils.constants import DATA_DIR
+
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            settings = get_settings()
+            directory = settings.ingestion_dir or os.path.join(DATA_DIR, "ingestion_jobs")
+            _manager = IngestionManager(directory, settings.ingestion_workers)
+        return _manager
+
+
+def submit_ingestion(files, session_id: str) -> IngestionJob:
+    """Queue uploaded files for background ingestion into the knowledge bank"""
+    return get_ingestion_manager().submit(files, session_id)
+
+
+def retry_ingestion(job_id: str) -> bool:
+    """Retry a failed ingestion job without resubmitting what already succeeded"""
+    return get_ingestion_manager().retry(job_id)
+
+
+def get_session_jobs(session_id: str) -> List[IngestionJob]:
+    """Ingestion jobs of a session, newest first"""
+    return get_ingestion_manager().jobs_for(session_id)
+
+
+def get_job_status(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Status of an ingestion job
+
+    Args:
+        job_id: Job ID
+
+    Returns:
+        The job record as a dictionary, or None if unknown
+    """
+    job = get_ingestion_manager().get(job_id)
+    return job.to_dict() if job is not None else None
+
+
+def take_job_documents(job_id: str) -> List[DocumentIndex]:
+    """Documents extracted by a job since the last call"""
+    return get_ingestion_manager().take_documents(job_id)
+
+
+def can_delete_kb_documents() -> bool:
+    """Whether the docs backend is configured with the /kb endpoints that delete documents"""
+    return configured_protocol() == PROTOCOL_CHUNKS
+
+
+def delete_kb_document(filename: str):
+    """
+    Remove a document from the knowledge bank and the local manifest
+
+    Raises:
+        UploadError: If the backend cannot delete documents
+    """
+    if not can_delete_kb_documents() or not ChunkDeduplicator().delete(filename):
+        raise UploadError("The knowledge bank backend does not support deleting documents yet.")
+    orphaned = get_kb_manifest().remove(filename)
+    logger.info(f"Deleted {filename} from the knowledge bank ({len(orphaned)} chunks no longer used)")
@@ -0,0 +1,138 @@
+#kb_manifest.py
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def chunk_hash(text: str) -> str:
+    """
+    Content hash of a chunk, insensitive to whitespace changes
+
+    Args:
+        text: Chunk text
+
+    Returns:
+        SHA-256 hex digest of the whitespace-normalized text
+    """
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+class KnowledgeBankManifest:
+    """
+    Local record of the documents this app added to the knowledge bank.
+
+    Maps each file name to the hash of the uploaded file and the ordered
+    hashes of its chunks. An upload of a file whose hash is unchanged is
+    skipped outright, and a delete knows which chunks no other document
+    still uses.
+
+    A docs backend configured with the /kb endpoints (docs_backend_protocol
+    "chunks", see upload_service.ChunkDeduplicator) keeps the authoritative
+    manifest; this one is what the app goes by, and what it shows, otherwise.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._documents: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """Read the manifest on first use (lock must be held)"""
+        if self._documents is None:
+            self._documents = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._documents = json.load(f).get("documents", {})
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Could not read knowledge bank manifest {self.path}: {str(e)}")
+        return self._documents
+
+    def _save(self):
+        """Write the manifest atomically (lock must be held)"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"documents": self._documents}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save knowledge bank manifest {self.path}: {str(e)}")
+
+    def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._load().get(filename)
+            return dict(entry) if entry is not None else None
+
+    def is_current(self, filename: str, doc_hash: str) -> bool:
+        """Whether the knowledge bank already holds exactly this version of the file"""
+        entry = self.get(filename)
+        return entry is not None and entry.get("doc_hash") == doc_hash
+
+    def _referenced(self, exclude: str) -> set:
+        return {h for name, entry in self._load().items() if name != exclude for h in entry.get("chunks", [])}
+
+    def record(self, filename: str, doc_hash: str, chunk_hashes: Optional[Sequence[str]] = None):
+        """
+        Record the version of a document now in the knowledge bank
+
+        Args:
+            filename: Document name
+            doc_hash: SHA-256 of the uploaded file
+            chunk_hashes: Ordered chunk hashes, or None to keep the recorded ones
+        """
+        with self._lock:
+            documents = self._load()
+            entry = documents.get(filename, {})
+            if chunk_hashes is None:
+                chunk_hashes = entry.get("chunks", []) if entry.get("doc_hash") == doc_hash else []
+            documents[filename] = {"doc_hash": doc_hash, "chunks": list(chunk_hashes), "updated_at": time.time()}
+            self._save()
+
+    def remove(self, filename: str) -> List[str]:
+        """
+        Forget a document
+
+        Returns:
+            Hashes of its chunks that no other document uses
+        """
+        with self._lock:
+            documents = self._load()
+            entry = documents.pop(filename, None)
+            if entry is None:
+                return []
+            orphaned = sorted(set(entry.get("chunks", [])) - self._referenced(filename))
+            self._save()
+            return orphaned
+
+    def documents(self) -> List[Dict[str, Any]]:
+        """Recorded documents, most recently updated first"""
+        with self._lock:
+            entries = [{"filename": name, "chunk_count": len(entry.get("chunks", [])), **entry}
+                       for name, entry in self._load().items()]
+        for entry in entries:
+            entry.pop("chunks", None)
+        return sorted(entries, key=lambda entry: entry.get("updated_at", 0), reverse=True)
+
+
+_manifest: Optional[KnowledgeBankManifest] = None
+_manifest_lock = threading.Lock()
+
+
+def get_kb_manifest() -> KnowledgeBankManifest:
+    """Get the process-wide knowledge bank manifest (data/kb_manifest.json)"""
+    from utils.constants import DATA_DIR
+
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = KnowledgeBankManifest(os.path.join(DATA_DIR, "kb_manifest.json"))
+        return _manifest
@@ -0,0 +1,257 @@
+#rate_limiter.py
+import threading
+import time
+import logging
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Buckets unused for this long are dropped to keep memory bounded
+BUCKET_IDLE_EXPIRY = 3600
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request is throttled by a quota or the fair queue"""
+
+    def __init__(self, reason: str, retry_after: float = 0.0):
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(reason)
+
+    @property
+    def user_message(self) -> str:
+        """Message suitable for showing in the chat"""
+        if self.retry_after > 0:
+            return f"⏳ {self.reason} Please try again in {max(1, round(self.retry_after))} seconds."
+        return f"⏳ {self.reason} Please try again shortly."
+
+
+class TokenBucket:
+    """Classic token bucket: 'rate' tokens per second, holding at most 'capacity'"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def peek(self, now: float) -> float:
+        """Seconds until one token is available (0 if available now)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class FairScheduler:
+    """
+    Bounds the number of concurrent backend calls for the whole process and
+    hands free slots to waiting sessions in round-robin order, so a session
+    with many queued requests cannot starve the others.
+    """
+
+    def __init__(self, max_concurrent: int, max_queued_per_session: int):
+        self.max_concurrent = max_concurrent
+        self.max_queued_per_session = max_queued_per_session
+        self._cond = threading.Condition()
+        self._active = 0
+        # session_id -> waiting tickets; order of keys is the round-robin order
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._granted = 0
+        self._rejected = 0
+        self._max_wait = 0.0
+
+    def _is_next(self, session_id: str, ticket: object) -> bool:
+        head_session = next(iter(self._queues))
+        return head_session == session_id and self._queues[session_id][0] is ticket
+
+    @contextmanager
+    def slot(self, session_id: str, timeout: float):
+        """
+        Wait for a backend call slot on behalf of a session
+
+        Args:
+            session_id: ID of the requesting session
+            timeout: Maximum number of seconds to wait in the queue
+
+        Raises:
+            RateLimitExceeded: If the session's queue is full or the wait times out
+        """
+        ticket = object()
+        started = time.monotonic()
+        deadline = started + timeout
+
+        with self._cond:
+            queue = self._queues.setdefault(session_id, deque())
+            if len(queue) >= self.max_queued_per_session:
+                if not queue:
+                    del self._queues[session_id]
+                self._rejected += 1
+                raise RateLimitExceeded("You already have several requests waiting.")
+            queue.append(ticket)
+
+            while not (self._active < self.max_concurrent and self._is_next(session_id, ticket)):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    queue.remove(ticket)
+                    if not queue:
+                        del self._queues[session_id]
+                    self._rejected += 1
+                    self._cond.notify_all()
+                    raise RateLimitExceeded("The assistant is busy right now.")
+                self._cond.wait(remaining)
+
+            # Granted: dequeue and move this session to the back of the rotation
+            queue.popleft()
+            if queue:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            self._active += 1
+            self._granted += 1
+            self._max_wait = max(self._max_wait, time.monotonic() - started)
+            # The next session in rotation may be able to start too
+            self._cond.notify_all()
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "active": self._active,
+                "max_concurrent": self.max_concurrent,
+                "queue_depth": sum(len(q) for q in self._queues.values()),
+                "queued_sessions": len(self._queues),
+                "queue_depth_by_session": {sid: len(q) for sid, q in self._queues.items()},
+                "granted": self._granted,
+                "rejected": self._rejected,
+                "max_wait_seconds": round(self._max_wait, 3),
+            }
+
+
+class RateLimiter:
+    """
+    Process-wide request limiter: per-user and per-session token buckets in
+    front of a fair scheduler for backend calls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._throttled = 0
+        self._last_prune = time.monotonic()
+        self.scheduler: Optional[FairScheduler] = None
+
+    def _bucket(self, kind: str, key: str, per_minute: float, burst: int) -> TokenBucket:
+        bucket = self._buckets.get((kind, key))
+        rate = per_minute / 60.0
+        if bucket is None:
+            bucket = self._buckets[(kind, key)] = TokenBucket(rate, burst)
+        else:
+            # Pick up quota changes from settings
+            bucket.rate, bucket.capacity = rate, burst
+        return bucket
+
+    def _prune(self, now: float):
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        expired = [k for k, b in self._buckets.items() if now - b.updated > BUCKET_IDLE_EXPIRY]
+        for k in expired:
+            del self._buckets[k]
+
+    def check(self, user_id: str, session_id: str):
+        """
+        Consume one request from the user's and the session's quota
+
+        Args:
+            user_id: ID of the user
+            session_id: ID of the Streamlit session
+
+        Raises:
+            RateLimitExceeded: If either quota is exhausted
+        """
+        from utils.settings import get_settings
+        settings = get_settings()
+
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            user_bucket = self._bucket("user", user_id, settings.rate_limit_user_per_minute,
+                                       settings.rate_limit_user_burst)
+            session_bucket = self._bucket("session", session_id, settings.rate_limit_session_per_minute,
+                                          settings.rate_limit_session_burst)
+
+            # Only consume when both quotas allow it
+            wait = max(user_bucket.peek(now), session_bucket.peek(now))
+            if wait > 0:
+                self._throttled += 1
+                logger.info(f"Throttled session {session_id} of user {user_id} for {wait:.1f}s")
+                raise RateLimitExceeded("You're sending messages too quickly.", retry_after=wait)
+
+            user_bucket.take()
+            session_bucket.take()
+
+    def backend_slot(self, session_id: str):
+        """
+        Context manager holding a fair-queued backend call slot for a session
+
+        Args:
+            session_id: ID of the Streamlit session
+        """
+        from utils.settings import get_settings
+        settings = get_settings()
+
+        with self._lock:
+            if self.scheduler is None:
+                self.scheduler = FairScheduler(settings.max_concurrent_backend_calls,
+                                               settings.max_queued_per_session)
+            else:
+                self.scheduler.max_concurrent = settings.max_concurrent_backend_calls
+                self.scheduler.max_queued_per_session = settings.max_queued_per_session
+            scheduler = self.scheduler
+
+        return scheduler.slot(session_id, settings.backend_queue_timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Get limiter and queue metrics
+
+        Returns:
+            Dictionary with throttle counts and queue-depth figures
+        """
+        with self._lock:
+            metrics = {
+                "throttled": self._throttled,
+                "tracked_buckets": len(self._buckets),
+            }
+            scheduler = self.scheduler
+        if scheduler is not None:
+            metrics.update(scheduler.metrics())
+        return metrics
+
+
+_rate_limiter = RateLimiter()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the process-wide rate limiter shared by all sessions"""
+    return _rate_limiter
@@ -0,0 +1,263 @@
+#replica_pool.py
+import random
+import threading
+import time
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STRATEGY_LEAST_OUTSTANDING = "least_outstanding"
+STRATEGY_EWMA = "ewma"
+
+
+class Replica:
+    """Bookkeeping for a single backend webapp replica"""
+
+    def __init__(self, replica_id: str):
+        self.replica_id = replica_id
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.last_failure_reason: Optional[str] = None
+
+    def is_available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            "replica_id": self.replica_id,
+            "outstanding": self.outstanding,
+            "ewma_latency": self.ewma_latency,
+            "consecutive_failures": self.consecutive_failures,
+            "ejected": not self.is_available(now),
+            "ejected_for": max(0.0, self.ejected_until - now),
+            "last_failure_reason": self.last_failure_reason,
+        }
+
+
+class ReplicaPool:
+    """
+    Client-side load balancer over a set of backend webapp replicas.
+
+    Replicas are picked either by fewest outstanding requests or by EWMA
+    latency weighted by load. A replica is ejected for a cooldown period
+    after repeated failures (or when the health checker reports it down)
+    and is automatically retried once the cooldown expires.
+    """
+
+    def __init__(self, name: str, replica_ids: Iterable[str],
+                 strategy: str = STRATEGY_LEAST_OUTSTANDING,
+                 eject_after_failures: int = 3,
+                 eject_seconds: float = 30.0,
+                 ewma_alpha: float = 0.3):
+        self.name = name
+        self.strategy = strategy
+        self.eject_after_failures = eject_after_failures
+        self.eject_seconds = eject_seconds
+        self.ewma_alpha = ewma_alpha
+        self._lock = threading.Lock()
+        self._replicas: Dict[str, Replica] = {}
+        self.update_replicas(replica_ids)
+
+    def update_replicas(self, replica_ids: Iterable[str]):
+        """
+        Replace the set of replicas, keeping stats for replicas that remain
+
+        Args:
+            replica_ids: Webapp IDs or backend URLs of the replicas
+        """
+        with self._lock:
+            replicas = {}
+            for replica_id in replica_ids:
+                replicas[replica_id] = self._replicas.get(replica_id) or Replica(replica_id)
+            if not replicas:
+                raise ValueError(f"Replica pool '{self.name}' needs at least one replica")
+            self._replicas = replicas
+
+    @property
+    def replica_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._replicas)
+
+    def is_ejected(self, replica_id: str) -> bool:
+        """Whether a replica is currently out of rotation"""
+        with self._lock:
+            replica = self._replicas.get(replica_id)
+            return replica is not None and not replica.is_available(time.monotonic())
+
+    def _score(self, replica: Replica) -> tuple:
+        if self.strategy == STRATEGY_EWMA:
+            # Unknown latency scores as 0 so new replicas get probed by real traffic
+            latency = replica.ewma_latency or 0.0
+            return (latency * (replica.outstanding + 1), replica.outstanding)
+        return (replica.outstanding, replica.ewma_latency or 0.0)
+
+    def acquire(self, replica_id: Optional[str] = None) -> Replica:
+        """
+        Pick a replica for the next request and count it as outstanding.
+
+        Every call must be paired with release().
+
+        Args:
+            replica_id: Pin the request to this replica (e.g. for a multi-request
+                upload whose state lives on one replica)
+
+        Returns:
+            The selected replica
+        """
+        with self._lock:
+            if replica_id is not None and replica_id in self._replicas:
+                replica = self._replicas[replica_id]
+                replica.outstanding += 1
+                return replica
+
+            now = time.monotonic()
+            candidates = [r for r in self._replicas.values() if r.is_available(now)]
+            if not candidates:
+                # Everything is ejected: fail open on the replica that comes back first
+                candidates = [min(self._replicas.values(), key=lambda r: r.ejected_until)]
+
+            best_score = min(self._score(r) for r in candidates)
+            best = [r for r in candidates if self._score(r) == best_score]
+            replica = random.choice(best)
+            replica.outstanding += 1
+            return replica
+
+    def release(self, replica: Replica, success: bool,
+                latency: Optional[float] = None, reason: Optional[str] = None):
+        """
+        Record the outcome of a request made against an acquired replica
+
+        Args:
+            replica: Replica returned by acquire()
+            success: Whether the request succeeded
+            latency: Request duration in seconds
+            reason: Failure reason, if any
+        """
+        with self._lock:
+            replica.outstanding = max(0, replica.outstanding - 1)
+        self.record_result(replica.replica_id, success, latency, reason)
+
+    def record_result(self, replica_id: str, success: bool,
+                      latency: Optional[float] = None, reason: Optional[str] = None):
+        """
+        Update a replica's latency and failure stats
+
+        Args:
+            replica_id: ID of the replica
+            success: Whether the request or probe succeeded
+            latency: Duration in seconds
+            reason: Failure reason, if any
+        """
+        with self._lock:
+            replica = self._replicas.get(replica_id)
+            if replica is None:
+                return
+
+            if latency is not None:
+                if replica.ewma_latency is None:
+                    replica.ewma_latency = latency
+                else:
+                    replica.ewma_latency += self.ewma_alpha * (latency - replica.ewma_latency)
+
+            if success:
+                replica.consecutive_failures = 0
+                replica.ejected_until = 0.0
+                return
+
+            replica.consecutive_failures += 1
+            replica.last_failure_reason = reason
+            if replica.consecutive_failures >= self.eject_after_failures:
+                self._eject(replica, reason)
+
+    def mark_health(self, replica_id: str, healthy: bool,
+                    latency: Optional[float] = None, reason: Optional[str] = None):
+        """
+        Feed a health check result for a replica.
+
+        An unhealthy result ejects the replica immediately, a healthy one
+        puts it back into rotation.
+
+        Args:
+            replica_id: ID of the replica
+            healthy: Whether the health probe succeeded
+            latency: Probe duration in seconds
+            reason: Failure reason, if any
+        """
+        with self._lock:
+            replica = self._replicas.get(replica_id)
+            if replica is None:
+                return
+
+            if healthy:
+                if not replica.is_available(time.monotonic()):
+                    logger.info(f"Replica {replica_id} of pool '{self.name}' is healthy again")
+                replica.consecutive_failures = 0
+                replica.ejected_until = 0.0
+            else:
+                replica.last_failure_reason = reason
+                self._eject(replica, reason)
+
+        # Probe latency only says something about a live replica
+        if healthy and latency is not None:
+            self.record_result(replica_id, True, latency)
+
+    def _eject(self, replica: Replica, reason: Optional[str]):
+        """Take a replica out of rotation for eject_seconds (lock must be held)"""
+        now = time.monotonic()
+        if replica.is_available(now):
+            logger.warning(f"Ejecting replica {replica.replica_id} of pool '{self.name}': {reason}")
+        replica.ejected_until = now + self.eject_seconds
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """
+        Get the current state of every replica
+
+        Returns:
+            List of replica state dictionaries
+        """
+        with self._lock:
+            now = time.monotonic()
+            return [r.to_dict(now) for r in self._replicas.values()]
+
+
+_pools: Dict[str, ReplicaPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_replica_pool(kind: str) -> ReplicaPool:
+    """
+    Get the process-wide replica pool for a backend, in sync with settings
+
+    Args:
+        kind: "query" for the chat backend or "docs" for the document backend
+
+    Returns:
+        ReplicaPool for that backend
+    """
+    from utils.settings import get_settings
+
+    settings = get_settings()
+    if kind == "query":
+        replica_ids = settings.query_replicas
+    elif kind == "docs":
+        replica_ids = settings.docs_replicas
+    else:
+        raise ValueError(f"Unknown replica pool: {kind}")
+
+    with _pools_lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            pool = _pools[kind] = ReplicaPool(kind, replica_ids)
+
+        pool.strategy = settings.replica_selection
+        pool.eject_after_failures = settings.replica_eject_after_failures
+        pool.eject_seconds = settings.replica_eject_seconds
+        if pool.replica_ids != list(replica_ids):
+            pool.update_replicas(replica_ids)
+
+        return pool
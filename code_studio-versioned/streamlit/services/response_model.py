@@ -0,0 +1,200 @@
+#response_model.py
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+# Fast JSON decoders are optional; fall back to the standard library
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Errors raised by the available JSON decoders on malformed input
+_DECODE_ERRORS = (ValueError,) + ((msgspec.DecodeError,) if msgspec is not None else ())
+
+# Raw JSON payloads that carry no content
+_EMPTY_RAW = {b"", b'""', b"null", b"[]", b"{}"}
+
+
+def _loads(data):
+    """Decode JSON bytes (or any buffer) with the fastest available parser"""
+    if msgspec is not None:
+        return msgspec.json.decode(data)
+    if orjson is not None:
+        return orjson.loads(bytes(data) if not isinstance(data, (bytes, str)) else data)
+    return json.loads(bytes(data))
+
+
+class LazyContext:
+    """
+    Retrieved-context payload of a backend response.
+
+    Context can be large, so it is kept as the raw JSON bytes of the
+    response and only decoded the first time it is actually displayed.
+    """
+
+    __slots__ = ("_raw", "_value", "_decoded")
+
+    def __init__(self, raw=b"", value: Any = None, decoded: bool = False):
+        # raw may be bytes or a zero-copy view (msgspec.Raw) into the response body
+        self._raw = raw
+        self._value = value
+        self._decoded = decoded
+
+    @classmethod
+    def from_value(cls, value: Any) -> "LazyContext":
+        """Wrap an already decoded context value"""
+        return cls(value=value, decoded=True)
+
+    @property
+    def is_decoded(self) -> bool:
+        return self._decoded
+
+    @property
+    def value(self) -> Any:
+        """Decoded context (str, list or dict)"""
+        if not self._decoded:
+            self._value = _loads(self._raw) if self._raw else ""
+            self._decoded = True
+            self._raw = b""
+        return self._value
+
+    def __bool__(self) -> bool:
+        if self._decoded:
+            return bool(self._value)
+        return len(self._raw) > 4 or bytes(self._raw).strip() not in _EMPTY_RAW
+
+    def __str__(self) -> str:
+        value = self.value
+        if value is None:
+            return ""
+        if isinstance(value, str):
+            return value
+        return json.dumps(value, indent=2, ensure_ascii=False)
+
+    def __repr__(self) -> str:
+        state = "decoded" if self._decoded else f"{len(self._raw)} raw bytes"
+        return f"LazyContext({state})"
+
+    def to_json_value(self) -> Any:
+        """JSON-serializable form, used when persisting chat history"""
+        return self.value
+
+
+@dataclass
+class BackendResponse:
+    """
+    Normalized envelope for every backend call (chat, document query, docs upload)
+    """
+    success: bool
+    message: str = ""
+    context: LazyContext = field(default_factory=LazyContext)
+    combined_text: str = ""
+    result: Any = None
+    file_count: int = 0
+    status_code: Optional[int] = None
+    latency: Optional[float] = None
+
+    @classmethod
+    def error(cls, message: str, status_code: Optional[int] = None) -> "BackendResponse":
+        return cls(success=False, message=message, status_code=status_code)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dictionary form (decodes the context)"""
+        return {
+            "success": self.success,
+            "message": self.message,
+            "context": str(self.context) if self.context else "",
+            "combined_text": self.combined_text,
+            "result": self.result,
+            "file_count": self.file_count,
+            "status_code": self.status_code,
+            "latency": self.latency,
+        }
+
+
+if msgspec is not None:
+    class _Envelope(msgspec.Struct):
+        """Wire format of backend responses; context is left undecoded"""
+        success: bool = True
+        message: Any = None
+        answer: Any = None
+        context: Optional[msgspec.Raw] = None
+        combined_text: str = ""
+        result: Any = None
+        file_count: int = 0
+
+    _envelope_decoder = msgspec.json.Decoder(_Envelope)
+
+
+def _from_mapping(data: Dict[str, Any], status_code: int) -> BackendResponse:
+    """Build a response from a fully decoded JSON object"""
+    message = data.get("message", data.get("answer"))
+    return BackendResponse(
+        success=bool(data.get("success", True)),
+        message="" if message is None else str(message),
+        context=LazyContext.from_value(data.get("context", "")),
+        combined_text=data.get("combined_text", "") or "",
+        result=data.get("result"),
+        file_count=data.get("file_count", 0) or 0,
+        status_code=status_code,
+    )
+
+
+def parse_backend_response(body: bytes, status_code: int = 200) -> BackendResponse:
+    """
+    Decode a backend HTTP body straight into a BackendResponse.
+
+    With msgspec installed the body is decoded in a single pass into the
+    typed envelope and the context is kept as raw bytes. Otherwise orjson
+    (or json) is used and the context is wrapped already decoded.
+
+    Args:
+        body: Raw response body
+        status_code: HTTP status code of the response
+
+    Returns:
+        BackendResponse; non-200 responses are returned as failures
+    """
+    if status_code != 200:
+        text = body.decode("utf-8", errors="replace")
+        return BackendResponse.error(f"Error: {status_code} - {text}", status_code)
+
+    if msgspec is not None:
+        try:
+            envelope = _envelope_decoder.decode(body)
+            message = envelope.message if envelope.message is not None else envelope.answer
+            return BackendResponse(
+                success=envelope.success,
+                message="" if message is None else str(message),
+                context=LazyContext(envelope.context if envelope.context is not None else b""),
+                combined_text=envelope.combined_text,
+                result=envelope.result,
+                file_count=envelope.file_count,
+                status_code=status_code,
+            )
+        except msgspec.DecodeError:
+            # Not the expected object shape (ValidationError is a subclass);
+            # fall through to the generic path
+            pass
+
+    try:
+        data = _loads(body)
+    except _DECODE_ERRORS:
+        # Plain-text answers are returned as-is
+        return BackendResponse(success=True, message=body.decode("utf-8", errors="replace"),
+                               status_code=status_code)
+
+    if isinstance(data, dict):
+        return _from_mapping(data, status_code)
+    return BackendResponse(success=True, message=str(data), status_code=status_code)
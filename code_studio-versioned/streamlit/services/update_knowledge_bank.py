@@ -1,9 +1,8 @@
 import streamlit as st
 import base64
 import io
-from PyPDF2 import PdfReader
-from docx import Document
 import requests
+from utils.document_parsers import extract_text
 
 # Constants
 MAX_FILE_COUNT = 5
@@ -15,24 +14,8 @@ def get_file_extension(filename):
     return filename.lower().split('.')[-1]
 
 def extract_text_from_file(file):
-    file_extension = get_file_extension(file.name)
-
-    if file_extension == 'txt':
-        return file.read().decode('utf-8')
-
-    elif file_extension == 'pdf':
-        pdf_reader = PdfReader(file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-        return text
-
-    elif file_extension in ['docx', 'doc']:
-        doc = Document(file)
-        return "\n".join([para.text for para in doc.paragraphs])
-
-    else:
-        return None
+    # Same parsers as the app, so sections, tables and page numbers are kept
+    return extract_text(file.name, file.getvalue())
 
 def encode_to_base64(text):
     return base64.b64encode(text.encode('utf-8')).decode('utf-8')
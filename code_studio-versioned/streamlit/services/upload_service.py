@@ -0,0 +1,362 @@
+#upload_service.py
+import base64
+import hashlib
+import json
+import tempfile
+import time
+import logging
+from urllib.parse import quote
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from utils.settings import get_settings
+from utils.document_parsers import get_file_extension
+from services.api_service import request_backend
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Attempts per chunk before the upload is reported as failed (and resumable)
+UPLOAD_CHUNK_RETRIES = 3
+
+# How documents reach the knowledge bank, from newest to oldest backend
+PROTOCOL_CHUNKS = "chunks"      # content-addressed chunks (ChunkDeduplicator)
+PROTOCOL_UPLOADS = "uploads"    # whole texts, chunked resumable uploads (ChunkedUploader)
+PROTOCOL_LEGACY = "legacy"      # whole texts, one base64 JSON POST (legacy_update)
+PROTOCOLS = (PROTOCOL_CHUNKS, PROTOCOL_UPLOADS, PROTOCOL_LEGACY)
+
+
+class UploadError(Exception):
+    """Raised when uploads are rejected or cannot be delivered to the backend"""
+
+
+class ChunkedUploadUnsupported(Exception):
+    """The docs backend predates the chunked upload protocol"""
+
+
+def configured_protocol() -> str:
+    """Upload protocol of the docs backend, from the docs_backend_protocol setting"""
+    protocol = get_settings().docs_backend_protocol
+    if protocol not in PROTOCOLS:
+        logger.warning(f"Unknown docs_backend_protocol '{protocol}', using '{PROTOCOL_LEGACY}'")
+        return PROTOCOL_LEGACY
+    return protocol
+
+
+def upload_limits() -> Tuple[int, float]:
+    """
+    Upload limits of the configured protocol
+
+    Returns:
+        (maximum number of files per batch, maximum file size in MB)
+    """
+    settings = get_settings()
+    if configured_protocol() == PROTOCOL_LEGACY:
+        return settings.upload_legacy_max_files, settings.upload_legacy_max_file_mb
+    return settings.upload_max_files, settings.upload_max_file_mb
+
+
+def validate_uploads(files) -> List[str]:
+    """
+    Check uploaded files against the upload rules from settings
+
+    This is the one place upload limits are enforced.
+
+    Args:
+        files: Uploaded files (objects with 'name' and 'size')
+
+    Returns:
+        List of error messages (empty if all files are accepted)
+    """
+    settings = get_settings()
+    max_files, max_file_mb = upload_limits()
+    errors = []
+    if len(files) > max_files:
+        errors.append(f"Max {max_files} files allowed.")
+
+    max_bytes = max_file_mb * 1024 * 1024
+    oversized = [f.name for f in files if f.size > max_bytes]
+    if oversized:
+        errors.append(f"These files exceed {max_file_mb:g} MB: {', '.join(oversized)}")
+
+    allowed = {t.lower() for t in settings.upload_allowed_types}
+    rejected = [f.name for f in files if get_file_extension(f.name) not in allowed]
+    if rejected:
+        errors.append(f"Unsupported file types: {', '.join(rejected)}")
+    return errors
+
+
+def spool_text(text: str):
+    """
+    Write text to a spooled buffer that moves to disk past upload_spool_bytes
+
+    Args:
+        text: Text to spool
+
+    Returns:
+        (SpooledTemporaryFile positioned at 0, size in bytes, SHA-256 hex digest)
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=get_settings().upload_spool_bytes)
+    digest = hashlib.sha256()
+    size = 0
+    # Encode piecewise so the whole UTF-8 copy never exists in memory at once
+    step = 1024 * 1024
+    for start in range(0, len(text), step):
+        data = text[start:start + step].encode("utf-8")
+        digest.update(data)
+        spool.write(data)
+        size += len(data)
+    spool.seek(0)
+    return spool, size, digest.hexdigest()
+
+
+class _PinnedBackend:
+    """Requests to the docs backend, all sent to the replica that served the first one"""
+
+    def __init__(self, replica_id: Optional[str] = None):
+        self.replica_id = replica_id
+
+    def _request(self, method: str, path: str, **kwargs):
+        response, self.replica_id = request_backend(
+            "docs", method, path, get_settings().request_timeout, replica_id=self.replica_id, **kwargs
+        )
+        return response
+
+    def _send_with_retries(self, label: str, method: str, path: str, **kwargs):
+        """Send a request that is safe to repeat, retrying UPLOAD_CHUNK_RETRIES times"""
+        for attempt in range(1, UPLOAD_CHUNK_RETRIES + 1):
+            try:
+                response = self._request(method, path, **kwargs)
+                if response.status_code == 200:
+                    return response
+                reason = f"HTTP {response.status_code}"
+            except Exception as e:
+                reason = str(e)
+
+            logger.warning(f"{label} failed (attempt {attempt}): {reason}")
+            if attempt < UPLOAD_CHUNK_RETRIES:
+                time.sleep(attempt)
+
+        raise UploadError(f"{label} was interrupted. Upload again to resume where it stopped.")
+
+
+class ChunkedUploader(_PinnedBackend):
+    """
+    Client of the docs backend's resumable upload protocol:
+
+    - POST /uploads {filename, size, sha256, chunk_size} -> {upload_id, received}
+      The backend keys uploads by sha256, so re-sending the same content
+      after a failure returns the existing upload_id and the chunk indexes
+      it already has; only the missing chunks are sent again.
+    - PUT /uploads/<upload_id>/chunks/<index> with the raw chunk bytes
+    - POST /update_kb {uploads: [{filename, upload_id}]} to commit the batch
+
+    All requests of a batch are pinned to one replica, which holds the
+    partial uploads.
+    """
+
+    def upload(self, filename: str, spool, size: int, digest: str,
+               on_progress: Optional[Callable[[int, int], None]] = None) -> str:
+        """
+        Upload one spooled file in chunks, resuming a previous partial upload
+
+        Args:
+            filename: Name of the document
+            spool: Readable, seekable file object with the content
+            size: Content size in bytes
+            digest: SHA-256 hex digest of the content
+            on_progress: Optional callback (bytes_sent, size)
+
+        Returns:
+            Upload ID of the completed upload
+        """
+        chunk_size = get_settings().upload_chunk_bytes
+        response = self._request("POST", "/uploads", json={
+            "filename": filename, "size": size, "sha256": digest, "chunk_size": chunk_size,
+        })
+        if response.status_code in (404, 405):
+            raise ChunkedUploadUnsupported()
+        if response.status_code != 200:
+            raise UploadError(f"Could not start upload of {filename}: HTTP {response.status_code}")
+
+        session = response.json()
+        upload_id = session["upload_id"]
+        received = set(session.get("received") or [])
+        chunk_count = max(1, -(-size // chunk_size))
+
+        for index in range(chunk_count):
+            if index not in received:
+                spool.seek(index * chunk_size)
+                self._send_with_retries(f"Chunk {index} of {filename}", "PUT",
+                                        f"/uploads/{upload_id}/chunks/{index}", data=spool.read(chunk_size),
+                                        headers={"Content-Type": "application/octet-stream"})
+            if on_progress is not None:
+                on_progress(min((index + 1) * chunk_size, size), size)
+
+        return upload_id
+
+    def commit(self, uploads: Sequence[Tuple[str, str]]) -> Dict[str, Any]:
+        """
+        Add completed uploads to the knowledge bank
+
+        Args:
+            uploads: (filename, upload_id) pairs
+
+        Returns:
+            Backend result; asynchronous backends include a 'task_id' to poll
+        """
+        response = self._request("POST", "/update_kb", json={
+            "uploads": [{"filename": filename, "upload_id": upload_id} for filename, upload_id in uploads],
+        })
+        if response.status_code != 200:
+            raise UploadError(f"Knowledge bank update failed: HTTP {response.status_code}")
+        return response.json() or {}
+
+
+class ChunkDeduplicator(_PinnedBackend):
+    """
+    Client of the docs backend's content-addressed knowledge bank, which
+    keeps a manifest of document hash -> ordered chunk hashes:
+
+    - POST /kb/lookup {documents: [{filename, doc_hash}]} -> {unchanged: [filename]}
+      Files the knowledge bank already holds in this exact version are
+      skipped before they are even extracted.
+    - PUT /kb/documents {filename, doc_hash, chunk_hashes} -> {missing: [hash]}
+      Declares the new version of a document. Chunks the knowledge bank
+      already has, from the old version or any other document, are reused;
+      chunks the old version no longer references are dropped.
+    - POST /kb/chunks {doc_hash, chunks: [{hash, text}]} sends missing chunks
+      in batches of upload_chunk_bytes; chunks are idempotent by hash.
+    - POST /update_kb {documents: [{filename, doc_hash}]} embeds the new
+      chunks of the declared documents.
+    - DELETE /kb/documents/<filename>
+    """
+
+    def lookup(self, documents: Sequence[Tuple[str, str]]) -> Optional[set]:
+        """
+        Find the files already in the knowledge bank
+
+        Args:
+            documents: (filename, doc_hash) pairs
+
+        Returns:
+            Names of the unchanged files, or None if the backend keeps no manifest
+        """
+        if not documents:
+            return set()
+        response = self._request("POST", "/kb/lookup", json={
+            "documents": [{"filename": filename, "doc_hash": doc_hash} for filename, doc_hash in documents],
+        })
+        if response.status_code in (404, 405):
+            return None
+        if response.status_code != 200:
+            raise UploadError(f"Knowledge bank lookup failed: HTTP {response.status_code}")
+        return set((response.json() or {}).get("unchanged") or [])
+
+    def sync(self, filename: str, doc_hash: str, chunks: Sequence[Tuple[str, str]],
+             on_progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """
+        Replace a document in the knowledge bank, sending only the chunks it lacks
+
+        Args:
+            filename: Document name
+            doc_hash: SHA-256 of the uploaded file
+            chunks: Ordered (chunk_hash, text) pairs of the new version
+            on_progress: Optional callback (chunks_sent, chunks_missing)
+
+        Returns:
+            Number of chunks sent
+        """
+        response = self._send_with_retries(
+            f"Manifest of {filename}", "PUT", "/kb/documents",
+            json={"filename": filename, "doc_hash": doc_hash, "chunk_hashes": [h for h, _ in chunks]},
+        )
+        missing = set((response.json() or {}).get("missing") or [])
+
+        batch_limit = get_settings().upload_chunk_bytes
+        batch, batch_bytes, sent = [], 0, 0
+        for digest, text in chunks:
+            if digest not in missing:
+                continue
+            # A chunk can repeat within a document; send it once
+            missing.discard(digest)
+            if batch and batch_bytes + len(text) > batch_limit:
+                sent += self._send_batch(filename, doc_hash, batch)
+                batch, batch_bytes = [], 0
+                if on_progress is not None:
+                    on_progress(sent, sent + len(missing))
+            batch.append({"hash": digest, "text": text})
+            batch_bytes += len(text)
+        if batch:
+            sent += self._send_batch(filename, doc_hash, batch)
+        if on_progress is not None:
+            on_progress(sent, sent)
+        return sent
+
+    def _send_batch(self, filename: str, doc_hash: str, batch: List[Dict[str, str]]) -> int:
+        self._send_with_retries(f"Chunks of {filename}", "POST", "/kb/chunks",
+                                json={"doc_hash": doc_hash, "chunks": batch})
+        return len(batch)
+
+    def commit(self, documents: Sequence[Tuple[str, str]]) -> Dict[str, Any]:
+        """
+        Embed the new chunks of declared documents
+
+        Args:
+            documents: (filename, doc_hash) pairs
+
+        Returns:
+            Backend result; asynchronous backends include a 'task_id' to poll
+        """
+        response = self._request("POST", "/update_kb", json={
+            "documents": [{"filename": filename, "doc_hash": doc_hash} for filename, doc_hash in documents],
+        })
+        if response.status_code != 200:
+            raise UploadError(f"Knowledge bank update failed: HTTP {response.status_code}")
+        return response.json() or {}
+
+    def delete(self, filename: str) -> bool:
+        """
+        Remove a document and the chunks no other document uses
+
+        Returns:
+            True if deleted, False if the backend keeps no manifest
+        """
+        response = self._request("DELETE", f"/kb/documents/{quote(filename, safe='')}")
+        if response.status_code in (404, 405):
+            return False
+        if response.status_code not in (200, 204):
+            raise UploadError(f"Could not delete {filename}: HTTP {response.status_code}")
+        return True
+
+
+def legacy_update(spools: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Send the whole batch as one JSON POST, for backends without chunked uploads
+
+    Args:
+        spools: Spooled texts, dictionaries with 'filename', 'spool' and 'size'
+
+    Returns:
+        Backend result; asynchronous backends include a 'task_id' to poll
+
+    Raises:
+        UploadError: If the batch exceeds upload_legacy_max_mb (the whole
+            body is built in memory) or the backend rejects it
+    """
+    max_mb = get_settings().upload_legacy_max_mb
+    total = sum(s["size"] for s in spools)
+    if max_mb > 0 and total > max_mb * 1024 * 1024:
+        raise UploadError(f"The extracted text of this batch exceeds {max_mb:g} MB. Upload fewer files at a time.")
+
+    files = []
+    for s in spools:
+        s["spool"].seek(0)
+        files.append({"filename": s["filename"], "content": base64.b64encode(s["spool"].read()).decode("utf-8")})
+    response, _ = request_backend("docs", "POST", "/update_kb", get_settings().request_timeout,
+                                  json={"files": files})
+    if response.status_code != 200:
+        raise UploadError(f"Knowledge bank update failed: HTTP {response.status_code}")
+    try:
+        return response.json() or {}
+    except json.JSONDecodeError:
+        return {}
@@ -9,36 +9,199 @@ from services.chat_service import (
     update_message,
     stream_response
 )
-from services.document_service import get_uploaded_documents, process_uploaded_file
+from services.document_service import process_uploaded_file
+from utils.rendering import fragment
 from utils.session_state import reset_current_conversation
-from utils.text_extractor import process_document, query_document
+from utils.settings import get_settings
+from utils.text_extractor import get_document_library, process_document, remove_active_document
 import time
 
+def _transcript_window():
+    """
+    How many of the latest messages of the current conversation to render
+    (kept per session, starting over when the conversation changes)
+    """
+    conversation_id = st.session_state.get("current_conversation_id")
+    window = st.session_state.get("transcript_window")
+    if not window or window["conversation_id"] != conversation_id:
+        window = {"conversation_id": conversation_id, "size": get_settings().chat_window_messages}
+        st.session_state.transcript_window = window
+    return window
+
+def _load_earlier_messages():
+    _transcript_window()["size"] += get_settings().chat_window_messages
+
+@fragment()
+def _render_transcript():
+    """
+    The latest messages of the conversation, with a "load earlier" button
+    for the rest. A fragment: opening a context or loading earlier messages
+    reruns only the transcript.
+    """
+    messages = get_formatted_messages()
+    start = max(0, len(messages) - _transcript_window()["size"])
+    if start:
+        st.button(f"⬆️ Load earlier messages ({start} more)", key="load_earlier_messages",
+                  on_click=_load_earlier_messages)
+
+    for i, msg in enumerate(messages[start:], start=start):
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+
+            # Context can be large: only decode and send it once the user opens it
+            # Keyed by timestamp, not position, so an open context stays with its
+            # message when an earlier one is deleted
+            if "context" in msg and msg["context"]:
+                if st.toggle("📄 View retrieved context", key=f"ctx_{msg.get('timestamp', i)}"):
+                    # Context may be the raw text of an uploaded file: never render it as HTML
+                    st.markdown(str(msg["context"]))
+
+            col1, col2, col3 = st.columns([0.94, 0.03, 0.03])
+            with col2:
+                if st.button("✏️", key=f"edit_{i}", help="Edit"):
+                    st.session_state.edit_index = i
+                    st.session_state.edit_content = msg["content"]
+                    st.rerun()
+            with col3:
+                if st.button("🗑️", key=f"del_{i}", help="Delete"):
+                    delete_message(i)
+                    st.rerun()
+
+def _remove_document(name):
+    """Stop querying a document (button callback)"""
+    # Disable document query mode once no document is left
+    if remove_active_document(name):
+        st.session_state.doc_query_mode = False
+    # Reduce document count in the uploaded_documents
+    from services.document_service import remove_document
+    remove_document(name)
+    st.toast(f"{name} removed")
+
+@fragment()
+def _render_input_area():
+    """
+    Mode toggle, active documents, message input and uploader. A fragment:
+    toggling the mode, removing a document or opening the uploader reruns
+    only this part; a submitted message or a processed upload reruns the page.
+    """
+    # Tell the user when their last request was throttled
+    if st.session_state.get("throttle_notice"):
+        st.warning(st.session_state.pop("throttle_notice"))
+    
+    # Document Query Mode Toggle
+    with st.container():
+        st.markdown('<div class="mode-toggle">', unsafe_allow_html=True)
+        # Only this fragment depends on the mode, so no full rerun is needed
+        st.session_state.doc_query_mode = st.toggle("📄 Document Query Mode", value=st.session_state.doc_query_mode)
+        
+        # Display document query info if in document mode
+        if st.session_state.doc_query_mode:
+            library = get_document_library()
+            if len(library):
+                doc_count = len(library)
+                st.info(f"📑 Querying {doc_count} document{'s' if doc_count != 1 else ''}; answers cite the source file")
+                streams = st.session_state.get("document_streams", {})
+                for name in library.names:
+                    col1, col2 = st.columns([0.9, 0.1])
+                    with col1:
+                        stream = streams.get(name)
+                        if stream is not None and not stream.done:
+                            # The first pages are already queryable; the rest is indexed in the background
+                            st.caption(f"📄 {name} ⏳ {stream.status()}")
+                        else:
+                            st.caption(f"📄 {name}")
+                    with col2:
+                        st.button("❌", key=f"remove_doc_btn_{name}", help=f"Remove {name}",
+                                  on_click=_remove_document, args=(name,))
+            else:
+                st.warning("⚠️ No document loaded. Please upload a document first.")
+            
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Custom input with integrated pin
+    cols = st.columns([0.05, 0.95])
+    
+    with cols[0]:
+        if st.button("📎", key="pin_button"):
+            st.session_state.show_uploader = not st.session_state.get("show_uploader", False)
+            
+    with cols[1]:
+        # Initialize the session state variable for the input text if not exists
+        if "user_input_text" not in st.session_state:
+            st.session_state.user_input_text = ""
+            
+        # Function to process when Enter is pressed
+        def handle_enter():
+            if st.session_state.user_input_text.strip():
+                st.session_state.temp_user_input = st.session_state.user_input_text
+                st.session_state.user_input_text = ""
+                
+        # Text input that captures Enter key
+        st.text_input(
+            "Type your message…",
+            key="user_input_text",
+            on_change=handle_enter,
+            label_visibility="collapsed",
+            placeholder=f"{'Ask about the document...' if st.session_state.doc_query_mode else 'Type your message here and press Enter'}"
+        )
+
+        # A submitted message is answered in the transcript: leave the fragment for a full run
+        if st.session_state.get("temp_user_input"):
+            st.rerun()
+
+        # Check if we need to show the uploader
+        if st.session_state.get("show_uploader", False):
+            with st.container():
+                st.markdown('<div class="upload-container">', unsafe_allow_html=True)
+                uploaded_file = st.file_uploader("Upload a document", type=["pdf", "docx", "txt"], key="file_uploader")
+
+                # Handle file upload
+                if uploaded_file and not st.session_state.get("upload_in_progress", False):
+                    # Set flag to prevent re-uploads
+                    st.session_state.upload_in_progress = True
+
+                    with st.spinner("📚 Processing your document..."):
+                        # Process document for text extraction (in a worker process)
+                        progress_bar = st.progress(0.0)
+                        process_document(
+                            uploaded_file,
+                            lambda name, done, total: progress_bar.progress(done / total if total else 1.0)
+                        )
+                        
+                        # Automatically enable document query mode
+                        st.session_state.doc_query_mode = True
+                        
+                        # Also process for indexing
+                        processed = process_uploaded_file(uploaded_file)
+
+                    if processed:
+                        # Show toast notification
+                        st.toast(f"✅ Document '{processed['name']}' has been processed.")
+                        
+                        # Store document info
+                        st.session_state.uploaded_doc_name = processed['name']
+                        st.session_state.upload_in_progress = False
+                        st.session_state.show_uploader = False
+                        
+                        # Set a flag to show notification temporarily
+                        st.session_state.show_doc_notification = True
+                        st.session_state.doc_notification_time = time.time()
+                        
+                        st.rerun()
+                    else:
+                        st.error("❌ Failed to process the document.")
+                        st.session_state.upload_in_progress = False
+                        st.rerun()
+
+                st.markdown('</div>', unsafe_allow_html=True)
+
 def render_chat_page():
-    # --- Custom CSS ---
-    st.markdown("""
-        <style>
-        .main .block-container { padding-top: 1rem; padding-bottom: 0; }
-        .stChatFloatingInputContainer { display: none !important; }
-        .chat-header { position: sticky; top: 0; background-color: white; z-index: 100;
-                      padding-bottom: 1rem; border-bottom: 1px solid #f0f0f0; }
-        .chat-input-container { position: fixed; bottom: 2px; background-color: white;
-                              padding: 10px 1rem; z-index: 100; border-top: 1px solid #f0f0f0; }
-        .context-expander { margin-top: 1rem; border: 1px solid #f0f0f0; border-radius: 4px; }
-        .upload-container { margin-bottom: 1rem; }
-        .mode-toggle { padding: 5px 0; }
-        </style>
-    """, unsafe_allow_html=True)
-    docs = get_uploaded_documents()
+    # Page styles: assets/css/chat_page.css, injected by app.py
     
     # Initialize document query mode in session state if not exists
     if "doc_query_mode" not in st.session_state:
         st.session_state.doc_query_mode = False
     
-    # Initialize extracted document text if not exists
-    if "extracted_doc_text" not in st.session_state:
-        st.session_state.extracted_doc_text = None
-    
     # SECTION 1: HEADER
     with st.container():
         st.markdown('<div class="chat-header">', unsafe_allow_html=True)
@@ -60,25 +223,7 @@ def render_chat_page():
 
         is_editing = render_message_editor()
         if not is_editing:
-            for i, msg in enumerate(get_formatted_messages()):
-                with st.chat_message(msg["role"]):
-                    st.markdown(msg["content"])
-                    
-                    # Add context expander if it exists in the message
-                    if "context" in msg and msg["context"]:
-                        with st.expander("📄 View retrieved context"):
-                            st.markdown(msg["context"], unsafe_allow_html=True)
-                    
-                    col1, col2, col3 = st.columns([0.94, 0.03, 0.03])
-                    with col2:
-                        if st.button("✏️", key=f"edit_{i}", help="Edit"):
-                            st.session_state.edit_index = i
-                            st.session_state.edit_content = msg["content"]
-                            st.rerun()
-                    with col3:
-                        if st.button("🗑️", key=f"del_{i}", help="Delete"):
-                            delete_message(i)
-                            st.rerun()
+            _render_transcript()
 
         # Handle edit operations
         if "edit_index" in st.session_state:
@@ -99,6 +244,9 @@ def render_chat_page():
                                 
                                 # Update message and get new response
                                 new_response = update_message(edit_index, new_txt)
+                                if new_response is None:
+                                    # Throttled: nothing changed, keep the editor open
+                                    st.rerun()
                                 
                                 # Stream the new response
                                 if new_response and isinstance(new_response, str):
@@ -131,24 +279,15 @@ def render_chat_page():
                 response_placeholder = st.empty()
                 
                 with st.spinner("Thinking..."):
-                    # Check if document query mode is enabled and we have extracted text
-                    if st.session_state.doc_query_mode and st.session_state.extracted_doc_text:
-                        try:
-                            result = query_document(user_input, st.session_state.extracted_doc_text)
-                            answer = result.get("answer", "Sorry, I couldn't process your query on this document.")
-                            # Stream the response
-                            stream_response(answer, response_placeholder)
-                            # Add the answer to the chat history
-                            handle_message(user_input, custom_response=answer)
-                        except Exception as e:
-                            error_msg = f"Error querying document: {str(e)}"
-                            stream_response(error_msg, response_placeholder)
-                            handle_message(user_input, custom_response=error_msg)
+                    # handle_message routes to the document or regular endpoint
+                    # depending on Document Query Mode, behind the rate limiter
+                    response = handle_message(user_input)
+                    if response:
+                        stream_response(response, response_placeholder)
                     else:
-                        # Use regular API endpoint and stream response
-                        response = handle_message(user_input)
-                        if response:
-                            stream_response(response, response_placeholder)
+                        # Throttled: the conversation is unchanged, so give
+                        # the message back to resend (the notice says why)
+                        st.session_state.user_input_text = user_input
 
             st.rerun()
         
@@ -156,116 +295,7 @@ def render_chat_page():
 
     # SECTION 3: INPUT AREA (fixed at bottom with integrated pin)
     st.markdown('<div class="chat-input-container">', unsafe_allow_html=True)
-    
-    # Document Query Mode Toggle
-    with st.container():
-        st.markdown('<div class="mode-toggle">', unsafe_allow_html=True)
-        doc_mode = st.toggle("📄 Document Query Mode", value=st.session_state.doc_query_mode)
-        if doc_mode != st.session_state.doc_query_mode:
-            st.session_state.doc_query_mode = doc_mode
-            st.rerun()
-        
-        # Display document query info if in document mode
-        if st.session_state.doc_query_mode:
-            if st.session_state.extracted_doc_text:
-                doc_name = st.session_state.get("active_doc_name", "document")
-                docs = get_uploaded_documents()
-                doc_count = len(docs) if docs else 0
-                
-                col1, col2 = st.columns([0.9, 0.1])
-                with col1:
-                    st.info(f"📑 Querying: {doc_name} ({doc_count} document{'s' if doc_count != 1 else ''} uploaded)")
-                with col2:
-                    if st.button("❌", key="remove_doc_btn", help="Remove document"):
-                        # Clear document data
-                        st.session_state.extracted_doc_text = None
-                        st.session_state.active_doc_name = None
-                        if "document_cache" in st.session_state:
-                            st.session_state.document_cache = {}
-                        # Disable document query mode
-                        st.session_state.doc_query_mode = False
-                        # Reduce document count in the uploaded_documents
-                        from services.document_service import remove_document
-                        if st.session_state.get("active_doc_name"):
-                            remove_document(st.session_state.get("active_doc_name"))
-                        st.toast("Document removed")
-                        st.rerun()
-            else:
-                st.warning("⚠️ No document loaded. Please upload a document first.")
-            
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    # Custom input with integrated pin
-    cols = st.columns([0.05, 0.95])
-    
-    with cols[0]:
-        if st.button("📎", key="pin_button"):
-            st.session_state.show_uploader = not st.session_state.get("show_uploader", False)
-            
-    with cols[1]:
-        # Initialize the session state variable for the input text if not exists
-        if "user_input_text" not in st.session_state:
-            st.session_state.user_input_text = ""
-            
-        # Function to process when Enter is pressed
-        def handle_enter():
-            if st.session_state.user_input_text.strip():
-                st.session_state.temp_user_input = st.session_state.user_input_text
-                st.session_state.user_input_text = ""
-                
-        # Text input that captures Enter key
-        user_input = st.text_input(
-            "Type your message…",
-            key="user_input_text",
-            on_change=handle_enter,
-            label_visibility="collapsed",
-            placeholder=f"{'Ask about the document...' if st.session_state.doc_query_mode else 'Type your message here and press Enter'}"
-        )
-
-        # Check if we need to show the uploader
-        if st.session_state.get("show_uploader", False):
-            with st.container():
-                st.markdown('<div class="upload-container">', unsafe_allow_html=True)
-                uploaded_file = st.file_uploader("Upload a document", type=["pdf", "docx", "txt"], key="file_uploader")
-
-                # Handle file upload
-                if uploaded_file and not st.session_state.get("upload_in_progress", False):
-                    # Set flag to prevent re-uploads
-                    st.session_state.upload_in_progress = True
 
-                    with st.spinner("📚 Processing your document..."):
-                        # Process document for text extraction
-                        doc_info = process_document(uploaded_file)
-                        
-                        # Store the extracted text in session state
-                        st.session_state.extracted_doc_text = doc_info["text"]
-                        st.session_state.active_doc_name = uploaded_file.name
-                        
-                        # Automatically enable document query mode
-                        st.session_state.doc_query_mode = True
-                        
-                        # Also process for indexing
-                        processed = process_uploaded_file(uploaded_file)
-
-                    if processed:
-                        # Show toast notification
-                        st.toast(f"✅ Document '{processed['name']}' has been processed.")
-                        
-                        # Store document info
-                        st.session_state.uploaded_doc_name = processed['name']
-                        st.session_state.upload_in_progress = False
-                        st.session_state.show_uploader = False
-                        
-                        # Set a flag to show notification temporarily
-                        st.session_state.show_doc_notification = True
-                        st.session_state.doc_notification_time = time.time()
-                        
-                        st.rerun()
-                    else:
-                        st.error("❌ Failed to process the document.")
-                        st.session_state.upload_in_progress = False
-                        st.rerun()
-
-                st.markdown('</div>', unsafe_allow_html=True)
+    _render_input_area()
 
     st.markdown('</div>', unsafe_allow_html=True)
\ No newline at end of file
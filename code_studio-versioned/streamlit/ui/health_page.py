@@ -0,0 +1,35 @@
+import streamlit as st
+import logging
+from services.health_service import get_health_report, check_health_now
+from services.rate_limiter import get_rate_limiter
+from services.extraction_cache import get_extraction_cache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def render_health_page():
+    """
+    Render the admin health page (open with ?page=health&token=<admin_token>)
+    """
+    st.header("System Health")
+
+    if st.button("🔄 Probe now", key="health_probe_now"):
+        check_health_now()
+
+    report = get_health_report()
+    st.subheader(f"Overall state: {report['state']}")
+
+    for target in report["targets"]:
+        cols = st.columns(4)
+        cols[0].metric("Replica", target["target"], target["state"])
+        cols[1].metric("p50 latency (s)", f"{target['latency_p50']:.2f}" if target["latency_p50"] is not None else "-")
+        cols[2].metric("p95 latency (s)", f"{target['latency_p95']:.2f}" if target["latency_p95"] is not None else "-")
+        cols[3].metric("Error rate", f"{target['error_rate']:.0%}")
+        if target["last_failure_reason"]:
+            st.caption(f"Last failure: {target['last_failure_reason']}")
+
+    st.subheader("Raw report")
+    report["rate_limiter"] = get_rate_limiter().metrics()
+    report["extraction_cache"] = get_extraction_cache().stats()
+    st.json(report)
@@ -3,11 +3,17 @@
 import streamlit as st
 import logging
 from services.history_service import load_user_conversations, load_conversation, delete_conversation
+from utils.navigation import CHAT, go_to
+from utils.session_state import start_new_conversation
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _view_conversation(conversation_id):
+    load_conversation(conversation_id)
+    go_to(CHAT)
+
 def render_history_page():
     """
     Render the conversation history page
@@ -23,9 +29,7 @@ def render_history_page():
         st.info("You don't have any saved conversations yet. Start chatting to create one!")
         
         # Add a button to go to chat
-        if st.button("Start New Conversation"):
-            st.session_state.current_page = "chat"
-            st.rerun()
+        st.button("Start New Conversation", on_click=go_to, args=(CHAT,))
         
         return
     
@@ -43,13 +47,8 @@ def render_history_page():
             
             with col3:
                 # Actions
-                if st.button("View", key=f"view_conv_{i}"):
-                    # Load this conversation
-                    load_conversation(conversation['id'])
-                    
-                    # Go to chat page
-                    st.session_state.current_page = "chat"
-                    st.rerun()
+                # Load this conversation and go to the chat page
+                st.button("View", key=f"view_conv_{i}", on_click=_view_conversation, args=(conversation['id'],))
                 
                 if st.button("Delete", key=f"delete_conv_{i}"):
                     # Delete this conversation
@@ -60,8 +59,4 @@ def render_history_page():
             st.markdown("---")
     
     # Add a button to start a new conversation
-    if st.button("Start New Conversation", key="start_new_conv"):
-        from utils.session_state import reset_current_conversation
-        reset_current_conversation()
-        st.session_state.current_page = "chat"
-        st.rerun()
\ No newline at end of file
+    st.button("Start New Conversation", key="start_new_conv", on_click=start_new_conversation)
\ No newline at end of file
@@ -1,6 +1,6 @@
 
 import streamlit as st
-from services.chat_service import handle_message
+from utils.navigation import CHAT, HOME, current_page, go_to
 from utils.rendering import render_svg
 import logging
 
@@ -8,12 +8,19 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def ask_question(question):
+    """
+    Ask a question on the chat page, where the answer is streamed
+    """
+    st.session_state.pending_user_input = question
+    go_to(CHAT)
+
 def render_home_page():
     """
     Render the home page with welcome message and quick access features
     """
     # Prevent UI flicker when transitioning to chat
-    if st.session_state.get("current_page") != "home":
+    if current_page() != HOME:
         return
     # Get SVG content for logo
     img_content = render_svg("assets/avatarlogo.svg")
@@ -28,16 +35,15 @@ def render_home_page():
     # Search input field
     st.markdown('<div class="centered-container">', unsafe_allow_html=True)
     
-    # Function to process when Enter is pressed
+    # Function to process when Enter is pressed (or the button clicked)
     def handle_enter():
         user_input_val = st.session_state.get("home_input", "")
         if user_input_val:
             st.session_state.pending_user_input = user_input_val
-            st.session_state.current_page = "chat"
-            # st.rerun()
+            go_to(CHAT)
 
     # Text input with default value
-    user_input = st.text_input(
+    st.text_input(
         label="home_chat_input",
         placeholder="Ask any question...",
         on_change=handle_enter,
@@ -46,11 +52,7 @@ def render_home_page():
     )
     
     # Button
-    if st.button("Ask and Go to Chat", key="home_ask_button"):
-        if user_input:
-            st.session_state.pending_user_input = user_input  # Stash for later
-            st.session_state.current_page = "chat"
-            st.rerun()
+    st.button("Ask and Go to Chat", key="home_ask_button", on_click=handle_enter)
     
     st.markdown('</div>', unsafe_allow_html=True)
     st.markdown('</div>', unsafe_allow_html=True)
@@ -69,10 +71,7 @@ def render_home_page():
     cols = st.columns(2)
     for i, question in enumerate(popular_questions):
         with cols[i % 2]:
-            if st.button(question, key=f"popular_q_{i}"):
-                handle_message(question)
-                st.session_state.current_page = "chat"
-                st.rerun()
+            st.button(question, key=f"popular_q_{i}", on_click=ask_question, args=(question,))
     
     # Feature showcase section (optional)
     st.markdown('<h2 style="text-align:center; margin-top:40px;">Key Features</h2>', unsafe_allow_html=True)
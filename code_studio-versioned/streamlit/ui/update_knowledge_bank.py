@@ -1,104 +1,67 @@
 import streamlit as st
 # st.set_page_config(page_title="Upload Knowledge Docs", layout="wide")
 
-import base64
-import requests
-from datetime import datetime
-from utils.constants import UPDATE_KNOWLEDGE_BANK
-
-from PyPDF2 import PdfReader
-from docx import Document
-
-# Constants
-MAX_FILE_COUNT = 5
-MAX_FILE_SIZE_MB = 2
-
-# --- Helper Functions ---
-def get_file_extension(filename):
-    return filename.lower().split('.')[-1]
-
-def extract_text_from_file(file):
-    ext = get_file_extension(file.name)
-
-    if ext == 'txt':
-        return file.read().decode('utf-8')
-    elif ext == 'pdf':
-        from PyPDF2 import PdfReader
-        reader = PdfReader(file)
-        return "\n".join([page.extract_text() for page in reader.pages])
-    elif ext in ['docx', 'doc']:
-        from docx import Document
-        doc = Document(file)
-        return "\n".join([para.text for para in doc.paragraphs])
-    else:
-        return None
-
-def encode_to_base64(text):
-    return base64.b64encode(text.encode('utf-8')).decode('utf-8')
-
-def prepare_payload(files):
-    file_list = []
-    for file in files:
-        text = extract_text_from_file(file)
-        if text:
-            encoded = encode_to_base64(text)
-            file_list.append({
-                "filename": file.name,
-                "content": encoded
-            })
-    return {"files": file_list}
+from utils.settings import get_settings
+from services.upload_service import UploadError, upload_limits, validate_uploads
+from services.ingestion_service import can_delete_kb_documents, delete_kb_document, submit_ingestion
+from services.kb_manifest import get_kb_manifest
+from utils.navigation import CHAT, UPLOAD_DOCS, current_page, navigate
 
 # --- Main Page Function ---
 def render_ukb_page():
-    if st.session_state.get("current_page") != "ukb":
+    if current_page() != UPLOAD_DOCS:
         return
 
-    st.markdown("""
-        <style>
-        .upload-container {
-            border: 1px dashed #ccc;
-            padding: 20px;
-            border-radius: 5px;
-            background-color: #f9f9f9;
-            margin-bottom: 20px;
-        }
-        .stButton > button {
-            width: 100%;
-        }
-        .centered-container {
-            display: flex;
-            justify-content: center;
-            margin-bottom: 1em;
-        }
-        </style>
-    """, unsafe_allow_html=True)
-
-    # --- Input field for prompt ---
-    def handle_enter():
-        user_input_val = st.session_state.get("update_knowledge_bank", "")
-        if user_input_val:
-            st.session_state.pending_user_input = user_input_val
-            st.session_state.current_page = "ukb"
+    # Page styles: assets/css/update_knowledge_bank.css, injected by app.py
 
     st.title("📄 Update Knowledge Documents")
 
     st.markdown('<div class="upload-container">', unsafe_allow_html=True)
 
+    settings = get_settings()
+    allowed_types = list(settings.upload_allowed_types)
+    max_files, max_file_mb = upload_limits()
     uploaded_files = st.file_uploader(
-        "Upload up to 5 files (TXT, PDF, DOCX, DOC)",
-        type=['txt', 'pdf', 'docx', 'doc'],
+        f"Upload up to {max_files} files of {max_file_mb:g} MB "
+        f"({', '.join(t.upper() for t in allowed_types)})",
+        type=allowed_types,
         accept_multiple_files=True,
         key="ukb_uploader"
     )
 
     st.markdown('</div>', unsafe_allow_html=True)
 
+    # Documents already uploaded; re-uploading an unchanged file is a no-op,
+    # and an updated file only sends its changed chunks
+    kb_documents = get_kb_manifest().documents()
+    if kb_documents:
+        can_delete = can_delete_kb_documents()
+        with st.expander(f"📚 Already in the knowledge bank ({len(kb_documents)})"):
+            for doc in kb_documents:
+                col1, col2 = st.columns([0.9, 0.1])
+                with col1:
+                    st.caption(f"{doc['filename']} · {doc['chunk_count']} chunks")
+                if not can_delete:
+                    continue
+                with col2:
+                    deleted = False
+                    if st.button("🗑", key=f"kb_delete_{doc['filename']}", help=f"Delete {doc['filename']}"):
+                        try:
+                            delete_kb_document(doc["filename"])
+                            deleted = True
+                        except UploadError as e:
+                            st.error(f"❌ {str(e)}")
+                    if deleted:
+                        st.toast(f"{doc['filename']} deleted")
+                        st.rerun()
+
     st.markdown("#### 👉 Ask a question related to uploaded documents")
 
+    # The prompt is asked by the sidebar once the upload is extracted
+    # (pending_doc_question below), not straight away by the chat page
     user_input = st.text_input(
         label="update_knowledge_bank",
         placeholder="Ask a question or provide context...",
-        on_change=handle_enter,
         key="update_knowledge_bank",
         label_visibility="collapsed"
     )
@@ -108,44 +71,26 @@ def render_ukb_page():
             st.warning("Please upload at least one document.")
             return
 
-        if len(uploaded_files) > MAX_FILE_COUNT:
-            st.error(f"🚫 Max {MAX_FILE_COUNT} files allowed.")
+        errors = validate_uploads(uploaded_files)
+        if errors:
+            for error in errors:
+                st.error(f"🚫 {error}")
             return
 
-        oversized = [f.name for f in uploaded_files if f.size > MAX_FILE_SIZE_MB * 1024 * 1024]
-        if oversized:
-            st.error(f"🚫 These files exceed {MAX_FILE_SIZE_MB} MB: {', '.join(oversized)}")
-            return
-
-        with st.spinner("📡 Uploading and processing..."):
+        with st.spinner("📡 Queuing upload..."):
             try:
-                payload = prepare_payload(uploaded_files)
-                # st.write(payload)
-                # --- Replace with your actual backend endpoint ---
-                api_url = "http://10.242.92.241:10000/web-apps-backends/GENAIPOC/gq110S2/update_kb"
-                response = requests.post(api_url, json=payload)
-                # st.write(response)
-                result = response.json()
-                # st.stop()
-                # Fallback mock
-                if not result or "combined_text" not in result:
-                    result = {
-                        "combined_text": "\n".join([
-                            base64.b64decode(f["content"]).decode("utf-8") for f in payload["files"]
-                        ]),
-                        "file_count": len(payload["files"]),
-                        "result": "Simulated backend response"
-                    }
-
-                # Store in session for use in chat
-                st.session_state.extracted_doc_text = result["combined_text"]
-                st.session_state.active_doc_name = ", ".join([f.name for f in uploaded_files])
+                # Extraction, upload and embedding run in the background;
+                # progress is shown in the sidebar
+                job = submit_ingestion(uploaded_files, st.session_state.session_id)
+                st.session_state.ingestion_submitted = True
                 st.session_state.doc_query_mode = True
 
-                # Store prompt
-                st.session_state.pending_user_input = user_input or "Document uploaded. Let's chat!"
-                st.session_state.current_page = "chat"
-                st.rerun()
+                # Ask the prompt once the documents are extracted (see components/sidebar.py)
+                st.session_state.pending_doc_question = {
+                    "job_id": job.job_id,
+                    "text": user_input or "Document uploaded. Let's chat!",
+                }
+                navigate(CHAT)
 
             except Exception as e:
-                st.error(f"❌ Failed to process files: {str(e)}")
\ No newline at end of file
+                st.error(f"❌ Failed to process files: {str(e)}")
@@ -0,0 +1,494 @@
+#document_index.py
+"""
+In-process retrieval index over uploaded documents.
+
+Each document is chunked once (at upload); at query time the chunks are
+scored against the question with BM25, or with an injected embedding
+function, and the best chunks are packed into the token budget. A
+DocumentLibrary queries the documents of a session together, with chunks
+tagged by the file they came from. Must not import streamlit.
+"""
+import math
+import re
+import threading
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from utils.document_parsers import BLOCK_HEADING, BLOCK_TABLE, PAGE_MARKER, TABLE_END, TABLE_START, iter_blocks
+from utils.tokens import DEFAULT_ENCODING, get_encoder
+
+# Maps a list of texts to one embedding vector per text
+EmbedFunction = Callable[[List[str]], List[Sequence[float]]]
+
+# BM25 statistics of a collection of chunks for a set of query terms:
+# (chunk count, total length in words, document frequency per term)
+CorpusStats = Tuple[int, int, Dict[str, int]]
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# On average one line in this many ends a content-defined chunk (see chunk_by_content)
+CONTENT_BOUNDARY_DIVISOR = 8
+
+_embedder: Optional[EmbedFunction] = None
+
+
+def set_embedder(embed_fn: Optional[EmbedFunction]):
+    """
+    Use an embedding function instead of BM25 for new indexes
+
+    Args:
+        embed_fn: Function mapping a list of texts to vectors, or None for BM25
+    """
+    global _embedder
+    _embedder = embed_fn
+
+
+def get_embedder() -> Optional[EmbedFunction]:
+    return _embedder
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+@dataclass
+class Chunk:
+    """A slice of a document, in document order"""
+    text: str
+    token_count: int
+    position: int
+    source: str = ""
+    page: Optional[int] = None
+
+    def to_list(self):
+        return [self.text, self.token_count, self.page]
+
+
+def chunk_text(text: str, chunk_tokens: int = 400, overlap_tokens: int = 50,
+               encoding_name: str = DEFAULT_ENCODING,
+               tokens: Optional[Sequence[int]] = None) -> List[Chunk]:
+    """
+    Split text into overlapping windows of tokens
+
+    Args:
+        text: Text to split
+        chunk_tokens: Tokens per chunk
+        overlap_tokens: Tokens shared by consecutive chunks
+        encoding_name: tiktoken encoding name
+        tokens: The text already encoded with encoding_name, to avoid encoding it again
+
+    Returns:
+        List of chunks
+    """
+    encoder = get_encoder(encoding_name)
+    if tokens is None:
+        tokens = encoder.encode(text)
+    step = max(1, chunk_tokens - max(0, overlap_tokens))
+
+    chunks = []
+    for start in range(0, len(tokens), step):
+        window = tokens[start:start + chunk_tokens]
+        chunks.append(Chunk(encoder.decode(window), len(window), len(chunks)))
+        if start + chunk_tokens >= len(tokens):
+            break
+    return chunks
+
+
+def _pack(ranked: Sequence[Chunk], max_tokens: int, stop_when_full: bool) -> List[Chunk]:
+    """Take chunks in rank order while they fit in the token budget"""
+    selected, used = [], 0
+    for chunk in ranked:
+        if used + chunk.token_count > max_tokens:
+            if stop_when_full:
+                break
+            continue
+        selected.append(chunk)
+        used += chunk.token_count
+    return selected
+
+
+def chunk_by_content(text: str, chunk_tokens: int = 400,
+                     encoding_name: str = DEFAULT_ENCODING) -> List[Chunk]:
+    """
+    Split text into chunks of whole lines whose boundaries depend only on nearby content
+
+    Lines are packed into chunks; once a chunk is half full it ends after any
+    line whose checksum hits CONTENT_BOUNDARY_DIVISOR, and it always ends
+    before it would overflow. Because boundaries are chosen by content rather
+    than by offset, an edit only changes the chunks around it: the rest of
+    the document chunks (and hashes) exactly as before, which is what lets
+    knowledge bank updates skip unchanged chunks. Lines longer than a chunk
+    are split into token windows.
+
+    The layout markers of extracted text are honoured (see
+    document_parsers.iter_blocks): section headings start a new chunk, a
+    table split across chunks repeats its header row in each part, and page
+    markers become the chunks' page numbers instead of text.
+
+    Args:
+        text: Text to split
+        chunk_tokens: Maximum tokens per chunk
+        encoding_name: tiktoken encoding name
+
+    Returns:
+        List of chunks
+    """
+    encoder = get_encoder(encoding_name)
+    chunks: List[Chunk] = []
+    lines: List[str] = []
+    used = 0
+    chunk_page: Optional[int] = None
+
+    def cost(line: str) -> int:
+        # One extra token for the newline joining the lines
+        return len(encoder.encode(line)) + 1
+
+    def append(line: str, tokens: int, page: Optional[int]):
+        nonlocal used, chunk_page
+        if not lines:
+            chunk_page = page
+        lines.append(line)
+        used += tokens
+
+    def flush():
+        nonlocal lines, used
+        if lines:
+            chunks.append(Chunk("\n".join(lines), used, len(chunks), page=chunk_page))
+        lines, used = [], 0
+
+    def at_boundary(line: str) -> bool:
+        return used >= chunk_tokens // 2 and zlib.crc32(line.encode("utf-8")) % CONTENT_BOUNDARY_DIVISOR == 0
+
+    def add_line(line: str, page: Optional[int]):
+        tokens = encoder.encode(line)
+        if len(tokens) >= chunk_tokens:
+            flush()
+            for start in range(0, len(tokens), chunk_tokens):
+                window = tokens[start:start + chunk_tokens]
+                chunks.append(Chunk(encoder.decode(window), len(window), len(chunks), page=page))
+            return
+        if used + len(tokens) + 1 > chunk_tokens:
+            flush()
+        append(line, len(tokens) + 1, page)
+        if at_boundary(line):
+            flush()
+
+    def add_table(rows: List[str], page: Optional[int]):
+        header, body = rows[0], rows[1:]
+        opening = [(TABLE_START, cost(TABLE_START)), (header, cost(header))]
+        closing = cost(TABLE_END)
+        overhead = sum(tokens for _, tokens in opening) + closing
+        costs = [cost(row) for row in body]
+        if not body or overhead + max(costs) > chunk_tokens:
+            # No room to repeat the header: pack the table like plain lines
+            for line in [TABLE_START] + rows + [TABLE_END]:
+                add_line(line, page)
+            return
+
+        if used + overhead + costs[0] > chunk_tokens:
+            flush()
+        is_open = False
+        for row, tokens in zip(body, costs):
+            if is_open and used + tokens + closing > chunk_tokens:
+                append(TABLE_END, closing, page)
+                flush()
+                is_open = False
+            if not is_open:
+                for line, line_tokens in opening:
+                    append(line, line_tokens, page)
+                is_open = True
+            append(row, tokens, page)
+            if at_boundary(row):
+                append(TABLE_END, closing, page)
+                flush()
+                is_open = False
+        if is_open:
+            append(TABLE_END, closing, page)
+
+    for kind, page, block in iter_blocks(text):
+        if kind == BLOCK_TABLE:
+            add_table(block, page)
+            continue
+        if kind == BLOCK_HEADING:
+            flush()
+        for line in block:
+            add_line(line, page)
+    flush()
+    return chunks
+
+
+class DocumentIndex:
+    """
+    BM25 (or embedding) index over the chunks of one document.
+
+    Chunks can be appended while the index is being queried (see extend),
+    e.g. by a background thread indexing the rest of a long document.
+    """
+
+    def __init__(self, chunks: Sequence[Chunk], embed_fn: Optional[EmbedFunction] = None,
+                 source: str = ""):
+        self.embed_fn = embed_fn
+        self.source = source
+        self.chunks: List[Chunk] = []
+        self.total_tokens = 0
+        self._lock = threading.RLock()
+        self._vectors: List[List[float]] = []
+        self._term_freqs: List[Counter] = []
+        self._lengths: List[int] = []
+        self._total_length = 0
+        self._doc_freq: Counter = Counter()
+        self.extend(chunks)
+
+    def extend(self, chunks: Sequence[Chunk]):
+        """
+        Append chunks (renumbered to follow the existing ones)
+
+        Args:
+            chunks: Chunks to add, in document order
+        """
+        chunks = list(chunks)
+        if not chunks:
+            return
+        vectors = None
+        if self.embed_fn is not None:
+            vectors = [self._normalize(v) for v in self.embed_fn([c.text for c in chunks])]
+
+        with self._lock:
+            for offset, chunk in enumerate(chunks):
+                chunk.position = len(self.chunks) + offset
+                if self.source:
+                    chunk.source = self.source
+            self.chunks.extend(chunks)
+            self.total_tokens += sum(c.token_count for c in chunks)
+            if vectors is not None:
+                self._vectors.extend(vectors)
+            else:
+                for chunk in chunks:
+                    tf = Counter(_words(chunk.text))
+                    self._term_freqs.append(tf)
+                    self._lengths.append(sum(tf.values()))
+                    self._total_length += self._lengths[-1]
+                    self._doc_freq.update(tf.keys())
+
+    @classmethod
+    def from_text(cls, text: str, embed_fn: Optional[EmbedFunction] = None,
+                  chunk_tokens: int = 400, overlap_tokens: int = 50,
+                  encoding_name: str = DEFAULT_ENCODING, source: str = "") -> "DocumentIndex":
+        return cls(chunk_text(text, chunk_tokens, overlap_tokens, encoding_name), embed_fn, source)
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> List[float]:
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def corpus_stats(self, terms: Sequence[str]) -> CorpusStats:
+        """
+        BM25 statistics of this index for some query terms
+
+        Args:
+            terms: Lowercased query words
+
+        Returns:
+            (chunk count, total length, document frequency per term)
+        """
+        with self._lock:
+            return (len(self._term_freqs), self._total_length,
+                    {term: self._doc_freq.get(term, 0) for term in terms})
+
+    def score(self, question: str, corpus: Optional[CorpusStats] = None,
+              query_vector: Optional[Sequence[float]] = None) -> List[float]:
+        """
+        Relevance of every chunk to a question
+
+        Args:
+            question: User question
+            corpus: Statistics of a larger collection this index is part of, so that
+                scores are comparable across indexes (defaults to this index alone)
+            query_vector: The question already embedded and normalized
+
+        Returns:
+            One score per chunk (higher is more relevant)
+        """
+        if self.embed_fn is not None:
+            query = query_vector or self._normalize(self.embed_fn([question])[0])
+            with self._lock:
+                return [sum(q * c for q, c in zip(query, vector)) for vector in self._vectors]
+
+        with self._lock:
+            n, total_length, doc_freqs = corpus or self.corpus_stats(set(_words(question)))
+            avg_length = (total_length / n) if n else 0.0
+            idf = {}
+            for term, df in doc_freqs.items():
+                if df:
+                    idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+            scores = []
+            for tf, length in zip(self._term_freqs, self._lengths):
+                score = 0.0
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_length or 1.0))
+                for term, term_idf in idf.items():
+                    freq = tf.get(term)
+                    if freq:
+                        score += term_idf * freq * (BM25_K1 + 1) / (freq + norm)
+                scores.append(score)
+            return scores
+
+    def scored_chunks(self, question: str, corpus: Optional[CorpusStats] = None,
+                      query_vector: Optional[Sequence[float]] = None) -> List[Tuple[Chunk, float]]:
+        """Consistent snapshot of (chunk, score) pairs, see score()"""
+        with self._lock:
+            return list(zip(self.chunks, self.score(question, corpus, query_vector)))
+
+    def select(self, question: str, max_tokens: int = 5000) -> List[Chunk]:
+        """
+        Pick the most relevant chunks that fit in the token budget
+
+        Args:
+            question: User question
+            max_tokens: Token budget for the selected chunks
+
+        Returns:
+            Selected chunks, in document order
+        """
+        with self._lock:
+            if self.total_tokens <= max_tokens:
+                return list(self.chunks)
+            scored = self.scored_chunks(question)
+
+        # Nothing matches: fall back to the beginning of the document
+        if not any(score for _, score in scored):
+            return _pack([chunk for chunk, _ in scored], max_tokens, stop_when_full=True)
+
+        ranked = sorted(scored, key=lambda pair: (-pair[1], pair[0].position))
+        selected = _pack([chunk for chunk, _ in ranked], max_tokens, stop_when_full=False)
+        return sorted(selected, key=lambda c: c.position)
+
+    def build_context(self, question: str, max_tokens: int = 5000) -> str:
+        """
+        Context text for a question: the selected chunks, in document order
+
+        Args:
+            question: User question
+            max_tokens: Token budget
+
+        Returns:
+            Context string to send with the question
+        """
+        return "\n\n".join(chunk.text for chunk in self.select(question, max_tokens))
+
+
+class DocumentLibrary:
+    """
+    The documents of one session, queried together.
+
+    Each document keeps its own DocumentIndex (so a streaming document can
+    keep growing in the background); at query time BM25 statistics are
+    pooled across all of them, so chunk scores are comparable and the token
+    budget goes to the most relevant chunks of whichever documents they
+    come from.
+    """
+
+    def __init__(self):
+        self._indexes: Dict[str, DocumentIndex] = {}
+
+    def add(self, index: DocumentIndex):
+        """Add a document, replacing any document with the same source name"""
+        self._indexes.pop(index.source, None)
+        self._indexes[index.source] = index
+
+    def remove(self, name: str):
+        self._indexes.pop(name, None)
+
+    def clear(self):
+        self._indexes.clear()
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._indexes)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._indexes
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(index.total_tokens for index in self._indexes.values())
+
+    def select(self, question: str, max_tokens: int = 5000) -> List[Chunk]:
+        """
+        Pick the most relevant chunks of all documents that fit in the token budget
+
+        Args:
+            question: User question
+            max_tokens: Token budget for the selected chunks
+
+        Returns:
+            Selected chunks, grouped by document in library order, in document order
+        """
+        indexes = list(self._indexes.values())
+        if not indexes:
+            return []
+        order = {index.source: i for i, index in enumerate(indexes)}
+
+        embed_fn = indexes[0].embed_fn
+        if embed_fn is not None:
+            query_vector, corpus = DocumentIndex._normalize(embed_fn([question])[0]), None
+        else:
+            terms = set(_words(question))
+            query_vector, n, total_length, doc_freqs = None, 0, 0, Counter()
+            for index in indexes:
+                index_n, index_length, index_freqs = index.corpus_stats(terms)
+                n += index_n
+                total_length += index_length
+                doc_freqs.update(index_freqs)
+            corpus = (n, total_length, dict(doc_freqs))
+
+        scored = [pair for index in indexes for pair in index.scored_chunks(question, corpus, query_vector)]
+        document_order = lambda c: (order[c.source], c.position)
+
+        if sum(chunk.token_count for chunk, _ in scored) <= max_tokens:
+            selected = [chunk for chunk, _ in scored]
+        elif not any(score for _, score in scored):
+            # Nothing matches: share the budget between the beginnings of the documents
+            ranked = sorted((chunk for chunk, _ in scored), key=lambda c: (c.position, order[c.source]))
+            selected = _pack(ranked, max_tokens, stop_when_full=True)
+        else:
+            ranked = sorted(scored, key=lambda pair: (-pair[1],) + document_order(pair[0]))
+            selected = _pack([chunk for chunk, _ in ranked], max_tokens, stop_when_full=False)
+        return sorted(selected, key=document_order)
+
+    def build_context(self, question: str, max_tokens: int = 5000) -> str:
+        """
+        Context text for a question, with each document's chunks under a
+        "[Source: <file name>]" heading, and a "[Page N]" line wherever the
+        page changes, so answers can cite the file and page
+
+        Args:
+            question: User question
+            max_tokens: Token budget
+
+        Returns:
+            Context string to send with the question
+        """
+        sections: Dict[str, List[str]] = {}
+        pages: Dict[str, Optional[int]] = {}
+        for chunk in self.select(question, max_tokens):
+            texts = sections.setdefault(chunk.source, [])
+            if chunk.page is not None and chunk.page != pages.get(chunk.source):
+                pages[chunk.source] = chunk.page
+                texts.append(f"{PAGE_MARKER.format(chunk.page)}\n{chunk.text}")
+            else:
+                texts.append(chunk.text)
+        return "\n\n".join(f"[Source: {source}]\n" + "\n\n".join(texts)
+                           for source, texts in sections.items())
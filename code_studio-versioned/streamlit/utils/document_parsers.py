@@ -0,0 +1,472 @@
+#document_parsers.py
+"""
+Pure text extraction functions for uploaded documents.
+
+Everything here works on plain bytes (or memoryviews) and must not import
+streamlit, so the functions can run inside extraction worker processes.
+"""
+import csv
+import io
+import os
+import re
+import zipfile
+from html.parser import HTMLParser
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+# Called with (pages_done, pages_total) while a document is parsed
+ProgressCallback = Callable[[int, int], None]
+
+# Parsers: "basic" uses PyPDF2 / python-docx with page-level progress,
+# "unstructured" uses unstructured.partition for richer layout handling, and
+# "auto" uses the basic parsers for the file types they handle (sniffed from
+# the content, see sniff_type), falling back to unstructured (and its OCR)
+# for other types and for files in which the basic parsers find no text
+ENGINE_BASIC = "basic"
+ENGINE_UNSTRUCTURED = "unstructured"
+ENGINE_AUTO = "auto"
+
+# Joins the pages (or page batches) of a document, per engine
+PAGE_SEPARATORS = {ENGINE_BASIC: "\n", ENGINE_UNSTRUCTURED: "\n\n", ENGINE_AUTO: "\n"}
+
+# File types with a basic parser, as returned by sniff_type
+TYPE_PDF = "pdf"
+TYPE_DOCX = "docx"
+TYPE_TEXT = "txt"
+
+# Bytes read to sniff a file type; PDF headers may follow up to 1 KB of junk
+SNIFF_BYTES = 4096
+_PDF_HEADER_WINDOW = 1024
+_ZIP_MAGIC = b"PK\x03\x04"
+_HTML_TYPES = ('html', 'htm', 'xml')
+
+# Bump whenever parser output changes, to invalidate cached extractions
+EXTRACTOR_VERSION = "3"
+
+# Parsers keep the layout in the extracted text with a few line markers:
+# "[Page N]" starts page N, "## " starts a section heading, and tables are
+# compact rows (see render_table) between "[Table]" and "[/Table]" lines.
+# iter_blocks reads them back, e.g. for chunking.
+PAGE_MARKER = "[Page {}]"
+HEADING_PREFIX = "## "
+TABLE_START = "[Table]"
+TABLE_END = "[/Table]"
+_PAGE_RE = re.compile(r"^\[Page (\d+)\]$")
+
+# unstructured element categories repeated on every page, dropped from the text
+SKIPPED_CATEGORIES = ("Header", "Footer", "PageNumber")
+
+# Block kinds yielded by iter_blocks
+BLOCK_TEXT = "text"
+BLOCK_HEADING = "heading"
+BLOCK_TABLE = "table"
+
+
+def get_file_extension(filename: str) -> str:
+    return filename.lower().split('.')[-1]
+
+
+def _report(progress: Optional[ProgressCallback], done: int, total: int):
+    if progress is not None:
+        progress(done, total)
+
+
+def _looks_like_text(head: bytes) -> bool:
+    if b"\x00" in head:
+        return False
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off by the end of the sample is fine
+        return e.reason == "unexpected end of data" and e.start >= len(head) - 3
+    return True
+
+
+def sniff_type(filename: str, data: bytes) -> Optional[str]:
+    """
+    Detect from its first bytes whether a file has a basic parser
+
+    Args:
+        filename: Original file name (only used to tell HTML from plain text)
+        data: File contents
+
+    Returns:
+        TYPE_PDF, TYPE_DOCX or TYPE_TEXT, or None for any other content
+        (legacy .doc, HTML, spreadsheets, images...)
+    """
+    head = bytes(data[:SNIFF_BYTES])
+    if b"%PDF-" in head[:_PDF_HEADER_WINDOW]:
+        return TYPE_PDF
+    if head.startswith(_ZIP_MAGIC):
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                return TYPE_DOCX if "word/document.xml" in archive.namelist() else None
+        except zipfile.BadZipFile:
+            return None
+    if _looks_like_text(head):
+        start = head.lstrip()[:15].lower()
+        if get_file_extension(filename) in _HTML_TYPES or start.startswith((b"<!doctype html", b"<html")):
+            return None
+        return TYPE_TEXT
+    return None
+
+
+def _cell(value) -> str:
+    return " ".join(str(value).split()) if value is not None else ""
+
+
+def render_table(rows: Sequence[Sequence[object]]) -> str:
+    """
+    Render table rows as a "[Table]" block in the most compact encoding
+
+    CSV is usually the shortest; cells full of commas or quotes make it
+    longer than a pipe-separated markdown table, which is used then. The
+    first row is taken as the header.
+
+    Args:
+        rows: Table rows, as lists of cell values (None for empty cells)
+
+    Returns:
+        Table block, or "" if the table has no text
+    """
+    rows = [[_cell(value) for value in row] for row in rows]
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return ""
+
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    as_csv = buffer.getvalue().rstrip("\n")
+
+    escaped = [[value.replace("|", "\\|") for value in row] for row in rows]
+    as_markdown = "\n".join(
+        ["|".join(escaped[0]), "|".join("-" * len(escaped[0]))] + ["|".join(row) for row in escaped[1:]]
+    )
+    return "\n".join([TABLE_START, min(as_csv, as_markdown, key=len), TABLE_END])
+
+
+class _HTMLTableParser(HTMLParser):
+    """Collects the cell texts of an HTML table, row by row"""
+
+    def __init__(self):
+        super().__init__()
+        self.rows: List[List[str]] = []
+        self._cell: Optional[List[str]] = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self.rows.append([])
+        elif tag in ("td", "th"):
+            self._cell = []
+        elif tag == "br" and self._cell is not None:
+            self._cell.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th") and self._cell is not None:
+            if not self.rows:
+                self.rows.append([])
+            self.rows[-1].append("".join(self._cell))
+            self._cell = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def html_table_rows(html: str) -> List[List[str]]:
+    parser = _HTMLTableParser()
+    parser.feed(html)
+    parser.close()
+    return parser.rows
+
+
+def render_page(page_number: int, text: str) -> str:
+    return f"{PAGE_MARKER.format(page_number)}\n{text}"
+
+
+def iter_blocks(text: str) -> Iterator[Tuple[str, Optional[int], List[str]]]:
+    """
+    Read back the layout markers of extracted text
+
+    Args:
+        text: Text produced by the parsers of this module
+
+    Yields:
+        (kind, page, lines) for each heading, table and run of plain text
+        lines, in order; page is None before the first page marker. Table
+        lines are the rows only, the first being the header.
+    """
+    page: Optional[int] = None
+    lines: List[str] = []
+    in_table = False
+
+    for line in text.splitlines():
+        line = line.strip()
+        match = _PAGE_RE.match(line)
+        if match:
+            if lines:
+                yield (BLOCK_TABLE if in_table else BLOCK_TEXT), page, lines
+                lines = []
+            page = int(match.group(1))
+        elif line == TABLE_START:
+            if lines:
+                yield BLOCK_TEXT, page, lines
+            lines, in_table = [], True
+        elif line == TABLE_END and in_table:
+            if lines:
+                yield BLOCK_TABLE, page, lines
+            lines, in_table = [], False
+        elif in_table:
+            if line:
+                lines.append(line)
+        elif line.startswith(HEADING_PREFIX):
+            if lines:
+                yield BLOCK_TEXT, page, lines
+                lines = []
+            yield BLOCK_HEADING, page, [line]
+        elif line:
+            lines.append(line)
+    if lines:
+        yield (BLOCK_TABLE if in_table else BLOCK_TEXT), page, lines
+
+
+def parse_txt(data: bytes, progress: Optional[ProgressCallback] = None) -> str:
+    # str() decodes bytes and memoryviews alike, without an extra copy
+    text = str(data, 'utf-8', errors='replace')
+    _report(progress, 1, 1)
+    return text
+
+
+def _outside(boxes: Sequence[Tuple[float, float, float, float]]) -> Callable[[dict], bool]:
+    """pdfplumber object filter dropping the objects inside any of the boxes"""
+    def test(obj: dict) -> bool:
+        x0, top, x1, bottom = obj.get("x0", 0), obj.get("top", 0), obj.get("x1", 0), obj.get("bottom", 0)
+        return not any(x0 >= bx0 and x1 <= bx1 and top >= btop and bottom <= bbottom
+                       for bx0, btop, bx1, bbottom in boxes)
+    return test
+
+
+def _iter_pdfplumber_pages(data: bytes) -> Iterator[Tuple[int, int, str]]:
+    """PDF pages with their tables detected by pdfplumber, after the page text"""
+    import pdfplumber
+
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        total = len(pdf.pages)
+        for i, page in enumerate(pdf.pages, start=1):
+            tables = page.find_tables()
+            text_page = page.filter(_outside([table.bbox for table in tables])) if tables else page
+            parts = [text_page.extract_text() or ""] + [render_table(table.extract()) for table in tables]
+            yield i, total, render_page(i, "\n".join(part for part in parts if part))
+
+
+def iter_pdf_pages(data: bytes) -> Iterator[Tuple[int, int, str]]:
+    # pdfplumber (optional) keeps tables as rows; PyPDF2 only has the page text
+    try:
+        import pdfplumber  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        yield from _iter_pdfplumber_pages(data)
+        return
+
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    total = len(reader.pages)
+    for i, page in enumerate(reader.pages, start=1):
+        yield i, total, render_page(i, page.extract_text() or "")
+
+
+def parse_pdf(data: bytes, progress: Optional[ProgressCallback] = None) -> str:
+    pages = []
+    for done, total, text in iter_pdf_pages(data):
+        pages.append(text)
+        _report(progress, done, total)
+    return "\n".join(pages)
+
+
+def parse_docx(data: bytes, progress: Optional[ProgressCallback] = None) -> str:
+    from docx import Document
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    doc = Document(io.BytesIO(data))
+    # Paragraphs and tables in document order, with headings marked
+    parts = []
+    for child in doc.element.body.iterchildren():
+        tag = child.tag.rsplit('}', 1)[-1]
+        if tag == 'p':
+            para = Paragraph(child, doc)
+            style = para.style.name if para.style is not None else ""
+            is_heading = style.startswith(("Heading", "Title")) and para.text.strip()
+            parts.append(HEADING_PREFIX + para.text.strip() if is_heading else para.text)
+        elif tag == 'tbl':
+            table = Table(child, doc)
+            parts.append(render_table([[cell.text for cell in row.cells] for row in table.rows]))
+    _report(progress, 1, 1)
+    return "\n".join(parts)
+
+
+def render_elements(elements, page_offset: int = 0) -> str:
+    """
+    Text of unstructured elements, keeping titles, tables and page numbers
+
+    Args:
+        elements: Elements returned by unstructured.partition
+        page_offset: Pages before the first partitioned page (for page batches)
+
+    Returns:
+        Extracted text with layout markers (see iter_blocks)
+    """
+    parts = []
+    page = None
+    for element in elements:
+        category = getattr(element, "category", "")
+        if category in SKIPPED_CATEGORIES:
+            continue
+        metadata = getattr(element, "metadata", None)
+        page_number = getattr(metadata, "page_number", None)
+        if page_number is not None and page_number + page_offset != page:
+            page = page_number + page_offset
+            parts.append(PAGE_MARKER.format(page))
+
+        if category == "Table":
+            html = getattr(metadata, "text_as_html", None)
+            table = render_table(html_table_rows(html)) if html else ""
+            parts.append(table or str(element))
+        elif category == "Title":
+            parts.append(HEADING_PREFIX + str(element).strip())
+        else:
+            parts.append(str(element))
+    return "\n\n".join(parts)
+
+
+def parse_unstructured(data: bytes, filename: str,
+                       progress: Optional[ProgressCallback] = None, page_offset: int = 0) -> str:
+    from unstructured.partition.auto import partition
+
+    elements = partition(file=io.BytesIO(data), metadata_filename=os.path.basename(filename))
+    _report(progress, 1, 1)
+    return render_elements(elements, page_offset)
+
+
+def iter_unstructured_pdf_pages(data: bytes, filename: str,
+                                batch_pages: int = 10) -> Iterator[Tuple[int, int, str]]:
+    """
+    Partition a PDF with unstructured a batch of pages at a time, so the
+    first pages are available long before the last ones are parsed.
+    """
+    try:
+        from PyPDF2 import PdfReader, PdfWriter
+    except ImportError:
+        yield 1, 1, parse_unstructured(data, filename)
+        return
+
+    reader = PdfReader(io.BytesIO(data))
+    total = len(reader.pages)
+    for start in range(0, total, batch_pages):
+        writer = PdfWriter()
+        for page in reader.pages[start:start + batch_pages]:
+            writer.add_page(page)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        yield (min(start + batch_pages, total), total,
+               parse_unstructured(buffer.getvalue(), filename, page_offset=start))
+
+
+def is_supported(filename: str, engine: str = ENGINE_BASIC) -> bool:
+    return engine != ENGINE_BASIC or get_file_extension(filename) in ('txt', 'pdf', 'docx', 'doc')
+
+
+def _has_text(text: str) -> bool:
+    return any(True for _ in iter_blocks(text))
+
+
+def _iter_basic_pages(file_type: str, data: bytes) -> Iterator[Tuple[int, int, str]]:
+    if file_type == TYPE_PDF:
+        yield from iter_pdf_pages(data)
+    elif file_type == TYPE_DOCX:
+        yield 1, 1, parse_docx(data)
+    else:
+        yield 1, 1, parse_txt(data)
+
+
+def _iter_unstructured_pages(filename: str, data: bytes) -> Iterator[Tuple[int, int, str]]:
+    if get_file_extension(filename) == 'pdf' or sniff_type(filename, data) == TYPE_PDF:
+        yield from iter_unstructured_pdf_pages(data, filename)
+    else:
+        yield 1, 1, parse_unstructured(data, filename)
+
+
+def _unless_empty(pages: Iterator[Tuple[int, int, str]],
+                  fallback: Callable[[], Iterator[Tuple[int, int, str]]]) -> Iterator[Tuple[int, int, str]]:
+    """
+    Pass pages through once one of them has text; if none has (e.g. a
+    scanned PDF without a text layer), yield the fallback's pages instead
+    """
+    held: Optional[List[Tuple[int, int, str]]] = []
+    for page in pages:
+        if held is None:
+            yield page
+            continue
+        held.append(page)
+        if _has_text(page[2]):
+            yield from held
+            held = None
+    if held is not None:
+        yield from fallback()
+
+
+def iter_pages(filename: str, data: bytes, engine: str = ENGINE_BASIC) -> Iterator[Tuple[int, int, str]]:
+    """
+    Extract a document incrementally
+
+    Args:
+        filename: Original file name
+        data: File contents (the parser is picked from the content, see sniff_type)
+        engine: ENGINE_BASIC, ENGINE_UNSTRUCTURED or ENGINE_AUTO
+
+    Yields:
+        (pages_done, pages_total, text) for each page, or batch of pages,
+        as soon as it is parsed; formats without pages yield a single part
+
+    Raises:
+        ValueError: If the basic engine has no parser for the content
+    """
+    if engine == ENGINE_UNSTRUCTURED:
+        yield from _iter_unstructured_pages(filename, data)
+        return
+
+    file_type = sniff_type(filename, data)
+    if file_type is None:
+        if engine != ENGINE_AUTO:
+            raise ValueError(f"{filename} is not a PDF, DOCX or text file")
+        yield from _iter_unstructured_pages(filename, data)
+    elif engine == ENGINE_AUTO and file_type != TYPE_TEXT:
+        yield from _unless_empty(_iter_basic_pages(file_type, data),
+                                 lambda: _iter_unstructured_pages(filename, data))
+    else:
+        yield from _iter_basic_pages(file_type, data)
+
+
+def extract_text(filename: str, data: bytes, engine: str = ENGINE_BASIC,
+                 progress: Optional[ProgressCallback] = None) -> Optional[str]:
+    """
+    Extract the text of a document
+
+    Args:
+        filename: Original file name
+        data: File contents
+        engine: ENGINE_BASIC, ENGINE_UNSTRUCTURED or ENGINE_AUTO
+        progress: Optional callback receiving (pages_done, pages_total)
+
+    Returns:
+        Extracted text, or None if the file type is not supported
+    """
+    if not is_supported(filename, engine):
+        return None
+
+    parts = []
+    for done, total, text in iter_pages(filename, data, engine):
+        parts.append(text)
+        _report(progress, done, total)
+    return PAGE_SEPARATORS[engine].join(parts)
@@ -0,0 +1,103 @@
+#navigation.py
+"""
+Page navigation as a small state machine.
+
+The state is st.session_state.current_page, one of PAGES. Transitions go
+through go_to, preferably as a widget callback (on_click / on_change):
+Streamlit runs callbacks before the script, so the run triggered by the
+click already renders the target page, without a second run from
+st.rerun(). Code that only decides to move while a page is rendering
+uses navigate(), which costs that one extra run.
+
+Admin pages are only shown to sessions opened with the admin token (see
+open_page_from_url).
+"""
+import hmac
+import importlib
+import streamlit as st
+from utils.settings import get_settings
+
+HOME = "home"
+CHAT = "chat"
+UPLOAD_DOCS = "ukb"
+HISTORY = "conversation_history"
+INFORMATION = "information"
+HEALTH = "health"
+
+# (module, render function) per page. A page module (and what it imports,
+# e.g. the extraction workers) is only imported the first time the page is
+# shown, so the first paint does not wait for it
+PAGES = {
+    HOME: ("ui.home_page", "render_home_page"),
+    CHAT: ("ui.chat_page", "render_chat_page"),
+    UPLOAD_DOCS: ("ui.update_knowledge_bank", "render_ukb_page"),
+    HISTORY: ("ui.history_page", "render_history_page"),
+    INFORMATION: ("ui.info_page", "render_info_page"),
+    HEALTH: ("ui.health_page", "render_health_page"),
+}
+
+# Pages showing backend internals (replicas, quotas, caches)
+ADMIN_PAGES = {HEALTH}
+
+def is_admin():
+    """Whether this session was opened with the admin token"""
+    return bool(st.session_state.get("is_admin"))
+
+def current_page():
+    """
+    The page to render (an unknown page, or an admin page outside an
+    admin session, falls back to the home page)
+    """
+    page = st.session_state.get("current_page", HOME)
+    if page not in PAGES or (page in ADMIN_PAGES and not is_admin()):
+        page = st.session_state.current_page = HOME
+    return page
+
+def open_page_from_url():
+    """
+    Apply a ?page= link once, then remove it from the URL so that it does
+    not override later navigation. Admin pages also need
+    &token=<admin_token>, which makes the session an admin session; with
+    no admin_token set they cannot be opened at all.
+    """
+    page = st.query_params.get("page")
+    if page is None:
+        return
+    token = st.query_params.get("token", "")
+    del st.query_params["page"]
+    st.query_params.pop("token", None)
+
+    if page not in PAGES:
+        return
+    if page in ADMIN_PAGES:
+        admin_token = get_settings().admin_token
+        if not admin_token or not hmac.compare_digest(token, admin_token):
+            return
+        st.session_state.is_admin = True
+    go_to(page)
+
+def go_to(page):
+    """
+    Transition to a page; safe to use as a widget callback
+
+    Raises:
+        ValueError: If the page does not exist
+    """
+    if page not in PAGES:
+        raise ValueError(f"Unknown page: {page}")
+    st.session_state.current_page = page
+
+def navigate(page):
+    """
+    Transition to a page from within a run, restarting the run if the page changes
+    """
+    if current_page() != page:
+        go_to(page)
+        st.rerun()
+
+def render_current_page():
+    """
+    Import the current page's module on first use and render the page
+    """
+    module_name, function_name = PAGES[current_page()]
+    getattr(importlib.import_module(module_name), function_name)()
@@ -1,21 +1,84 @@
 import streamlit as st
+import html
 import os
+import threading
+import time
 
-def local_css(file_name: str):
+# Seconds between checks of a cached asset's mtime (see read_asset)
+ASSET_CHECK_INTERVAL = 2.0
+
+# (absolute path, binary) -> (mtime and size, monotonic time of the last check, content)
+_assets = {}
+_assets_lock = threading.Lock()
+
+def read_asset(path, binary=False):
     """
-    Load custom CSS for styling
+    Read a static asset (CSS, SVG, image) once per process.
+
+    The content is shared by all sessions and read again only when the
+    file's mtime or size changes, checked at most every
+    ASSET_CHECK_INTERVAL seconds, so reruns do no file I/O.
+
+    Args:
+        path: Asset path, relative to the app directory
+        binary: Return bytes instead of text
+
+    Returns:
+        File content
+
+    Raises:
+        OSError: If the file cannot be read (e.g. FileNotFoundError)
     """
-    with open(file_name) as f:
-        st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+    key = (os.path.abspath(path), binary)
+    now = time.monotonic()
+    entry = _assets.get(key)
+    if entry is not None and now - entry[1] < ASSET_CHECK_INTERVAL:
+        return entry[2]
+
+    with _assets_lock:
+        entry = _assets.get(key)
+        if entry is not None and now - entry[1] < ASSET_CHECK_INTERVAL:
+            return entry[2]
+        stat = os.stat(key[0])
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if entry is not None and entry[0] == signature:
+            content = entry[2]
+        elif binary:
+            with open(key[0], "rb") as f:
+                content = f.read()
+        else:
+            with open(key[0], "r", encoding="utf-8") as f:
+                content = f.read()
+        _assets[key] = (signature, now, content)
+        return content
+
+def fragment(run_every=None):
+    """
+    st.fragment where available, so interacting with (or polling) the
+    decorated part reruns only that part instead of the whole page
+    """
+    decorator = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+    if decorator is None:
+        return lambda fn: fn
+    return decorator(run_every=run_every)
+
+def local_css(*file_names):
+    """
+    Load custom CSS for styling, as one <style> element.
+
+    Streamlit removes elements a rerun does not emit, so the styles are
+    sent on every run; they come from the asset cache, and the element is
+    unchanged from run to run unless a stylesheet changes.
+    """
+    css = "\n".join(read_asset(file_name) for file_name in file_names)
+    st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
 
 def render_svg(svg_file_path):
     """
-    Renders the given svg string from file.
+    Renders the given svg string from file (cached, see read_asset).
     """
     try:
-        with open(svg_file_path, "r") as f:
-            svg_content = f.read()
-        return svg_content
+        return read_asset(svg_file_path)
     except FileNotFoundError:
         # If SVG file not found, return a placeholder SVG
         return create_placeholder_svg()
@@ -31,15 +94,23 @@ def create_placeholder_svg():
     </svg>
     '''
 
+def message_content_html(content):
+    """
+    Escape message text for insertion into HTML, keeping its line breaks,
+    so user or backend text cannot inject markup
+    """
+    return html.escape(str(content)).replace("\n", "<br>")
+
 def render_message(message, img_content):
     """
     Render a single chat message with appropriate styling based on the role
     """
+    content = message_content_html(message["content"])
     if message["role"] == "user":
         st.markdown(
             f'''
             <div class="message user-message">
-                <div class="message-content">{message["content"]}</div>
+                <div class="message-content">{content}</div>
                 <div class="avatar user-avatar">JD</div>
             </div>
             ''',
@@ -50,7 +121,7 @@ def render_message(message, img_content):
             f'''
             <div class="message bot-message">
                 <div class="avatar bot-avatar">{img_content}</div>
-                <div class="message-content">{message["content"]}</div>
+                <div class="message-content">{content}</div>
             </div>
             ''',
             unsafe_allow_html=True
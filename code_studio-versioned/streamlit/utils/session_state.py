@@ -6,16 +6,16 @@ def init_session_state():
     """
     Initialize all session state variables if they don't exist
     """
+    # Stable per-session ID (used for rate limiting and fair queueing)
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = str(uuid.uuid4())
+
     if 'messages' not in st.session_state:
         st.session_state.messages = []
     
     if 'conversation_history' not in st.session_state:
         st.session_state.conversation_history = []
     
-    if 'health_status' not in st.session_state:
-        st.session_state.health_status = True
-    
-    
     if 'user_info' not in st.session_state:
         st.session_state.user_info = {
             "name": "MLOPS",
@@ -55,9 +55,6 @@ def init_session_state():
     if "doc_query_mode" not in st.session_state:
         st.session_state.doc_query_mode = False
     
-    if "extracted_doc_text" not in st.session_state:
-        st.session_state.extracted_doc_text = None
-    
     # Input-related session state
     if "user_input_text" not in st.session_state:
         st.session_state.user_input_text = ""
@@ -73,9 +70,8 @@ def reset_current_conversation():
     
     # Clear any document-related state
     st.session_state.doc_query_mode = False
-    st.session_state.extracted_doc_text = None
-    if "active_doc_name" in st.session_state:
-        del st.session_state.active_doc_name
+    from utils.text_extractor import clear_active_documents
+    clear_active_documents()
     
     # Clear input state
     st.session_state.user_input_text = ""
@@ -88,8 +84,9 @@ def reset_current_conversation():
 
 def start_new_conversation():
     """Start a new conversation and navigate to chat page"""
+    from utils.navigation import CHAT, go_to
     reset_current_conversation()
-    st.session_state.current_page = "chat"
+    go_to(CHAT)
 
 def ensure_conversation_sync():
     """Ensure conversation is synced to history file"""
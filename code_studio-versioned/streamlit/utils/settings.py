@@ -0,0 +1,312 @@
+#settings.py
+import json
+import os
+import threading
+import time
+import logging
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Settings are read from (in increasing order of precedence): the defaults
+# below, an optional JSON file, and PATOKA_<FIELD_NAME> environment variables.
+ENV_PREFIX = "PATOKA_"
+SETTINGS_FILE_ENV = "PATOKA_SETTINGS_FILE"
+DEFAULT_SETTINGS_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "settings.json"
+)
+
+# Minimum number of seconds between two checks for changed settings
+RELOAD_CHECK_INTERVAL = 2.0
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Typed, immutable application settings.
+
+    A new instance is built whenever the settings source changes, so callers
+    should fetch it with get_settings() at the point of use rather than
+    holding on to it.
+    """
+    # Dataiku connection
+    dss_location: str = "https://cdl-dku-desi-p.commercial-datalake-prod.awscloud.abbvienet.com"
+    dss_api_key: str = ""
+    project_key: str = "GENAIPOC"
+
+    # Backend webapps. "dataiku" transport goes through the Dataiku backend
+    # client; "http" posts directly to backend_host (e.g. local stub servers).
+    backend_host: str = "http://10.242.92.241:10000"
+    backend_transport: str = "dataiku"
+    query_webapp_id: str = "LmdRX0E"
+    docs_webapp_id: str = "gq110S2"
+
+    # Additional replicas of the backends (comma-separated in the environment)
+    query_webapp_replicas: Tuple[str, ...] = ()
+    docs_webapp_replicas: Tuple[str, ...] = ()
+
+    # Replica selection: "least_outstanding" or "ewma"
+    replica_selection: str = "least_outstanding"
+    replica_eject_after_failures: int = 3
+    replica_eject_seconds: float = 30.0
+
+    # Request quotas and fair queueing of backend calls
+    rate_limit_session_per_minute: float = 10.0
+    rate_limit_session_burst: int = 5
+    rate_limit_user_per_minute: float = 30.0
+    rate_limit_user_burst: int = 10
+    # Request header with the authenticated user's ID, set by the proxy in
+    # front of the app (empty: use Streamlit's signed-in user, if any)
+    user_id_header: str = ""
+    max_concurrent_backend_calls: int = 8
+    max_queued_per_session: int = 2
+    backend_queue_timeout: float = 60.0
+
+    # Timeouts and intervals (seconds)
+    request_timeout: float = 120.0
+    health_check_interval: float = 5.0
+    health_check_max_interval: float = 60.0
+    health_check_backoff: float = 2.0
+    health_check_timeout: float = 3.0
+
+    # Health state thresholds over a rolling window
+    health_window_seconds: float = 300.0
+    health_degraded_latency: float = 15.0
+    health_degraded_error_rate: float = 0.1
+    health_down_error_rate: float = 0.5
+    health_down_after_failures: int = 3
+
+    # Skip synthetic probes of replicas that served real traffic this recently
+    health_passive_window: float = 30.0
+
+    # Document text extraction in worker processes
+    extraction_workers: int = 2
+    extraction_max_jobs: int = 4
+    extraction_timeout: float = 120.0
+
+    # Disk cache of extraction results shared by all sessions
+    # (empty directory means data/extraction_cache)
+    extraction_cache_dir: str = ""
+    extraction_cache_max_bytes: int = 512 * 1024 * 1024
+
+    # Upload rules, enforced by services/upload_service.validate_uploads.
+    # The max_files / max_file_mb limits apply to the "uploads" and "chunks"
+    # protocols below; the legacy protocol builds each batch as one JSON
+    # body in memory, so it has its own, lower limits
+    upload_max_files: int = 50
+    upload_max_file_mb: float = 100.0
+    upload_legacy_max_files: int = 5
+    upload_legacy_max_file_mb: float = 10.0
+    upload_allowed_types: Tuple[str, ...] = ("txt", "pdf", "docx", "doc")
+    # Chunked uploads to the docs backend; text is spooled to disk past spool size
+    upload_chunk_bytes: int = 1024 * 1024
+    upload_spool_bytes: int = 8 * 1024 * 1024
+    # Cap on the extracted text of a batch sent in one update_kb POST
+    # (legacy protocol, also when a backend turns out to lack the others)
+    upload_legacy_max_mb: float = 20.0
+    # Upload protocol of the docs backend: "legacy" (the whole texts in one
+    # update_kb POST; what the current backend implements), "uploads"
+    # (resumable chunked uploads) or "chunks" (content-addressed chunks with
+    # the /kb and /ingestion endpoints). Missing endpoints fall back to legacy.
+    docs_backend_protocol: str = "legacy"
+    # Files larger than this go to extraction workers through a temp file
+    extraction_inline_max_bytes: int = 8 * 1024 * 1024
+
+    # Background knowledge bank ingestion jobs (services/ingestion_service.py);
+    # job records and staged files live in ingestion_dir (empty means data/ingestion_jobs)
+    ingestion_workers: int = 1
+    ingestion_poll_interval: float = 2.0
+    ingestion_timeout: float = 1800.0
+    ingestion_max_records: int = 50
+    ingestion_dir: str = ""
+
+    # Document query mode: chunking at upload and context budget per question
+    # (chunks follow sections and tables, see document_index.chunk_by_content)
+    doc_chunk_tokens: int = 400
+    doc_context_tokens: int = 5000
+    # A streamed document becomes queryable once this much text is extracted
+    doc_early_tokens: int = 2000
+
+    # Opens the admin health page: ?page=health&token=<admin_token>
+    # (empty disables the page)
+    admin_token: str = ""
+
+    # Chat page: messages rendered at first, and added by each "load earlier"
+    chat_window_messages: int = 30
+
+    def webapp_backend_url(self, webapp_id: str) -> str:
+        """
+        Get the direct backend URL for a webapp.
+
+        Args:
+            webapp_id: Dataiku webapp ID, or a full http(s) URL (e.g. a local stub)
+
+        Returns:
+            Base URL of the webapp backend, without trailing slash
+        """
+        if webapp_id.startswith(("http://", "https://")):
+            return webapp_id.rstrip("/")
+        return f"{self.backend_host.rstrip('/')}/web-apps-backends/{self.project_key}/{webapp_id}"
+
+    @property
+    def query_replicas(self) -> Tuple[str, ...]:
+        return tuple(dict.fromkeys((self.query_webapp_id,) + self.query_webapp_replicas))
+
+    @property
+    def docs_replicas(self) -> Tuple[str, ...]:
+        return tuple(dict.fromkeys((self.docs_webapp_id,) + self.docs_webapp_replicas))
+
+    @property
+    def api_endpoint(self) -> str:
+        return f"{self.webapp_backend_url(self.query_webapp_id)}/query"
+
+    @property
+    def document_query_endpoint(self) -> str:
+        return f"{self.webapp_backend_url(self.query_webapp_id)}/query_on_doc"
+
+    @property
+    def health_endpoint(self) -> str:
+        return f"{self.webapp_backend_url(self.query_webapp_id)}/health"
+
+    @property
+    def update_kb_endpoint(self) -> str:
+        return f"{self.webapp_backend_url(self.docs_webapp_id)}/update_kb"
+
+
+def _coerce(value: Any, default: Any) -> Any:
+    """Convert a raw file/env value to the type of the field's default"""
+    if isinstance(default, bool):
+        if isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes", "on")
+        return bool(value)
+    if isinstance(default, float):
+        return float(value)
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, tuple):
+        if isinstance(value, str):
+            return tuple(item.strip() for item in value.split(",") if item.strip())
+        return tuple(value)
+    return str(value)
+
+
+def _settings_file_path() -> str:
+    return os.environ.get(SETTINGS_FILE_ENV, DEFAULT_SETTINGS_FILE)
+
+
+def _read_settings_file(path: str) -> Dict[str, Any]:
+    """Read overrides from the JSON settings file, if it exists"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError("settings file must contain a JSON object")
+        return data
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading settings file {path}: {str(e)}")
+        return {}
+
+
+def _read_env() -> Dict[str, str]:
+    """Read overrides from PATOKA_* environment variables"""
+    overrides = {}
+    for f in fields(Settings):
+        env_name = ENV_PREFIX + f.name.upper()
+        if env_name in os.environ:
+            overrides[f.name] = os.environ[env_name]
+    return overrides
+
+
+def load_settings(path: Optional[str] = None) -> Settings:
+    """
+    Build a Settings object from defaults, the settings file and the environment
+
+    Args:
+        path: Optional settings file path (defaults to PATOKA_SETTINGS_FILE or settings.json)
+
+    Returns:
+        Settings instance
+    """
+    values = {}
+    overrides = dict(_read_settings_file(path or _settings_file_path()))
+    overrides.update(_read_env())
+
+    for f in fields(Settings):
+        if f.name in overrides:
+            try:
+                values[f.name] = _coerce(overrides[f.name], f.default)
+            except (TypeError, ValueError) as e:
+                logger.error(f"Invalid value for setting '{f.name}': {str(e)}")
+
+    unknown = set(overrides) - {f.name for f in fields(Settings)}
+    if unknown:
+        logger.warning(f"Ignoring unknown settings: {', '.join(sorted(unknown))}")
+
+    return Settings(**values)
+
+
+_lock = threading.Lock()
+_cached_settings: Optional[Settings] = None
+_cached_source: Optional[Tuple] = None
+_last_check = 0.0
+
+
+def _source_signature() -> Tuple:
+    """Cheap fingerprint of the settings sources used to detect changes"""
+    path = _settings_file_path()
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        mtime = None
+    return (path, mtime, tuple(sorted(_read_env().items())))
+
+
+def get_settings() -> Settings:
+    """
+    Get the current settings.
+
+    The settings are loaded once and cached. At most every
+    RELOAD_CHECK_INTERVAL seconds the settings file's mtime and the
+    environment are checked, and the settings are reloaded if they changed,
+    so edits take effect without restarting the app.
+
+    Returns:
+        Current Settings instance
+    """
+    global _cached_settings, _cached_source, _last_check
+
+    now = time.monotonic()
+    if _cached_settings is not None and now - _last_check < RELOAD_CHECK_INTERVAL:
+        return _cached_settings
+
+    with _lock:
+        if _cached_settings is not None and now - _last_check < RELOAD_CHECK_INTERVAL:
+            return _cached_settings
+
+        source = _source_signature()
+        if _cached_settings is None or source != _cached_source:
+            if _cached_settings is not None:
+                logger.info("Settings changed, reloading")
+            _cached_settings = load_settings(source[0])
+            _cached_source = source
+        _last_check = now
+
+        return _cached_settings
+
+
+def reload_settings() -> Settings:
+    """
+    Force the settings to be reloaded on the next access and return them
+
+    Returns:
+        Freshly loaded Settings instance
+    """
+    global _cached_settings
+    with _lock:
+        _cached_settings = None
+    return get_settings()
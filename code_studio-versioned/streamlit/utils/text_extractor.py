@@ -1,23 +1,24 @@
 #text_extractor.py
 import streamlit as st
 import requests
-import tempfile
-import os
-import tiktoken
-from unstructured.partition.auto import partition
-from utils.constants import DOCUMENT_QUERY_API_ENDPOINT, API_ENDPOINT
-
-def extract_text_from_file(file):
-    """Extract text from uploaded file using unstructured package."""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.name)[1]) as tmp_file:
-        tmp_file.write(file.getvalue())
-        tmp_file_path = tmp_file.name
-    try:
-        elements = partition(tmp_file_path)
-        text = "\n\n".join([str(e) for e in elements])
-    finally:
-        os.unlink(tmp_file_path)
-    return text
+from utils.settings import get_settings
+from utils.tokens import DEFAULT_ENCODING, fit_to_token_budget
+from utils.document_index import Chunk, DocumentIndex, DocumentLibrary, chunk_by_content, get_embedder
+from utils.document_parsers import ENGINE_AUTO, PAGE_SEPARATORS
+from services.response_model import BackendResponse, LazyContext, parse_backend_response
+from services.extraction_cache import file_digest, get_extraction_cache
+from services.document_stream import StreamingDocument
+# services.extraction_service (multiprocessing, worker pool) is imported by
+# the functions that extract, so that pages which only chat do not load it
+
+def extract_text_from_file(file, on_progress=None):
+    """Extract text from uploaded file in a worker process, with unstructured only as a fallback."""
+    from services.extraction_service import extract_documents
+
+    result = extract_documents([(file.name, file.getbuffer())], ENGINE_AUTO, on_progress)[0]
+    if not result.success:
+        raise Exception(f"Could not extract text from {file.name}: {result.error}")
+    return result.text
 
 # def extract_text_from_file(file):
 #     ext = get_file_extension(file.name)
@@ -35,38 +36,119 @@ def extract_text_from_file(file):
 #     else:
 #         return None
 
-def truncate_text_to_token_limit(text, max_tokens=5000, encoding_name="cl100k_base"):
+def truncate_text_to_token_limit(text, max_tokens=5000, encoding_name=DEFAULT_ENCODING):
     """Truncate text to stay within token limit."""
-    tokenizer = tiktoken.get_encoding(encoding_name)
-    tokens = tokenizer.encode(text)
-    if len(tokens) <= max_tokens:
-        return text
-    truncated = tokenizer.decode(tokens[:max_tokens])
-    return truncated
-
-def process_document(file):
+    return fit_to_token_budget(text, max_tokens, encoding_name).text
+
+def build_document_index(full_text, source="", encoding_name=DEFAULT_ENCODING):
+    """Chunk extracted text, along its sections and tables, for relevance-based context selection."""
+    settings = get_settings()
+    chunks = chunk_by_content(full_text, settings.doc_chunk_tokens, encoding_name)
+    return DocumentIndex(chunks, get_embedder(), source)
+
+def get_document_library():
+    """The session's active documents, queried together in document mode."""
+    if st.session_state.get("document_library") is None:
+        st.session_state.document_library = DocumentLibrary()
+    return st.session_state.document_library
+
+def add_active_document(index, stream=None):
+    """Make a document indexed under index.source queryable in this session."""
+    get_document_library().add(index)
+    if "document_streams" not in st.session_state:
+        st.session_state.document_streams = {}
+    st.session_state.document_streams[index.source] = stream
+
+def remove_active_document(name):
+    """Stop querying a document; returns True if no active documents are left."""
+    library = get_document_library()
+    library.remove(name)
+    st.session_state.get("document_streams", {}).pop(name, None)
+    st.session_state.get("document_cache", {}).pop(name, None)
+    return len(library) == 0
+
+def clear_active_documents():
+    get_document_library().clear()
+    st.session_state.document_streams = {}
+    st.session_state.document_cache = {}
+
+def process_document(file, on_progress=None, max_tokens=5000, encoding_name=DEFAULT_ENCODING):
     """Process an uploaded document for text extraction and querying."""
-    full_text = extract_text_from_file(file)
-    truncated_text = truncate_text_to_token_limit(full_text)
-    tokenizer = tiktoken.get_encoding("cl100k_base")
-    
+    from services.extraction_service import extraction_cache_key
+
+    settings = get_settings()
+    # Token counts, truncation and chunks are cached with the extracted text,
+    # keyed by content hash, so a file any session already processed is
+    # served from disk
+    cache = get_extraction_cache()
+    key = (f"{extraction_cache_key(file_digest(file.getbuffer()), ENGINE_AUTO)}-{encoding_name}-{max_tokens}"
+           f"-c{settings.doc_chunk_tokens}")
+    document = cache.get(key)
+    stream = None
+    if document is None:
+        stream, document = _stream_document(file, key, on_progress, max_tokens, encoding_name)
+        index = stream.index
+    else:
+        if on_progress is not None:
+            on_progress(file.name, 1, 1)
+        chunks = [Chunk(text, token_count, i, page=page)
+                  for i, (text, token_count, page) in enumerate(document.pop("chunks"))]
+        index = DocumentIndex(chunks, get_embedder(), source=file.name)
+
     # Store the processed information in session state for later use
     if "document_cache" not in st.session_state:
         st.session_state.document_cache = {}
-    
+
     # Cache the document data with the filename as key
-    st.session_state.document_cache[file.name] = {
-        "text": truncated_text,
-        "original_token_count": len(tokenizer.encode(full_text)),
-        "truncated_token_count": len(tokenizer.encode(truncated_text))
-    }
-    
-    return {
-        "filename": file.name,
-        "original_token_count": len(tokenizer.encode(full_text)),
-        "truncated_token_count": len(tokenizer.encode(truncated_text)),
-        "text": truncated_text
-    }
+    entry = dict(document, index=index)
+    if stream is not None:
+        # Only the first pages so far; completed by _document_cache()
+        entry["stream"] = (stream, max_tokens, encoding_name)
+    st.session_state.document_cache[file.name] = entry
+    add_active_document(index, stream)
+
+    return {"filename": file.name, **document}
+
+def _stream_document(file, cache_key, on_progress, max_tokens, encoding_name):
+    """
+    Extract a new document page by page. Returns as soon as doc_early_tokens
+    of text are indexed; the remaining pages are indexed in the background
+    and the finished document is written to the extraction cache.
+    """
+    from services.extraction_service import stream_document
+
+    settings = get_settings()
+    stream = StreamingDocument(file.name, settings.doc_chunk_tokens, encoding_name,
+                               PAGE_SEPARATORS[ENGINE_AUTO])
+
+    def on_complete(doc):
+        # Background thread: only the shared disk cache is written here
+        document = fit_to_token_budget(doc.text, max_tokens, encoding_name).to_dict()
+        document["chunks"] = [chunk.to_list() for chunk in doc.index.chunks]
+        get_extraction_cache().put(cache_key, document)
+
+    stream.start(
+        stream_document(file.name, file.getbuffer(), ENGINE_AUTO),
+        settings.doc_early_tokens,
+        on_progress=(lambda done, total: on_progress(file.name, done, total)) if on_progress else None,
+        on_complete=on_complete,
+    )
+    return stream, fit_to_token_budget(stream.text, max_tokens, encoding_name).to_dict()
+
+def _document_cache():
+    """
+    The session's processed documents, with the text of streamed ones
+    replaced by the full document once their last page is extracted
+    (the stream's own thread cannot write to the session state)
+    """
+    cache = st.session_state.get("document_cache") or {}
+    for entry in cache.values():
+        pending = entry.get("stream")
+        if pending is not None and pending[0].done:
+            stream, max_tokens, encoding_name = entry.pop("stream")
+            if stream.error is None:
+                entry.update(fit_to_token_budget(stream.text, max_tokens, encoding_name).to_dict())
+    return cache
 
 def query_document(query, document_text):
     """
@@ -77,7 +159,7 @@ def query_document(query, document_text):
         document_text (str): Extracted text from the document
         
     Returns:
-        dict: Response containing the answer
+        BackendResponse: Response whose 'message' holds the answer
     """
     try:
         payload = {
@@ -85,18 +167,11 @@ def query_document(query, document_text):
             "extracted_text": document_text,
             "token_threshold": 5000
         }
-        response = requests.post(
-            DOCUMENT_QUERY_API_ENDPOINT,
-            json=payload,
-            headers={"Content-Type": "application/json"}
-        )
+        from services.api_service import post_to_backend
+        response = post_to_backend("query", "/query_on_doc", payload, get_settings().request_timeout)
         if response.status_code != 200:
             raise Exception(f"API returned {response.status_code}: {response.text}")
-        try:
-            result = response.json()
-            return {"answer": str(result.get("message", result))}
-        except ValueError:
-            return {"answer": response.text}
+        return parse_backend_response(response.content, response.status_code)
     except requests.exceptions.RequestException as e:
         raise Exception(f"Request failed: {str(e)}")
 
@@ -105,20 +180,22 @@ def get_stored_document_text(document_name=None):
     Get the stored document text from session state.
     
     Args:
-        document_name (str, optional): Name of document to retrieve. If None, returns the first document.
+        document_name (str, optional): Name of document to retrieve. If None, returns the
+            text of every cached document, each under a "[Source: <name>]" heading.
         
     Returns:
         str or None: Document text if available, otherwise None
     """
-    if "document_cache" not in st.session_state or not st.session_state.document_cache:
+    document_cache = _document_cache()
+    if not document_cache:
         return None
         
-    if document_name and document_name in st.session_state.document_cache:
-        return st.session_state.document_cache[document_name]["text"]
+    if document_name:
+        document = document_cache.get(document_name)
+        return document["text"] if document else None
     
-    # If no specific document requested, return the first one
-    first_doc = next(iter(st.session_state.document_cache.values()))
-    return first_doc["text"]
+    return "\n\n".join(f"[Source: {name}]\n{document['text']}"
+                       for name, document in document_cache.items())
 
 def handle_query(query, use_document_mode=False):
     """
@@ -129,28 +206,38 @@ def handle_query(query, use_document_mode=False):
         use_document_mode (bool): Whether to query against stored document
         
     Returns:
-        dict: Response containing results
+        BackendResponse: Normalized response
     """
     if use_document_mode:
-        # Check if we have a document to query against
-        document_text = get_stored_document_text()
+        # Send the chunks most relevant to the question from all active
+        # documents, within the token budget, each cited by file name
+        library = get_document_library()
+        if library.total_tokens:
+            document_text = library.build_context(query, get_settings().doc_context_tokens)
+        else:
+            document_text = get_stored_document_text()
         if not document_text:
-            return {"success": False, "message": "No document available. Please upload a document first."}
+            failed = [f"{name}: {stream.error}" for name, stream in st.session_state.get("document_streams", {}).items()
+                      if stream is not None and stream.error]
+            if failed:
+                return BackendResponse.error(f"Error processing document: {'; '.join(failed)}")
+            return BackendResponse.error("No document available. Please upload a document first.")
             
-        # Query against the document
+        # Query against the documents
         try:
             result = query_document(query, document_text)
-            return {
-                "success": True,
-                "message": result.get("answer", "No answer found"),
-                "context": "Query processed against uploaded document."
-            }
+            if not result.message:
+                result.message = "No answer found"
+            if not result.context:
+                # Show the cited passages the answer was based on
+                result.context = LazyContext.from_value(document_text)
+            return result
         except Exception as e:
-            return {"success": False, "message": f"Error processing document query: {str(e)}"}
+            return BackendResponse.error(f"Error processing document query: {str(e)}")
     else:
         # Use the regular API endpoint
         try:
             from services.api_service import generate_chat_response
             return generate_chat_response(query)
         except Exception as e:
-            return {"success": False, "message": f"Error: {str(e)}"}
\ No newline at end of file
+            return BackendResponse.error(f"Error: {str(e)}")
\ No newline at end of file
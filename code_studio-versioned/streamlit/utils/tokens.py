@@ -0,0 +1,81 @@
+#tokens.py
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Sequence
+
+DEFAULT_ENCODING = "cl100k_base"
+
+
+@lru_cache(maxsize=None)
+def get_encoder(encoding_name: str = DEFAULT_ENCODING):
+    """
+    Get a tiktoken encoder, created once per process and encoding
+
+    Args:
+        encoding_name: tiktoken encoding name
+
+    Returns:
+        tiktoken.Encoding
+    """
+    import tiktoken
+    return tiktoken.get_encoding(encoding_name)
+
+
+@dataclass(frozen=True)
+class TokenBudget:
+    """Text cut to a token budget, with the counts before and after"""
+    text: str
+    original_token_count: int
+    truncated_token_count: int
+
+    @property
+    def truncated(self) -> bool:
+        return self.truncated_token_count < self.original_token_count
+
+    def to_dict(self):
+        return {
+            "text": self.text,
+            "original_token_count": self.original_token_count,
+            "truncated_token_count": self.truncated_token_count,
+        }
+
+
+def count_tokens(text: str, encoding_name: str = DEFAULT_ENCODING) -> int:
+    """
+    Count the tokens of a text
+
+    Args:
+        text: Text to count
+        encoding_name: tiktoken encoding name
+
+    Returns:
+        Number of tokens
+    """
+    return len(get_encoder(encoding_name).encode(text))
+
+
+def fit_to_token_budget(text: str, max_tokens: int = 5000,
+                        encoding_name: str = DEFAULT_ENCODING,
+                        tokens: Optional[Sequence[int]] = None) -> TokenBudget:
+    """
+    Truncate text to a token budget, encoding it only once.
+
+    The token array is sliced for truncation and only the kept slice is
+    decoded; the truncated count is the slice length, so the result is
+    never re-encoded.
+
+    Args:
+        text: Text to fit
+        max_tokens: Maximum number of tokens to keep
+        encoding_name: tiktoken encoding name
+        tokens: The text already encoded with encoding_name, to avoid encoding it again
+
+    Returns:
+        TokenBudget with the (possibly) truncated text and both token counts
+    """
+    encoder = get_encoder(encoding_name)
+    if tokens is None:
+        tokens = encoder.encode(text)
+    if len(tokens) <= max_tokens:
+        return TokenBudget(text, len(tokens), len(tokens))
+    return TokenBudget(encoder.decode(tokens[:max_tokens]), len(tokens), max_tokens)